@@ -0,0 +1,35 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.util.config import model_load_mode
+from app.util.text_context import FAILED, READY, get_model_state
+
+router = APIRouter(tags=["health"])
+
+
+@router.get("/healthz", summary="Liveness of this worker.")
+async def healthz():
+    """
+    Fails only when the model could not be loaded, so that the worker gets restarted.
+    """
+    state = get_model_state()
+    return JSONResponse(
+        content={"status": state}, status_code=503 if state == FAILED else 200
+    )
+
+
+@router.get("/readyz", summary="Whether this worker should receive traffic.")
+async def readyz():
+    """
+    In eager mode a worker is ready once its model is loaded and warmed up. In lazy mode
+    it is ready right away and loads the model on the first request.
+    """
+    state = get_model_state()
+    if model_load_mode == "eager":
+        ready = state == READY
+    else:
+        ready = state != FAILED
+    return JSONResponse(
+        content={"status": state, "mode": model_load_mode},
+        status_code=200 if ready else 503,
+    )
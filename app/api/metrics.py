@@ -0,0 +1,18 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Response
+
+from app.util.auth import http_basic_auth
+from app.util.metrics import render_metrics
+
+router = APIRouter()
+
+
+@router.get(
+    "/metrics",
+    summary="Prometheus metrics of all workers.",
+    tags=["metrics"],
+)
+async def get_metrics(username: Annotated[str, Depends(http_basic_auth)]):
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
@@ -1,28 +1,194 @@
-from typing import Annotated
+import asyncio
+import time
+from typing import Annotated, AsyncIterator, Dict, List, Optional, Tuple, Union
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
-from fastapi.responses import JSONResponse
+import orjson
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+)
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTasks
 
-from app.schema.api.v1.response_model import ExtractResponse, error_response
+from app.schema.api.v1.response_model import (
+    AggregatedEntity,
+    BatchExtractResult,
+    ExtractResponse,
+    JobResponse,
+    JobSubmitResponse,
+    OutputFormat,
+    error_response,
+    job_error_response,
+)
+from app.util.admission import (
+    AdmissionRejectedError,
+    AdmissionTicket,
+    admission_controller,
+)
 from app.util.auth import http_basic_auth
-from app.util.log import logger
-from app.util.middleware import get_request_id
-from app.util.pdf import parse_pdf
-from app.util.text_context import extract_entities
+from app.util.cache import extraction_cache, page_cache
+from app.util.config import (
+    available_models,
+    jobs_enabled,
+    max_batch_files,
+    max_pdf_pages,
+    max_upload_bytes,
+    upload_dir,
+)
+from app.util.executor import (
+    ClientDisconnectedError,
+    StageTimeoutError,
+    get_inference_executor,
+    get_parse_executor,
+    iterate_in_executor,
+    run_inference_stage,
+    run_parse_stage,
+)
+from app.util.jobs import QUEUED, job_store
+from app.util.log import get_request_id, logger
+from app.util.metrics import STAGE_SECONDS, observe_stage
+from app.util.pdf import count_pages, iter_pages
+from app.util.text_context import (
+    batch_scheduler_stats,
+    extract_entities,
+    extract_entities_batch,
+    extraction_config_key,
+    iter_page_entities,
+    model_registry,
+    parse_document,
+)
+from app.util.upload import SpooledUpload, UploadTooLargeError, spool_upload
 
 router = APIRouter(prefix="/v1")
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+OUTPUT_HELP = (
+    "`aggregated` returns every entity once, with the offsets of all its occurrences "
+    "and the contexts of the first ones."
+)
+MODEL_HELP = "Model to extract the entities with, the default model when not given."
+
+
+def check_model(model: Optional[str]):
+    if model is not None and model not in available_models:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown model, must be one of: {', '.join(available_models)}",
+        )
+
+
+def check_upload_size(content: UploadFile):
+    if content.size is not None and content.size > max_upload_bytes:
+        raise HTTPException(status_code=413, detail="File too large.")
+
+
+async def read_upload(
+    content: UploadFile, directory: Optional[str] = None
+) -> SpooledUpload:
+    """
+    Spools the upload to a temporary file and hashes it on the way, so the document is
+    never held in memory as a whole. The caller closes the upload to remove the file.
+    """
+    with observe_stage("upload_read"):
+        return await asyncio.to_thread(
+            spool_upload, content.file, max_upload_bytes, directory or upload_dir
+        )
+
+
+async def check_page_count(path: str) -> int:
+    """
+    Returns the page count of the PDF, rejecting documents with too many pages before
+    any text is extracted.
+    """
+    try:
+        pages = await asyncio.to_thread(count_pages, path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    if pages > max_pdf_pages:
+        raise HTTPException(
+            status_code=413, detail=f"PDF has more than {max_pdf_pages} pages."
+        )
+    return pages
+
+
+async def admit(request: Request, pages: int, documents: int = 1) -> AdmissionTicket:
+    """
+    Waits until the worker has room for the documents and their pages. The wait is reported in the
+    X-Queue-Wait-Time-In-Seconds header, a rejection becomes 429 or 503 with Retry-After.
+    """
+    start_time = time.perf_counter()
+    try:
+        return await admission_controller.acquire(pages, documents)
+    except AdmissionRejectedError as e:
+        logger.warning(
+            "Admission rejected",
+            extra={"request_id": get_request_id(), "status_code": e.status_code},
+        )
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)},
+        ) from e
+    finally:
+        queue_wait_seconds = time.perf_counter() - start_time
+        request.state.queue_wait_seconds = queue_wait_seconds
+        STAGE_SECONDS.labels("queue_wait").observe(queue_wait_seconds)
+
+
+async def stream_entities(
+    upload: SpooledUpload, ticket: AdmissionTicket, model: Optional[str] = None
+) -> AsyncIterator[bytes]:
+    """
+    Yields one JSON line per entity as soon as its page has been processed. Once the
+    response has started its status can no longer change, so a failure is reported as
+    a final line with an error instead.
+    """
+    pages = iter_page_entities(iter_pages(upload.path, get_parse_executor()), model)
+    try:
+        async for entities in iterate_in_executor(get_inference_executor(), pages):
+            for entity in entities:
+                yield orjson.dumps(entity) + b"\n"
+    except ValueError as e:
+        yield orjson.dumps({"error": str(e)}) + b"\n"
+    except Exception:
+        logger.exception("Unexpected error during processing.")
+        yield orjson.dumps({"error": "Server error"}) + b"\n"
+    finally:
+        ticket.release()
+        upload.close()
+
 
 @router.post(
     "/extract",
     summary="Extract medical entities from a PDF document.",
-    response_model=ExtractResponse,
-    responses=error_response,
+    response_model=Union[List[ExtractResponse], List[AggregatedEntity]],
+    response_class=ORJSONResponse,
+    responses={
+        **error_response,
+        200: {
+            "content": {
+                NDJSON_MEDIA_TYPE: {"schema": ExtractResponse.model_json_schema()}
+            },
+            "description": "Entities, or one entity per line when streaming.",
+        },
+    },
 )
 async def extract_from_pdf(
+    request: Request,
     username: Annotated[str, Depends(http_basic_auth)],
     content: UploadFile = File(description="PDF file to be processed"),
+    output: OutputFormat = Query(OutputFormat.ENTITIES, description=OUTPUT_HELP),
+    model: Optional[str] = Query(None, description=MODEL_HELP),
 ):
+    """
+    Send `Accept: application/x-ndjson` to receive one entity per line, with its page
+    number, as soon as each page has been processed.
+    """
     logger.info(
         "API accessed", extra={"request_id": get_request_id(), "username": username}
     )
@@ -46,6 +212,9 @@ async def extract_from_pdf(
         raise HTTPException(
             status_code=400, detail="Bad request, file not included or empty filename."
         )
+    check_upload_size(content)
+    check_model(model)
+    upload = None
     try:
         logger.info(
             "Processing file",
@@ -55,22 +224,340 @@ async def extract_from_pdf(
                 "content": content.filename,
             },
         )
-        file_bytes = await content.read()
-        if not file_bytes:
+        upload = await read_upload(content)
+        if not upload.size:
             logger.error(
                 "No content found",
                 extra={"request_id": get_request_id(), username: username},
             )
             raise HTTPException(status_code=400, detail="Uploaded file is empty.")
-        text = parse_pdf(file_bytes)
-        if not text.strip():
-            raise HTTPException(
-                status_code=400, detail="No extractable text found in the PDF."
+        aggregate = output == OutputFormat.AGGREGATED
+        if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+            if aggregate:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Aggregated output cannot be streamed.",
+                )
+            # Streamed results carry page numbers and are not cached.
+            ticket = await admit(request, await check_page_count(upload.path))
+            # Releases the admission and the upload even if the stream never started.
+            background = BackgroundTasks()
+            background.add_task(ticket.release)
+            background.add_task(upload.close)
+            response = StreamingResponse(
+                stream_entities(upload, ticket, model),
+                media_type=NDJSON_MEDIA_TYPE,
+                background=background,
+            )
+            upload = None
+            return response
+        # Identical uploads skip both parsing and the model.
+        cache_key = extraction_cache.key(
+            upload.digest,
+            extraction_config_key(model, aggregate),
+        )
+        entities = extraction_cache.get(cache_key)
+        if entities is not None:
+            logger.info(
+                "Cache hit",
+                extra={"request_id": get_request_id(), "username": username},
+            )
+            with observe_stage("serialize"):
+                response = ORJSONResponse(content=entities, status_code=200)
+            return response
+        ticket = await admit(request, await check_page_count(upload.path))
+        try:
+            text, page_starts, fingerprints = await run_parse_stage(
+                request, parse_document, upload.path
+            )
+            if not text.strip():
+                raise HTTPException(
+                    status_code=400, detail="No extractable text found in the PDF."
+                )
+            entities = await run_inference_stage(
+                request,
+                extract_entities,
+                text,
+                page_starts,
+                aggregate,
+                model,
+                fingerprints,
+            )
+        finally:
+            ticket.release()
+        extraction_cache.put(cache_key, entities)
+        with observe_stage("serialize"):
+            response = ORJSONResponse(content=entities, status_code=200)
+        return response
+    except HTTPException as he:
+        raise he
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e)) from e
+    except StageTimeoutError as e:
+        raise HTTPException(status_code=504, detail="Processing timed out.") from e
+    except ClientDisconnectedError as e:
+        raise HTTPException(status_code=499, detail="Client disconnected.") from e
+    except Exception as e:
+        logger.exception("Unexpected error during processing.")
+        raise HTTPException(status_code=500, detail="Server error") from e
+    finally:
+        # A streamed upload is removed when the stream is done.
+        if upload is not None:
+            upload.close()
+
+
+async def extract_pending(
+    request: Request,
+    pending: Dict[str, str],
+    cache_keys: Dict[str, str],
+    results: Dict[str, Dict],
+    aggregate: bool,
+    model: Optional[str] = None,
+):
+    """
+    Parses the files of a batch in parallel and extracts their entities into results.
+    """
+    parsed = await asyncio.gather(
+        *(run_parse_stage(request, parse_document, path) for path in pending.values()),
+        return_exceptions=True,
+    )
+    texts: Dict[str, Tuple[str, List[int], Optional[List[str]]]] = {}
+    for filename, document in zip(pending, parsed):
+        if isinstance(document, (StageTimeoutError, ClientDisconnectedError)):
+            raise document
+        if isinstance(document, Exception):
+            results[filename] = {"error": "Failed to parse PDF file."}
+        elif not document[0].strip():
+            results[filename] = {"error": "No extractable text found in the PDF."}
+        else:
+            texts[filename] = document
+
+    # The windows of all documents share the model batches.
+    if texts:
+        entity_lists = await run_inference_stage(
+            request,
+            extract_entities_batch,
+            [text for text, _, _ in texts.values()],
+            [page_starts for _, page_starts, _ in texts.values()],
+            aggregate,
+            model,
+            [fingerprints for _, _, fingerprints in texts.values()],
+        )
+        for filename, entities in zip(texts, entity_lists):
+            extraction_cache.put(cache_keys[filename], entities)
+            results[filename] = {"entities": entities}
+
+
+@router.post(
+    "/extract/batch",
+    summary="Extract medical entities from several PDF documents at once.",
+    response_model=Dict[str, BatchExtractResult],
+    response_class=ORJSONResponse,
+    responses=error_response,
+)
+async def extract_from_pdfs(
+    request: Request,
+    username: Annotated[str, Depends(http_basic_auth)],
+    contents: List[UploadFile] = File(description="PDF files to be processed"),
+    output: OutputFormat = Query(OutputFormat.ENTITIES, description=OUTPUT_HELP),
+    model: Optional[str] = Query(None, description=MODEL_HELP),
+):
+    """
+    Results are keyed by filename. A file that cannot be processed gets an error
+    instead of entities and does not fail the other files.
+    """
+    logger.info(
+        "API accessed",
+        extra={
+            "request_id": get_request_id(),
+            "username": username,
+            "files": len(contents),
+        },
+    )
+    if len(contents) > max_batch_files:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many files, at most {max_batch_files} are allowed.",
+        )
+    check_model(model)
+    aggregate = output == OutputFormat.AGGREGATED
+    uploads: List[SpooledUpload] = []
+    try:
+        results: Dict[str, Dict] = {}
+        pending: Dict[str, str] = {}
+        cache_keys: Dict[str, str] = {}
+        pages: Dict[str, int] = {}
+        for index, content in enumerate(contents):
+            filename = content.filename or f"file {index + 1}"
+            if filename in results:
+                results[filename] = {"error": "Duplicate filename."}
+                pending.pop(filename, None)
+                pages.pop(filename, None)
+                continue
+            if content.content_type != "application/pdf":
+                results[filename] = {"error": "Unsupported file type."}
+                continue
+            if content.size is not None and content.size > max_upload_bytes:
+                results[filename] = {"error": "File too large."}
+                continue
+            try:
+                upload = await read_upload(content)
+            except UploadTooLargeError as e:
+                results[filename] = {"error": str(e)}
+                continue
+            uploads.append(upload)
+            if not upload.size:
+                results[filename] = {"error": "Uploaded file is empty."}
+                continue
+            cache_keys[filename] = extraction_cache.key(
+                upload.digest,
+                extraction_config_key(model, aggregate),
             )
-        entities = extract_entities(text)
-        return JSONResponse(content=entities, status_code=200)
+            entities = extraction_cache.get(cache_keys[filename])
+            if entities is not None:
+                results[filename] = {"entities": entities}
+                continue
+            try:
+                pages[filename] = await check_page_count(upload.path)
+            except HTTPException as he:
+                results[filename] = {"error": he.detail}
+                continue
+            # Placeholder keeps the results in upload order.
+            results[filename] = {}
+            pending[filename] = upload.path
+
+        logger.info(
+            "Processing files",
+            extra={
+                "request_id": get_request_id(),
+                "username": username,
+                "files": list(pending),
+            },
+        )
+        if pending:
+            # The whole batch is admitted at once, as every file it extracts from, with
+            # all of their pages.
+            ticket = await admit(request, sum(pages.values()), len(pending))
+            try:
+                await extract_pending(
+                    request, pending, cache_keys, results, aggregate, model
+                )
+            finally:
+                ticket.release()
+        with observe_stage("serialize"):
+            response = ORJSONResponse(content=results, status_code=200)
+        return response
     except HTTPException as he:
         raise he
+    except StageTimeoutError as e:
+        raise HTTPException(status_code=504, detail="Processing timed out.") from e
+    except ClientDisconnectedError as e:
+        raise HTTPException(status_code=499, detail="Client disconnected.") from e
     except Exception as e:
         logger.exception("Unexpected error during processing.")
         raise HTTPException(status_code=500, detail="Server error") from e
+    finally:
+        for upload in uploads:
+            upload.close()
+
+
+@router.post(
+    "/jobs",
+    summary="Queue a PDF document for asynchronous entity extraction.",
+    response_model=JobSubmitResponse,
+    status_code=202,
+    responses={**error_response, **job_error_response},
+)
+async def submit_job(
+    username: Annotated[str, Depends(http_basic_auth)],
+    content: UploadFile = File(description="PDF file to be processed"),
+):
+    """
+    Returns as soon as the file is stored. Poll `GET /api/v1/jobs/{job_id}` for the result.
+    """
+    if not jobs_enabled:
+        raise HTTPException(status_code=503, detail="Job queue is not enabled.")
+    if content.content_type != "application/pdf":
+        logger.error(
+            "Unsupported content type",
+            extra={"request_id": get_request_id(), "username": username},
+        )
+        raise HTTPException(status_code=415, detail="Unsupported file type.")
+    if content.filename == "":
+        raise HTTPException(
+            status_code=400, detail="Bad request, file not included or empty filename."
+        )
+    check_upload_size(content)
+    try:
+        # Spooled next to the payloads, so that queueing only has to move the file.
+        upload = await read_upload(content, job_store.payload_dir)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e)) from e
+    try:
+        if not upload.size:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty.")
+        # Fails fast on documents the workers would reject anyway.
+        await check_page_count(upload.path)
+        try:
+            job_id = await asyncio.to_thread(
+                job_store.submit, content.filename, upload.path
+            )
+        except Exception as e:
+            logger.exception("Unexpected error while queueing job.")
+            raise HTTPException(status_code=500, detail="Server error") from e
+    finally:
+        upload.close()
+    logger.info(
+        "Job queued",
+        extra={"request_id": get_request_id(), "username": username, "job_id": job_id},
+    )
+    return {"job_id": job_id, "status": QUEUED}
+
+
+@router.get(
+    "/jobs/{job_id}",
+    summary="Status and result of an extraction job.",
+    response_model=JobResponse,
+    response_class=ORJSONResponse,
+    responses=job_error_response,
+)
+async def get_job(job_id: str, username: Annotated[str, Depends(http_basic_auth)]):
+    if not jobs_enabled:
+        raise HTTPException(status_code=503, detail="Job queue is not enabled.")
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return ORJSONResponse(content=job, status_code=200)
+
+
+@router.get(
+    "/stats",
+    summary="Runtime statistics of the extraction pipeline in this worker.",
+)
+async def get_stats(username: Annotated[str, Depends(http_basic_auth)]):
+    return {
+        "batch_scheduler": batch_scheduler_stats(),
+        "models": model_registry.stats(),
+        "admission": admission_controller.stats(),
+        "cache": extraction_cache.stats(),
+        "jobs": (
+            {"queue_depth": await asyncio.to_thread(job_store.queue_depth)}
+            if jobs_enabled
+            else None
+        ),
+    }
+
+
+@router.delete(
+    "/cache",
+    summary="Invalidate all cached extraction results.",
+    status_code=204,
+)
+async def clear_cache(username: Annotated[str, Depends(http_basic_auth)]):
+    logger.info(
+        "Clearing extraction cache",
+        extra={"request_id": get_request_id(), "username": username},
+    )
+    extraction_cache.clear()
+    # The entities of single pages would otherwise outlive it in incremental extraction.
+    page_cache.clear()
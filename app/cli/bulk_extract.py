@@ -0,0 +1,289 @@
+"""
+Extracts the entities of every PDF in a directory or a manifest into a JSONL file.
+
+    python -m app.cli.bulk_extract archive/ --output entities.jsonl
+    python -m app.cli.bulk_extract --manifest files.txt --output entities.jsonl
+
+PDFs are parsed in a pool of processes while the main process runs the model over the
+parsed texts of several documents at once, so that parsing and inference overlap and
+the model batches are shared between documents. Every document is written as one line,
+{"path", "pages", "entities"} or {"path", "error"}, as soon as it is done. Running the
+command again with the same output skips the documents it already holds, so an
+interrupted run resumes where it stopped. With --retry-failed, documents that failed
+are processed again, and once the run ends the output holds only their new line.
+Progress is reported on stderr.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from app.util.pdf import parse_pdf_pages
+from app.util.text_context import extract_entities_batch
+
+
+def find_documents(directory: str) -> Iterator[str]:
+    """
+    Yields the PDFs below the directory in a stable order.
+    """
+    for root, directories, files in os.walk(directory):
+        directories.sort()
+        for name in sorted(files):
+            if name.lower().endswith(".pdf"):
+                yield os.path.join(root, name)
+
+
+def read_manifest(manifest: str) -> Iterator[str]:
+    """
+    Yields the paths listed in the manifest, one per line, skipping empty lines.
+    """
+    with open(manifest) as file:
+        for line in file:
+            if line.strip():
+                yield line.strip()
+
+
+def _read_records(output: str) -> List[Dict]:
+    # Removes a line cut off by an interrupted run, so that new lines are appended
+    # after the last complete one.
+    with open(output, "rb+") as file:
+        content = file.read()
+        end = content.rfind(b"\n") + 1
+        if end < len(content):
+            file.truncate(end)
+    records = []
+    for line in content[:end].splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+
+def read_completed(output: str, retry_failed: bool) -> Set[str]:
+    """
+    Returns the paths already written to the output. A document written more than once
+    counts as its last record. A line cut off by an interrupted run is removed, so that
+    new lines are appended after the last complete one.
+    """
+    if not os.path.exists(output):
+        return set()
+    last_records = {record["path"]: record for record in _read_records(output)}
+    return {
+        path
+        for path, record in last_records.items()
+        if not (retry_failed and "error" in record)
+    }
+
+
+def drop_superseded(output: str):
+    """
+    Rewrites the output with only the last record of every document, so that documents
+    processed again are not left with the error of an earlier run. The new file replaces
+    the old one in one rename.
+    """
+    if not os.path.exists(output):
+        return
+    records = _read_records(output)
+    last_records = {record["path"]: index for index, record in enumerate(records)}
+    if len(last_records) == len(records):
+        return
+    with open(output + ".tmp", "w") as file:
+        for index, record in enumerate(records):
+            if last_records[record["path"]] == index:
+                file.write(json.dumps(record) + "\n")
+    os.replace(output + ".tmp", output)
+
+
+def parse_document(path: str) -> Tuple[str, List[int]]:
+    """
+    Returns the text of a PDF and where each of its pages starts in it. Runs in a
+    parsing process.
+    """
+    return parse_pdf_pages(path)
+
+
+def extract_batch(documents: List[Tuple[str, List[int]]]) -> List:
+    """
+    Returns the entities of each parsed document, or the ValueError of a document that
+    failed. A failed batch is retried one document at a time, so one bad document does
+    not fail the others.
+    """
+    try:
+        return extract_entities_batch(*map(list, zip(*documents)))
+    except ValueError:
+        if len(documents) == 1:
+            raise
+    results = []
+    for text, page_starts in documents:
+        try:
+            results.extend(extract_entities_batch([text], [page_starts]))
+        except ValueError as e:
+            results.append(e)
+    return results
+
+
+class Progress:
+    """
+    Counts finished documents and pages and reports their rates at most every
+    `interval` seconds.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.documents = 0
+        self.pages = 0
+        self.failed = 0
+        self.start_time = time.perf_counter()
+        self._reported_at = self.start_time
+
+    def add(self, pages: int, failed: bool = False):
+        self.documents += 1
+        self.pages += pages
+        self.failed += failed
+        if time.perf_counter() - self._reported_at >= self.interval:
+            self._reported_at = time.perf_counter()
+            print(json.dumps(self.summary()), file=sys.stderr, flush=True)
+
+    def summary(self) -> Dict:
+        seconds = max(time.perf_counter() - self.start_time, 1e-9)
+        return {
+            "documents": self.documents,
+            "pages": self.pages,
+            "failed": self.failed,
+            "seconds": round(seconds, 3),
+            "documents_per_second": round(self.documents / seconds, 3),
+            "pages_per_second": round(self.pages / seconds, 3),
+        }
+
+
+def bulk_extract(
+    paths: Iterable[str],
+    output: str,
+    workers: int,
+    batch_documents: int,
+    retry_failed: bool = False,
+    report_seconds: float = 10.0,
+) -> Dict:
+    """
+    Extracts the entities of the PDFs that the output does not hold yet and appends them
+    to it. With retry_failed, documents that failed before are processed again and only
+    their new record is kept. Returns the number of documents and pages processed and
+    their rates.
+    """
+    completed = read_completed(output, retry_failed)
+    pending = (path for path in paths if path not in completed)
+    progress = Progress(report_seconds)
+    # Bounds the parsed texts held in memory while the model catches up.
+    max_in_flight = max(workers, batch_documents) * 2
+    in_flight: Dict[Future, str] = {}
+    parsed: List[Tuple[str, str, List[int]]] = []
+
+    executor = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+    with executor, open(output, "a") as file:
+
+        def write(record: Dict):
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+
+        def run_model():
+            results = extract_batch([document for _, *document in parsed])
+            for (path, _, page_starts), entities in zip(parsed, results):
+                pages = len(page_starts)
+                if isinstance(entities, Exception):
+                    write({"path": path, "error": str(entities)})
+                else:
+                    write({"path": path, "pages": pages, "entities": entities})
+                progress.add(pages, isinstance(entities, Exception))
+            parsed.clear()
+
+        exhausted = False
+        while in_flight or parsed or not exhausted:
+            while not exhausted and len(in_flight) < max_in_flight:
+                path = next(pending, None)
+                if path is None:
+                    exhausted = True
+                else:
+                    in_flight[executor.submit(parse_document, path)] = path
+            if in_flight:
+                # Waits for a parse only when there is not enough to run the model on.
+                timeout = 0 if len(parsed) >= batch_documents else None
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = in_flight.pop(future)
+                    try:
+                        text, page_starts = future.result()
+                    except Exception as e:
+                        write({"path": path, "error": str(e)})
+                        progress.add(0, failed=True)
+                        continue
+                    if not text.strip():
+                        write({"path": path, "error": "No extractable text found."})
+                        progress.add(len(page_starts), failed=True)
+                    else:
+                        parsed.append((path, text, page_starts))
+            if len(parsed) >= batch_documents or (parsed and not in_flight):
+                run_model()
+
+    # Also cleans up after a retrying run that was interrupted.
+    drop_superseded(output)
+    return progress.summary()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("directory", nargs="?", help="Directory searched for PDFs")
+    parser.add_argument("--manifest", help="File listing one PDF path per line")
+    parser.add_argument("--output", required=True, help="JSONL file to append to")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of PDF parsing processes",
+    )
+    parser.add_argument(
+        "--batch-documents",
+        type=int,
+        default=8,
+        help="Number of documents run through the model together",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Process again the documents that failed in an earlier run",
+    )
+    parser.add_argument(
+        "--report-seconds",
+        type=float,
+        default=10.0,
+        help="Interval between progress reports on stderr",
+    )
+    args = parser.parse_args(args)
+    if (args.directory is None) == (args.manifest is None):
+        parser.error("pass either a directory or --manifest")
+
+    paths = (
+        find_documents(args.directory)
+        if args.directory
+        else read_manifest(args.manifest)
+    )
+    summary = bulk_extract(
+        paths,
+        args.output,
+        args.workers,
+        args.batch_documents,
+        args.retry_failed,
+        args.report_seconds,
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmarks combinations of worker processes, torch threads and CPU affinity on this host.
+
+    python -m app.cli.calibrate_threads --seconds 30 paper.pdf notes.txt
+
+Documents are PDF files or plain text files. Every combination forks its workers from
+a process that holds the loaded model, as gunicorn does with GUNICORN_PRELOAD, and all
+of them extract entities from the documents for the same time. The report is printed
+as JSON and ends with the settings of the combination with the highest throughput.
+"""
+
+import argparse
+import json
+import multiprocessing
+import statistics
+import time
+from typing import Dict, List
+
+from app.cli.compare_backends import load_document, load_model
+from app.util.config import inference_backend
+from app.util.cpu import available_cpus, configure_worker
+from app.util.pdf_model import PDFModel
+
+
+def candidates(cpu_count: int) -> List[Dict]:
+    """
+    Returns the combinations to try: worker counts doubling up to twice the CPUs, each
+    worker with an even share of the CPUs as torch threads, with and without affinity.
+    """
+    combinations = []
+    workers = 1
+    while workers <= 2 * cpu_count:
+        threads = max(1, cpu_count // workers)
+        combinations.append({"workers": workers, "threads": threads, "affinity": False})
+        if 1 < workers <= cpu_count:
+            combinations.append(
+                {"workers": workers, "threads": threads, "affinity": True}
+            )
+        workers *= 2
+    return combinations
+
+
+def _run_worker(model, documents, combination, slot, start, seconds, results):
+    configure_worker(
+        slot,
+        combination["workers"],
+        threads=combination["threads"],
+        affinity=combination["affinity"],
+    )
+    # Warms up outside of the measurement.
+    model.extract_entities(documents[0][0])
+    start.wait()
+    deadline = time.perf_counter() + seconds
+    windows, latencies = 0, []
+    while time.perf_counter() < deadline:
+        for text, document_windows in documents:
+            document_start = time.perf_counter()
+            model.extract_entities(text)
+            latencies.append(time.perf_counter() - document_start)
+            windows += document_windows
+    results.put((windows, latencies))
+
+
+def measure(model: PDFModel, documents, combination: Dict, seconds: float) -> Dict:
+    context = multiprocessing.get_context("fork")
+    start = context.Barrier(combination["workers"] + 1)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=_run_worker,
+            args=(model, documents, combination, slot, start, seconds, results),
+        )
+        for slot in range(combination["workers"])
+    ]
+    for process in processes:
+        process.start()
+    start.wait()
+    start_time = time.perf_counter()
+    outcomes = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - start_time
+    for process in processes:
+        process.join()
+
+    latencies = sorted(
+        latency for _, worker_latencies in outcomes for latency in worker_latencies
+    )
+    return {
+        **combination,
+        "windows_per_second": sum(windows for windows, _ in outcomes) / elapsed,
+        "documents": len(latencies),
+        "median_document_seconds": statistics.median(latencies),
+        "max_document_seconds": latencies[-1],
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "documents", nargs="+", help="PDF or text files to extract from"
+    )
+    parser.add_argument(
+        "--seconds", type=float, default=20.0, help="Measured time per combination"
+    )
+    args = parser.parse_args(args)
+
+    # Loaded before forking, but not run, as torch thread pools do not survive a fork.
+    model = load_model(inference_backend)
+    documents = []
+    for path in args.documents:
+        text = load_document(path)
+        documents.append((text, len(model.split_text(text))))
+
+    cpu_count = len(available_cpus())
+    results = [
+        measure(model, documents, combination, args.seconds)
+        for combination in candidates(cpu_count)
+    ]
+    best = max(results, key=lambda result: result["windows_per_second"])
+
+    print(
+        json.dumps(
+            {
+                "cpus": cpu_count,
+                "results": results,
+                "recommended": {
+                    "GUNICORN_WORKERS": best["workers"],
+                    "TORCH_THREADS": best["threads"],
+                    "CPU_AFFINITY": str(best["affinity"]).lower(),
+                },
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
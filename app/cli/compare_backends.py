@@ -0,0 +1,141 @@
+"""
+Compares the entities and latency of an inference backend against a reference backend.
+
+    python -m app.cli.compare_backends --backend onnx-int8 paper.pdf notes.txt
+
+Documents are PDF files or plain text files. Entities are matched on their label and
+character offsets, and the report is printed as JSON.
+"""
+
+import argparse
+import json
+import time
+from typing import Dict, List
+
+from app.util.config import (
+    chunk_max_tokens,
+    chunk_overlap_tokens,
+    huggingface_aggregation_strategy,
+    huggingface_device,
+    huggingface_model,
+    huggingface_task,
+    inference_batch_size,
+    inference_batch_tokens,
+)
+from app.util.inference_backend import BACKENDS, TORCH
+from app.util.pdf import parse_pdf
+from app.util.pdf_model import PDFModel
+
+
+def load_document(path: str) -> str:
+    if path.lower().endswith(".pdf"):
+        return parse_pdf(path)
+    with open(path, "rb") as file:
+        return file.read().decode("utf-8")
+
+
+def load_model(backend: str) -> PDFModel:
+    return PDFModel(
+        huggingface_model,
+        huggingface_task,
+        huggingface_aggregation_strategy,
+        huggingface_device,
+        max_tokens=chunk_max_tokens,
+        overlap_tokens=chunk_overlap_tokens,
+        batch_size=inference_batch_size,
+        backend=backend,
+        batch_tokens=inference_batch_tokens,
+    )
+
+
+def run_model(model: PDFModel, text: str, repeats: int):
+    # The first run warms up the backend and is not timed.
+    entities = model.extract_entities(text)
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        model.extract_entities(text)
+    seconds = (time.perf_counter() - start_time) / repeats
+    return entities, seconds
+
+
+def compare_entities(reference: List[Dict], candidate: List[Dict]) -> Dict:
+    """
+    Scores the candidate entities against the reference entities, matching on label and
+    offsets, and reports how far the scores of matched entities moved.
+    """
+
+    def by_span(entities):
+        return {
+            (entity["entity_group"], entity["start"], entity["end"]): entity
+            for entity in entities
+        }
+
+    reference_spans = by_span(reference)
+    candidate_spans = by_span(candidate)
+    matched = reference_spans.keys() & candidate_spans.keys()
+    precision = len(matched) / len(candidate_spans) if candidate_spans else 1.0
+    recall = len(matched) / len(reference_spans) if reference_spans else 1.0
+    return {
+        "reference_entities": len(reference_spans),
+        "candidate_entities": len(candidate_spans),
+        "matched_entities": len(matched),
+        "precision": precision,
+        "recall": recall,
+        "f1": (
+            2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        ),
+        "max_score_difference": max(
+            (
+                abs(
+                    float(reference_spans[span]["score"])
+                    - float(candidate_spans[span]["score"])
+                )
+                for span in matched
+            ),
+            default=0.0,
+        ),
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("documents", nargs="+", help="PDF or text files to compare on")
+    parser.add_argument("--backend", required=True, choices=sorted(BACKENDS))
+    parser.add_argument("--reference", default=TORCH, choices=sorted(BACKENDS))
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per text")
+    args = parser.parse_args(args)
+
+    reference_model = load_model(args.reference)
+    candidate_model = load_model(args.backend)
+
+    documents = []
+    for path in args.documents:
+        text = load_document(path)
+        windows = len(reference_model.split_text(text))
+        reference, reference_seconds = run_model(reference_model, text, args.repeats)
+        candidate, candidate_seconds = run_model(candidate_model, text, args.repeats)
+        documents.append(
+            {
+                "document": path,
+                "windows": windows,
+                "reference_seconds_per_window": reference_seconds / windows,
+                "candidate_seconds_per_window": candidate_seconds / windows,
+                "speedup": reference_seconds / candidate_seconds,
+                **compare_entities(reference, candidate),
+            }
+        )
+
+    print(
+        json.dumps(
+            {
+                "reference": args.reference,
+                "backend": args.backend,
+                "documents": documents,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
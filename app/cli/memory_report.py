@@ -0,0 +1,72 @@
+"""
+Reports the memory used by a gunicorn master and each of its workers.
+
+    python -m app.cli.memory_report <gunicorn master pid>
+
+RSS counts every page a process maps, including pages it shares with the other
+workers, so adding it up over-counts shared model weights. PSS splits every shared
+page evenly between the processes that map it, so the sum of PSS is the real memory
+footprint of the deployment. Private memory is what each additional worker costs.
+Linux only, as it reads /proc/<pid>/smaps_rollup.
+"""
+
+import argparse
+import json
+from typing import Dict, List
+
+FIELDS = {
+    "Rss": "rss_mb",
+    "Pss": "pss_mb",
+    "Shared_Clean": "shared_clean_mb",
+    "Shared_Dirty": "shared_dirty_mb",
+    "Private_Clean": "private_clean_mb",
+    "Private_Dirty": "private_dirty_mb",
+}
+
+
+def read_memory(pid: int) -> Dict[str, float]:
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            name, _, value = line.partition(":")
+            if name in FIELDS:
+                memory[FIELDS[name]] = round(int(value.split()[0]) / 1024, 1)
+    memory["private_mb"] = round(
+        memory["private_clean_mb"] + memory["private_dirty_mb"], 1
+    )
+    return memory
+
+
+def child_pids(pid: int) -> List[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as children:
+        return [int(child) for child in children.read().split()]
+
+
+def memory_report(master_pid: int) -> Dict:
+    workers = [
+        {"pid": pid, **read_memory(pid)} for pid in sorted(child_pids(master_pid))
+    ]
+    master = {"pid": master_pid, **read_memory(master_pid)}
+    processes = [master] + workers
+    return {
+        "master": master,
+        "workers": workers,
+        "total_rss_mb": round(sum(process["rss_mb"] for process in processes), 1),
+        "total_pss_mb": round(sum(process["pss_mb"] for process in processes), 1),
+        "average_worker_private_mb": (
+            round(sum(worker["private_mb"] for worker in workers) / len(workers), 1)
+            if workers
+            else 0.0
+        ),
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pid", type=int, help="PID of the gunicorn master")
+    args = parser.parse_args(args)
+    print(json.dumps(memory_report(args.pid), indent=2))
+
+
+if __name__ == "__main__":
+    main()
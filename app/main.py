@@ -1,13 +1,53 @@
 import logging
+import threading
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
+from app.api.health import router as health_router
+from app.api.metrics import router as metrics_router
 from app.api.router import api_router
-from app.util.config import Stage, stage
-from app.util.log import set_log_level
-from app.util.middleware import add_request_id
+from app.util.config import (
+    Stage,
+    jobs_enabled,
+    log_mode,
+    log_queue_size,
+    log_sample_rates,
+    model_load_mode,
+    model_warmup_lengths,
+    stage,
+)
+from app.util.cpu import configure_worker
+from app.util.executor import shutdown_executors
+from app.util.jobs import job_runner
+from app.util.log import configure_logging, set_log_level
+from app.util.middleware import UploadSizeLimit, add_request_id
+from app.util.text_context import prepare_model
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in every worker, after gunicorn has forked it.
+    # Already done in gunicorn's post_fork hook, this covers running without gunicorn.
+    configure_worker()
+    if model_load_mode == "eager":
+        # The server answers /healthz and /readyz while the model loads and warms up.
+        threading.Thread(
+            target=prepare_model,
+            args=(model_warmup_lengths,),
+            name="model-warm-up",
+            daemon=True,
+        ).start()
+    if jobs_enabled:
+        job_runner.start()
+    yield
+    if jobs_enabled:
+        job_runner.stop()
+    shutdown_executors()
+
 
 app = FastAPI(
+    lifespan=lifespan,
     title="Medical Entity Extraction API",
     version="1.0.0",
     description="This API allows users to extract medically relevant entities from PDF documents using a pre-trained "
@@ -16,10 +56,14 @@ app = FastAPI(
 
 LOG_LEVEL = logging.INFO if stage == Stage.PROD else logging.DEBUG
 
+configure_logging(log_mode, log_queue_size, log_sample_rates)
 set_log_level(LOG_LEVEL)
 
 # Middleware
+app.add_middleware(UploadSizeLimit)
 app.middleware("http")(add_request_id)
 
 # Routers
 app.include_router(api_router)
+app.include_router(metrics_router)
+app.include_router(health_router)
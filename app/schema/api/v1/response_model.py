@@ -1,8 +1,16 @@
+from enum import Enum
+from typing import List, Optional, Union
+
 from pydantic import BaseModel, Field
 
 from app.schema.error.response_model import (
     BadRequestError,
+    GatewayTimeoutError,
+    NotFoundError,
+    PayloadTooLargeError,
     ServerError,
+    ServiceUnavailableError,
+    TooManyRequestsError,
     UnsupportedMediaTypeError,
 )
 
@@ -31,6 +39,83 @@ class ExtractResponse(BaseModel):
         description="The end position of the entity in the context with respect to the original text.",
         example=34,
     )
+    page: int = Field(
+        ..., description="Page of the document the entity was found on.", example=1
+    )
+
+
+class OutputFormat(str, Enum):
+    ENTITIES = "entities"
+    AGGREGATED = "aggregated"
+
+
+class AggregatedEntity(BaseModel):
+    entity: str = Field(
+        ..., description="The entity as first found in the text.", example="fatigue"
+    )
+    label: str = Field(
+        ..., description="Label the model gave the entity.", example="Sign_symptom"
+    )
+    count: int = Field(..., description="Number of occurrences.", example=2)
+    offsets: List[List[int]] = Field(
+        ...,
+        description="Start and end position of every occurrence in the text.",
+        example=[[25, 32], [410, 417]],
+    )
+    contexts: List[str] = Field(
+        ...,
+        description="Context of the first occurrences, at most AGGREGATE_MAX_CONTEXTS.",
+        example=["Most reported severe fatigue after exercise."],
+    )
+    pages: List[int] = Field(
+        ..., description="Pages the entity occurs on.", example=[1, 3]
+    )
+
+
+class BatchExtractResult(BaseModel):
+    entities: Optional[List[Union[ExtractResponse, AggregatedEntity]]] = Field(
+        None, description="Entities found in the file. Missing when the file failed."
+    )
+    error: Optional[str] = Field(
+        None,
+        description="Why the file could not be processed. Missing when it succeeded.",
+        example="Unsupported file type.",
+    )
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class JobSubmitResponse(BaseModel):
+    job_id: str = Field(
+        ...,
+        description="Id to poll the job with.",
+        example="4f1c2a9e-7d1b-4c55-9a57-2a0f3f6f9b1e",
+    )
+    status: JobStatus = Field(..., description="Status of the job.")
+
+
+class JobResponse(JobSubmitResponse):
+    filename: Optional[str] = Field(
+        None, description="Name of the uploaded file.", example="paper.pdf"
+    )
+    attempts: int = Field(
+        ..., description="Number of times a worker started the job.", example=1
+    )
+    created_at: float = Field(..., description="Submission time (Unix seconds).")
+    updated_at: float = Field(..., description="Last status change (Unix seconds).")
+    entities: Optional[List[ExtractResponse]] = Field(
+        None, description="Entities found in the file once the job succeeded."
+    )
+    error: Optional[str] = Field(
+        None,
+        description="Why the job failed.",
+        example="Failed to parse PDF file.",
+    )
 
 
 error_response = {
@@ -38,12 +123,39 @@ error_response = {
         "model": BadRequestError,
         "description": "Bad request, file not included or empty filename.",
     },
+    413: {
+        "model": PayloadTooLargeError,
+        "description": "The upload is larger or has more pages than allowed.",
+    },
     415: {
         "model": UnsupportedMediaTypeError,
         "description": "Unsupported file type.",
     },
+    429: {
+        "model": TooManyRequestsError,
+        "description": "The admission queue is full, retry after `Retry-After` seconds.",
+    },
     500: {
         "model": ServerError,
         "description": "Server error during entity extraction.",
     },
+    503: {
+        "model": ServiceUnavailableError,
+        "description": "Waited too long for admission, retry after `Retry-After` seconds.",
+    },
+    504: {
+        "model": GatewayTimeoutError,
+        "description": "Processing the document took longer than allowed.",
+    },
+}
+
+job_error_response = {
+    404: {
+        "model": NotFoundError,
+        "description": "The job does not exist or its result has expired.",
+    },
+    503: {
+        "model": ServiceUnavailableError,
+        "description": "The job queue is not enabled.",
+    },
 }
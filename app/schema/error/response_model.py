@@ -23,3 +23,43 @@ class ServerError(BaseModel):
         description="Server error during entity extraction.",
         example="Server error during entity extraction.",
     )
+
+
+class GatewayTimeoutError(BaseModel):
+    detail: str = Field(
+        ...,
+        description="Processing the document took longer than allowed.",
+        example="Processing timed out.",
+    )
+
+
+class NotFoundError(BaseModel):
+    detail: str = Field(
+        ...,
+        description="The requested resource does not exist or has expired.",
+        example="Job not found.",
+    )
+
+
+class ServiceUnavailableError(BaseModel):
+    detail: str = Field(
+        ...,
+        description="The service cannot take the request right now.",
+        example="Job queue is not enabled.",
+    )
+
+
+class PayloadTooLargeError(BaseModel):
+    detail: str = Field(
+        ...,
+        description="The upload is larger or has more pages than allowed.",
+        example="File too large.",
+    )
+
+
+class TooManyRequestsError(BaseModel):
+    detail: str = Field(
+        ...,
+        description="Too many documents are waiting, retry after the Retry-After header.",
+        example="Too many requests, try again later.",
+    )
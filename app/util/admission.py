@@ -0,0 +1,170 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Dict, Tuple
+
+from app.util.config import (
+    admission_max_documents,
+    admission_max_pages,
+    admission_max_queue,
+    admission_queue_timeout_seconds,
+)
+from app.util.metrics import ADMISSION_REJECTIONS
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a document cannot be admitted; carries the HTTP status to return."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """
+    A hold on the controller by one or more documents. Releasing it more than once has
+    no effect.
+    """
+
+    def __init__(self, controller: "AdmissionController", documents: int, pages: int):
+        self.controller = controller
+        self.documents = documents
+        self.pages = pages
+        self._admitted_at = time.perf_counter()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._release(
+                self.documents, self.pages, time.perf_counter() - self._admitted_at
+            )
+
+
+class AdmissionController:
+    """
+    Limits the documents a worker processes at once, by count and by total pages.
+    Documents that do not fit wait in a bounded first-in first-out queue. A document
+    is rejected with 429 when the queue is full and with 503 when it waited longer than
+    queue_timeout. Documents over the limits, such as a document of more than max_pages
+    pages or a batch of more than max_documents files, are admitted only when they run
+    alone.
+    """
+
+    def __init__(
+        self,
+        max_documents: int,
+        max_pages: int,
+        max_queue: int,
+        queue_timeout: float,
+    ):
+        self.max_documents = max(1, max_documents)
+        self.max_pages = max(1, max_pages)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._documents = 0
+        self._pages = 0
+        self._waiters: deque = deque()
+        # Moving average of how long an admitted document holds its slot.
+        self._average_seconds = 1.0
+        self._admitted = 0
+        self._rejected = 0
+
+    def _fits(self, documents: int, pages: int) -> bool:
+        return not self._documents or (
+            self._documents + documents <= self.max_documents
+            and self._pages + pages <= self.max_pages
+        )
+
+    def retry_after(self) -> int:
+        """
+        Estimates when a retry is likely to be admitted, in whole seconds.
+        """
+        backlog = len(self._waiters) + 1
+        return max(1, math.ceil(self._average_seconds * backlog / self.max_documents))
+
+    def _reject(self, status_code: int, detail: str, reason: str):
+        self._rejected += 1
+        ADMISSION_REJECTIONS.labels(reason).inc()
+        raise AdmissionRejectedError(status_code, detail, self.retry_after())
+
+    async def acquire(self, pages: int, documents: int = 1) -> AdmissionTicket:
+        """
+        Waits until the documents, with pages pages between them, fit and returns their
+        ticket, which must be released.
+        """
+        cost = (max(1, documents), max(1, pages))
+        await self._wait(cost)
+        return AdmissionTicket(self, *cost)
+
+    async def _wait(self, cost: Tuple[int, int]):
+        if not self._waiters and self._fits(*cost):
+            self._take(*cost)
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._reject(429, "Too many requests, try again later.", "queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (cost, waiter)
+        self._waiters.append(entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # Admitted just as the wait ran out.
+                return
+            self._waiters.remove(entry)
+            self._wake()
+            self._reject(503, "Server is busy, try again later.", "queue_timeout")
+        except asyncio.CancelledError:
+            if waiter.done():
+                self._release(*cost)
+            else:
+                self._waiters.remove(entry)
+                self._wake()
+            raise
+
+    def _release(self, documents: int, pages: int, seconds: float = None):
+        self._documents -= documents
+        self._pages -= pages
+        if seconds is not None:
+            self._average_seconds = 0.8 * self._average_seconds + 0.2 * seconds
+        self._wake()
+
+    def _take(self, documents: int, pages: int):
+        self._documents += documents
+        self._pages += pages
+        self._admitted += 1
+
+    def _wake(self):
+        # Strictly in order, so that large documents are not starved by small ones.
+        while self._waiters:
+            cost, waiter = self._waiters[0]
+            if not self._fits(*cost):
+                break
+            self._waiters.popleft()
+            self._take(*cost)
+            waiter.set_result(None)
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight_documents": self._documents,
+            "in_flight_pages": self._pages,
+            "queued": len(self._waiters),
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "max_documents": self.max_documents,
+            "max_pages": self.max_pages,
+            "max_queue": self.max_queue,
+        }
+
+
+admission_controller = AdmissionController(
+    admission_max_documents,
+    admission_max_pages,
+    admission_max_queue,
+    admission_queue_timeout_seconds,
+)
@@ -0,0 +1,147 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Sequence
+
+from app.util.executor import on_stage_cancelled
+from app.util.log import logger
+
+
+def plan_length_batches(lengths: Sequence[int], max_tokens: int) -> List[List[int]]:
+    """
+    Groups sequences of the given token lengths into batches of similar lengths, so that
+    little of a batch is padding, and so that every batch padded to its longest sequence
+    has at most max_tokens tokens. A longer sequence gets a batch of its own. Returns the
+    indices of the sequences in each batch, shortest batches first.
+    """
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    for index in sorted(range(len(lengths)), key=lengths.__getitem__):
+        # Sorted by length, so the new sequence is the longest of the batch.
+        if batch and (len(batch) + 1) * lengths[index] > max_tokens:
+            batches.append(batch)
+            batch = []
+        batch.append(index)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class BatchScheduler:
+    """
+    Collects texts submitted by concurrent requests into a single queue and runs them
+    through the model in batches. A batch is sent as soon as it is full or the oldest
+    text in it has waited max_wait_ms, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        infer: Callable[..., List],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+    ):
+        self._infer = infer
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_seconds = max(0.0, max_wait_ms) / 1000
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        self._batches = 0
+        self._items = 0
+        self._last_batch_size = 0
+        self._max_batch_size_seen = 0
+
+    def submit(self, texts: List[str]) -> List[Future]:
+        """
+        Queues the texts for inference and returns one future per text. When the stage
+        submitting them is given up, the texts not yet in a running batch are dropped.
+        """
+        self._ensure_worker()
+        futures = []
+        for text in texts:
+            future = Future()
+            self._queue.put((text, future))
+            futures.append(future)
+        on_stage_cancelled(lambda: [future.cancel() for future in futures])
+        return futures
+
+    def run(self, texts: List[str]) -> List:
+        """
+        Queues the texts for inference and blocks until all of their results are ready.
+        """
+        return [future.result() for future in self.submit(texts)]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "items": self._items,
+                "average_batch_size": (
+                    self._items / self._batches if self._batches else 0.0
+                ),
+                "last_batch_size": self._last_batch_size,
+                "max_batch_size": self._max_batch_size_seen,
+            }
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork, so a forked worker needs its own thread.
+        with self._lock:
+            if (
+                self._worker is not None
+                and self._worker.is_alive()
+                and self._worker_pid == os.getpid()
+            ):
+                return
+            self._worker = threading.Thread(
+                target=self._run_forever, name="batch-scheduler", daemon=True
+            )
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        # Skip texts whose request has already given up on them.
+        return [
+            (text, future)
+            for text, future in batch
+            if future.set_running_or_notify_cancel()
+        ]
+
+    def _run_forever(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._last_batch_size = len(batch)
+                self._max_batch_size_seen = max(self._max_batch_size_seen, len(batch))
+            logger.debug(
+                "Running inference batch",
+                extra={"batch_size": len(batch), "queue_depth": self._queue.qsize()},
+            )
+            try:
+                results = self._infer(
+                    [text for text, _ in batch], batch_size=len(batch)
+                )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
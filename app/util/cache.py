@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.util.config import (
+    cache_dir,
+    cache_disk_max_bytes,
+    cache_max_bytes,
+    page_cache_max_bytes,
+)
+from app.util.log import logger
+from app.util.metrics import CACHE_LOOKUPS
+
+
+class ExtractionCache:
+    """
+    Caches extraction results keyed by the hash of the uploaded file and the model
+    configuration that produced them. The in-memory tier is bounded by the total size
+    of the serialized results. The optional on-disk tier is a SQLite file that every
+    worker on the host can share.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        disk_path: Optional[str] = None,
+        disk_max_bytes: int = 0,
+        name: str = "document",
+    ):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def key(file_digest: str, config_key: str) -> str:
+        """
+        Builds the cache key from the SHA-256 hex digest of the uploaded file and a
+        string identifying the model and its configuration.
+        """
+        return hashlib.sha256(f"{config_key}\0{file_digest}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                CACHE_LOOKUPS.labels(self.name, "hit").inc()
+                return json.loads(value)
+            value = self._disk_get(key)
+            if value is not None:
+                self._disk_hits += 1
+                CACHE_LOOKUPS.labels(self.name, "disk_hit").inc()
+                self._memory_put(key, value)
+                return json.loads(value)
+            self._misses += 1
+            CACHE_LOOKUPS.labels(self.name, "miss").inc()
+            return None
+
+    def put(self, key: str, result: List[Dict]):
+        value = json.dumps(result).encode("utf-8")
+        with self._lock:
+            self._memory_put(key, value)
+            self._disk_put(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            connection = self._disk_connection()
+            if connection is not None:
+                with connection:
+                    connection.execute("DELETE FROM entries")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "disk_enabled": self.disk_path is not None,
+            }
+
+    def _memory_put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = value
+        self._size += len(value)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self._evictions += 1
+
+    def _disk_connection(self):
+        if self.disk_path is None:
+            return None
+        # SQLite connections must not be shared with forked workers.
+        if self._connection is None or self._connection_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.disk_path) or ".", exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.disk_path, timeout=30, check_same_thread=False
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        try:
+            connection = self._disk_connection()
+            if connection is None:
+                return None
+            row = connection.execute(
+                "SELECT value FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            with connection:
+                connection.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+            return row[0]
+        except sqlite3.Error:
+            logger.exception("Error reading from the extraction cache.")
+            return None
+
+    def _disk_put(self, key: str, value: bytes):
+        if len(value) > self.disk_max_bytes:
+            return
+        try:
+            connection = self._disk_connection()
+            if connection is None:
+                return
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                    (key, value, len(value), time.time()),
+                )
+                (total,) = connection.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM entries"
+                ).fetchone()
+                # Evict the least recently used entries until the file fits its budget.
+                for evict_key, size in connection.execute(
+                    "SELECT key, size FROM entries ORDER BY accessed_at"
+                ).fetchall():
+                    if total <= self.disk_max_bytes:
+                        break
+                    connection.execute(
+                        "DELETE FROM entries WHERE key = ?", (evict_key,)
+                    )
+                    total -= size
+                    self._evictions += 1
+        except sqlite3.Error:
+            logger.exception("Error writing to the extraction cache.")
+
+
+extraction_cache = ExtractionCache(
+    cache_max_bytes,
+    disk_path=(
+        os.path.join(cache_dir, "extraction_cache.sqlite3") if cache_dir else None
+    ),
+    disk_max_bytes=cache_disk_max_bytes,
+)
+# Entities of single pages, keyed by page fingerprint, for incremental extraction.
+page_cache = ExtractionCache(
+    page_cache_max_bytes,
+    disk_path=os.path.join(cache_dir, "page_cache.sqlite3") if cache_dir else None,
+    disk_max_bytes=cache_disk_max_bytes,
+    name="page",
+)
@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+@dataclass
+class TextWindow:
+    """A slice of the source text that fits into a single model forward pass."""
+
+    # Character offsets of the window in the source text.
+    start: int
+    end: int
+    # Token indices of the window in the tokenized source text.
+    token_start: int
+    token_end: int
+
+    def slice(self, text: str) -> str:
+        start, end = self.start, self.end
+        return text[start:end]
+
+
+def _align_to_word_start(word_ids: Sequence[Optional[int]], index: int, floor: int):
+    """
+    Moves a token index back until it no longer splits a word, without going below floor.
+    """
+    aligned = index
+    while (
+        aligned > floor
+        and word_ids[aligned] is not None
+        and (word_ids[aligned] == word_ids[aligned - 1])
+    ):
+        aligned -= 1
+    # A single word longer than the window has to be split.
+    return aligned if aligned > floor else index
+
+
+def plan_windows(
+    text: str,
+    offsets: Sequence[Tuple[int, int]],
+    word_ids: Sequence[Optional[int]],
+    max_tokens: int,
+    overlap_tokens: int,
+) -> List[TextWindow]:
+    """
+    Splits the tokenized text into overlapping windows of at most max_tokens tokens.
+    Window boundaries are moved back to word starts so the model never sees half a word.
+    Texts that fit into a single window are returned unchanged as one window.
+    """
+    token_count = len(offsets)
+    if token_count <= max_tokens:
+        return [TextWindow(0, len(text), 0, token_count)]
+
+    overlap_tokens = max(0, min(overlap_tokens, max_tokens // 2))
+    windows = []
+    token_start = 0
+    while True:
+        token_end = min(token_start + max_tokens, token_count)
+        if token_end < token_count:
+            token_end = _align_to_word_start(word_ids, token_end, token_start)
+        char_start = 0 if not windows else offsets[token_start][0]
+        char_end = len(text) if token_end == token_count else offsets[token_end - 1][1]
+        windows.append(TextWindow(char_start, char_end, token_start, token_end))
+        if token_end == token_count:
+            return windows
+        # Step back by the overlap, but always make progress.
+        next_start = max(token_end - overlap_tokens, token_start + 1)
+        token_start = _align_to_word_start(word_ids, next_start, token_start + 1)
+
+
+def merge_window_entities(
+    windows: List[TextWindow], window_entities: List[List[Dict]]
+) -> List[Dict]:
+    """
+    Maps entities found in each window back onto the source text offsets.
+    Each window owns the characters up to the middle of its overlap with the next window,
+    so an entity found twice in an overlap region is only kept once, from the window
+    where it is furthest from the edge.
+    """
+    if len(windows) == 1:
+        return list(window_entities[0])
+
+    cuts = [
+        (current.end + following.start) // 2
+        for current, following in zip(windows, windows[1:])
+    ]
+    lower_bounds = [0] + cuts
+    upper_bounds = cuts + [windows[-1].end + 1]
+
+    merged = []
+    for window, entities, lower, upper in zip(
+        windows, window_entities, lower_bounds, upper_bounds
+    ):
+        for entity in entities:
+            start = entity["start"] + window.start
+            if lower <= start < upper:
+                merged.append(
+                    {**entity, "start": start, "end": entity["end"] + window.start}
+                )
+    merged.sort(key=lambda entity: entity["start"])
+    return merged
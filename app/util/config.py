@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dataclasses import dataclass, field
 from enum import Enum
 from typing import Any, Dict, List, Optional, Set, TypeVar, Union
@@ -36,6 +37,8 @@ class EnvVarConfig:
     # For enum validation
     enum_class: Optional[type] = None
     allowed_values: Set[Any] = field(default_factory=set)
+    # For int and float validation
+    min_value: Optional[float] = None
 
 
 T = TypeVar("T")
@@ -124,6 +127,15 @@ class EnvConfig:
                     f"Could not convert '{config.name}' value to {config.var_type.value}: {e}"
                 )
 
+            if (
+                config.min_value is not None
+                and self.values[config.name] < config.min_value
+            ):
+                raise ValueError(
+                    f"Invalid value '{value}' for '{config.name}'. "
+                    f"Must be at least {config.min_value:g}"
+                )
+
     def get(self, name: str, default: Optional[T] = None) -> Union[Any, T]:
         """
         Get an environment variable value.
@@ -200,6 +212,339 @@ def configure_environment():
             allowed_values={"cpu", "cuda", "mps"},
             description="Device to run Hugging Face models on",
         ),
+        EnvVarConfig(
+            name="INFERENCE_BACKEND",
+            required=False,
+            default="torch",
+            var_type=EnvVarType.ENUM,
+            allowed_values={"torch", "torch-int8", "onnx", "onnx-int8"},
+            description="Runtime used for the model forward pass",
+        ),
+        EnvVarConfig(
+            name="MODELS",
+            required=False,
+            default="",
+            description="Comma separated further models under models/ that requests may select",
+        ),
+        EnvVarConfig(
+            name="MODEL_MAX_RESIDENT",
+            required=False,
+            default=2,
+            var_type=EnvVarType.INT,
+            description="Most models kept in memory at once, including the default model",
+        ),
+        EnvVarConfig(
+            name="MODEL_MEMORY_BUDGET_BYTES",
+            required=False,
+            default=0,
+            var_type=EnvVarType.INT,
+            description="Most bytes of model weights kept in memory at once, 0 for no limit",
+        ),
+        EnvVarConfig(
+            name="MODEL_LOAD_MODE",
+            required=False,
+            default="eager",
+            var_type=EnvVarType.ENUM,
+            allowed_values={"eager", "lazy"},
+            description="Load and warm up the model at startup, or on first use",
+        ),
+        EnvVarConfig(
+            name="MODEL_WARMUP_LENGTHS",
+            required=False,
+            default="32,128,512",
+            description="Comma separated window lengths (tokens) run through the model at startup",
+        ),
+        EnvVarConfig(
+            name="CHUNK_MAX_TOKENS",
+            required=False,
+            var_type=EnvVarType.INT,
+            description="Maximum tokens per model window, defaults to the model's maximum",
+        ),
+        EnvVarConfig(
+            name="CHUNK_OVERLAP_TOKENS",
+            required=False,
+            default=64,
+            var_type=EnvVarType.INT,
+            description="Tokens shared by neighbouring windows of a long text",
+        ),
+        EnvVarConfig(
+            name="CONTEXT_MODE",
+            required=False,
+            default="sentence",
+            var_type=EnvVarType.ENUM,
+            allowed_values={"fixed", "word", "sentence"},
+            description="Cut contexts at a character count, word or sentence boundary",
+        ),
+        EnvVarConfig(
+            name="CONTEXT_CHARS",
+            required=False,
+            default=32,
+            var_type=EnvVarType.INT,
+            description="Maximum characters of context on each side of an entity",
+        ),
+        EnvVarConfig(
+            name="AGGREGATE_MAX_CONTEXTS",
+            required=False,
+            default=3,
+            var_type=EnvVarType.INT,
+            description="Contexts returned per entity in the aggregated output",
+        ),
+        EnvVarConfig(
+            name="INFERENCE_BATCH_SIZE",
+            required=False,
+            default=8,
+            var_type=EnvVarType.INT,
+            description="Number of windows in one forward pass when INFERENCE_BATCH_TOKENS is 0",
+        ),
+        EnvVarConfig(
+            name="INFERENCE_BATCH_TOKENS",
+            required=False,
+            default=4096,
+            var_type=EnvVarType.INT,
+            description="Most tokens, padding included, in one forward pass, 0 to batch by count",
+        ),
+        EnvVarConfig(
+            name="BATCH_SCHEDULER_ENABLED",
+            required=False,
+            default="false",
+            var_type=EnvVarType.BOOL,
+            description="Batch model inference across concurrent requests",
+        ),
+        EnvVarConfig(
+            name="BATCH_MAX_SIZE",
+            required=False,
+            default=16,
+            var_type=EnvVarType.INT,
+            description="Maximum number of windows in a cross-request batch",
+        ),
+        EnvVarConfig(
+            name="BATCH_MAX_WAIT_MS",
+            required=False,
+            default=5.0,
+            var_type=EnvVarType.FLOAT,
+            description="Maximum time a window waits for a batch to fill up",
+        ),
+        EnvVarConfig(
+            name="PARSE_EXECUTOR",
+            required=False,
+            default="process",
+            var_type=EnvVarType.ENUM,
+            allowed_values={"process", "thread", "inline"},
+            description="Where PDF parsing runs (process pool, thread pool or event loop)",
+        ),
+        EnvVarConfig(
+            name="PARSE_WORKERS",
+            required=False,
+            default=1,
+            var_type=EnvVarType.INT,
+            description="Number of PDF parsing processes or threads per worker",
+        ),
+        EnvVarConfig(
+            name="PARSE_TIMEOUT_SECONDS",
+            required=False,
+            default=120.0,
+            var_type=EnvVarType.FLOAT,
+            description="Maximum time spent parsing a single PDF",
+        ),
+        EnvVarConfig(
+            name="INFERENCE_THREADS",
+            required=False,
+            default=2,
+            var_type=EnvVarType.INT,
+            description="Number of documents running through the model at once per worker",
+        ),
+        EnvVarConfig(
+            name="TORCH_THREADS",
+            required=False,
+            var_type=EnvVarType.INT,
+            min_value=1,
+            description="Torch threads per worker, defaults to the CPUs divided among workers",
+        ),
+        EnvVarConfig(
+            name="TORCH_INTEROP_THREADS",
+            required=False,
+            default=1,
+            var_type=EnvVarType.INT,
+            min_value=1,
+            description="Torch threads per worker running independent operators in parallel",
+        ),
+        EnvVarConfig(
+            name="CPU_AFFINITY",
+            required=False,
+            default="false",
+            var_type=EnvVarType.BOOL,
+            description="Pin every gunicorn worker to its own share of the CPUs, node by node",
+        ),
+        EnvVarConfig(
+            name="INFERENCE_TIMEOUT_SECONDS",
+            required=False,
+            default=300.0,
+            var_type=EnvVarType.FLOAT,
+            description="Maximum time spent extracting entities from a single PDF",
+        ),
+        EnvVarConfig(
+            name="MAX_BATCH_FILES",
+            required=False,
+            default=100,
+            var_type=EnvVarType.INT,
+            description="Maximum number of PDFs in one batch extraction request",
+        ),
+        EnvVarConfig(
+            name="MAX_UPLOAD_BYTES",
+            required=False,
+            default=50 * 1024 * 1024,
+            var_type=EnvVarType.INT,
+            description="Maximum size of an upload",
+        ),
+        EnvVarConfig(
+            name="UPLOAD_DIR",
+            required=False,
+            description="Directory uploads are spooled to while they are processed",
+        ),
+        EnvVarConfig(
+            name="MAX_PDF_PAGES",
+            required=False,
+            default=2000,
+            var_type=EnvVarType.INT,
+            description="Maximum number of pages of an uploaded PDF",
+        ),
+        EnvVarConfig(
+            name="ADMISSION_MAX_DOCUMENTS",
+            required=False,
+            default=4,
+            var_type=EnvVarType.INT,
+            description="Documents processed at once per worker, others wait in the queue",
+        ),
+        EnvVarConfig(
+            name="ADMISSION_MAX_PAGES",
+            required=False,
+            default=500,
+            var_type=EnvVarType.INT,
+            description="Pages processed at once per worker, others wait in the queue",
+        ),
+        EnvVarConfig(
+            name="ADMISSION_MAX_QUEUE",
+            required=False,
+            default=16,
+            var_type=EnvVarType.INT,
+            description="Documents waiting for admission per worker before returning 429",
+        ),
+        EnvVarConfig(
+            name="ADMISSION_QUEUE_TIMEOUT_SECONDS",
+            required=False,
+            default=30.0,
+            var_type=EnvVarType.FLOAT,
+            description="Maximum time a document waits for admission before returning 503",
+        ),
+        EnvVarConfig(
+            name="CACHE_MAX_BYTES",
+            required=False,
+            default=64 * 1024 * 1024,
+            var_type=EnvVarType.INT,
+            description="Memory budget of the extraction cache in each worker",
+        ),
+        EnvVarConfig(
+            name="CACHE_DIR",
+            required=False,
+            description="Directory of the extraction cache shared by all workers",
+        ),
+        EnvVarConfig(
+            name="CACHE_DISK_MAX_BYTES",
+            required=False,
+            default=1024 * 1024 * 1024,
+            var_type=EnvVarType.INT,
+            description="Disk budget of the shared extraction cache",
+        ),
+        EnvVarConfig(
+            name="INCREMENTAL_EXTRACTION",
+            required=False,
+            default="false",
+            var_type=EnvVarType.BOOL,
+            description="Reuse the entities of pages unchanged since an earlier upload",
+        ),
+        EnvVarConfig(
+            name="PAGE_CACHE_MAX_BYTES",
+            required=False,
+            default=64 * 1024 * 1024,
+            var_type=EnvVarType.INT,
+            description="Memory budget of the per-page entity store in each worker",
+        ),
+        EnvVarConfig(
+            name="JOBS_ENABLED",
+            required=False,
+            default="false",
+            var_type=EnvVarType.BOOL,
+            description="Accept asynchronous extraction jobs and run them in the background",
+        ),
+        EnvVarConfig(
+            name="JOBS_DIR",
+            required=False,
+            default=os.path.join(tempfile.gettempdir(), "entity-extraction-jobs"),
+            description="Directory of the job queue shared by all workers",
+        ),
+        EnvVarConfig(
+            name="JOBS_CONCURRENCY",
+            required=False,
+            default=1,
+            var_type=EnvVarType.INT,
+            description="Number of jobs processed at once per worker",
+        ),
+        EnvVarConfig(
+            name="JOBS_MAX_ATTEMPTS",
+            required=False,
+            default=3,
+            var_type=EnvVarType.INT,
+            description="Number of times a job is started before it is given up",
+        ),
+        EnvVarConfig(
+            name="JOBS_LEASE_SECONDS",
+            required=False,
+            default=60.0,
+            var_type=EnvVarType.FLOAT,
+            description="Time after which the job of an unresponsive worker is retried",
+        ),
+        EnvVarConfig(
+            name="JOBS_RESULT_TTL_SECONDS",
+            required=False,
+            default=24 * 60 * 60.0,
+            var_type=EnvVarType.FLOAT,
+            description="Time a finished job and its result are kept",
+        ),
+        EnvVarConfig(
+            name="GUNICORN_WORKERS",
+            required=False,
+            var_type=EnvVarType.INT,
+            min_value=1,
+            description="Number of gunicorn workers, defaults to 2 per CPU",
+        ),
+        EnvVarConfig(
+            name="GUNICORN_PRELOAD",
+            required=False,
+            default="false",
+            var_type=EnvVarType.BOOL,
+            description="Load the model once in the gunicorn master and share it with workers",
+        ),
+        EnvVarConfig(
+            name="LOG_MODE",
+            required=False,
+            default="sync",
+            var_type=EnvVarType.ENUM,
+            allowed_values={"sync", "queue"},
+            description="Write log records in the thread that logs them, or in a background thread",
+        ),
+        EnvVarConfig(
+            name="LOG_QUEUE_SIZE",
+            required=False,
+            default=10000,
+            var_type=EnvVarType.INT,
+            description="Records waiting to be written in queue mode before new ones are dropped",
+        ),
+        EnvVarConfig(
+            name="LOG_SAMPLE_RATES",
+            required=False,
+            default="",
+            description="Comma separated LEVEL=rate shares of records to keep, such as INFO=0.1",
+        ),
         EnvVarConfig(
             name="HTTP_PORT",
             required=True,
@@ -222,6 +567,67 @@ huggingface_task = env.get("HUGGING_FACE_TASK")
 huggingface_aggregation_strategy = env.get("HUGGING_FACE_AGGREGATION_STRATEGY")
 huggingface_device = env.get("HUGGING_FACE_DEVICE")
 http_port = env.get("HTTP_PORT")
+inference_backend = env.get("INFERENCE_BACKEND")
+# The default model comes first and is the one used when a request names none.
+available_models = list(
+    dict.fromkeys(
+        [huggingface_model]
+        + [name.strip() for name in env.get("MODELS").split(",") if name.strip()]
+    )
+)
+model_max_resident = env.get("MODEL_MAX_RESIDENT")
+model_memory_budget_bytes = env.get("MODEL_MEMORY_BUDGET_BYTES")
+model_load_mode = env.get("MODEL_LOAD_MODE")
+model_warmup_lengths = [
+    int(length) for length in env.get("MODEL_WARMUP_LENGTHS").split(",") if length
+]
+chunk_max_tokens = env.get("CHUNK_MAX_TOKENS")
+chunk_overlap_tokens = env.get("CHUNK_OVERLAP_TOKENS")
+context_mode = env.get("CONTEXT_MODE")
+context_chars = env.get("CONTEXT_CHARS")
+aggregate_max_contexts = env.get("AGGREGATE_MAX_CONTEXTS")
+inference_batch_size = env.get("INFERENCE_BATCH_SIZE")
+inference_batch_tokens = env.get("INFERENCE_BATCH_TOKENS")
+batch_scheduler_enabled = env.get("BATCH_SCHEDULER_ENABLED")
+batch_max_size = env.get("BATCH_MAX_SIZE")
+batch_max_wait_ms = env.get("BATCH_MAX_WAIT_MS")
+parse_executor_type = env.get("PARSE_EXECUTOR")
+parse_workers = env.get("PARSE_WORKERS")
+parse_timeout_seconds = env.get("PARSE_TIMEOUT_SECONDS")
+inference_threads = env.get("INFERENCE_THREADS")
+torch_threads = env.get("TORCH_THREADS")
+torch_interop_threads = env.get("TORCH_INTEROP_THREADS")
+cpu_affinity = env.get("CPU_AFFINITY")
+inference_timeout_seconds = env.get("INFERENCE_TIMEOUT_SECONDS")
+max_batch_files = env.get("MAX_BATCH_FILES")
+max_upload_bytes = env.get("MAX_UPLOAD_BYTES")
+upload_dir = env.get("UPLOAD_DIR")
+max_pdf_pages = env.get("MAX_PDF_PAGES")
+admission_max_documents = env.get("ADMISSION_MAX_DOCUMENTS")
+admission_max_pages = env.get("ADMISSION_MAX_PAGES")
+admission_max_queue = env.get("ADMISSION_MAX_QUEUE")
+admission_queue_timeout_seconds = env.get("ADMISSION_QUEUE_TIMEOUT_SECONDS")
+cache_max_bytes = env.get("CACHE_MAX_BYTES")
+cache_dir = env.get("CACHE_DIR")
+cache_disk_max_bytes = env.get("CACHE_DISK_MAX_BYTES")
+incremental_extraction = env.get("INCREMENTAL_EXTRACTION")
+page_cache_max_bytes = env.get("PAGE_CACHE_MAX_BYTES")
+gunicorn_workers = env.get("GUNICORN_WORKERS")
+gunicorn_preload = env.get("GUNICORN_PRELOAD")
+jobs_enabled = env.get("JOBS_ENABLED")
+jobs_dir = env.get("JOBS_DIR")
+jobs_concurrency = env.get("JOBS_CONCURRENCY")
+jobs_max_attempts = env.get("JOBS_MAX_ATTEMPTS")
+jobs_lease_seconds = env.get("JOBS_LEASE_SECONDS")
+jobs_result_ttl_seconds = env.get("JOBS_RESULT_TTL_SECONDS")
+log_mode = env.get("LOG_MODE")
+log_queue_size = env.get("LOG_QUEUE_SIZE")
+log_sample_rates = {
+    level.strip().upper(): float(rate)
+    for level, rate in (
+        item.split("=") for item in env.get("LOG_SAMPLE_RATES").split(",") if item
+    )
+}
 
 # Model labels to show and exclude remaining.
 KEEP_LABELS = {
@@ -0,0 +1,108 @@
+import glob
+import os
+from typing import Dict, List, Optional
+
+from app.util.config import cpu_affinity, torch_interop_threads, torch_threads
+from app.util.log import logger
+
+_configured = False
+
+
+def _parse_cpu_list(text: str) -> List[int]:
+    # Parses lists such as "0-3,8-11" as used in sysfs.
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def available_cpus() -> List[int]:
+    """
+    Returns the CPUs this process may run on, ordered node by node on NUMA hosts, so
+    that consecutive CPUs share a memory controller.
+    """
+    allowed = os.sched_getaffinity(0)
+    ordered = []
+    for path in sorted(
+        glob.glob("/sys/devices/system/node/node[0-9]*/cpulist"),
+        key=lambda path: int(path.split("/node")[-1].split("/")[0]),
+    ):
+        with open(path) as cpulist:
+            ordered.extend(
+                cpu for cpu in _parse_cpu_list(cpulist.read()) if cpu in allowed
+            )
+    # Hosts without NUMA information, or CPUs missing from it.
+    ordered.extend(sorted(allowed - set(ordered)))
+    return ordered
+
+
+def worker_cpus(slot: int, workers: int, cpus: List[int]) -> List[int]:
+    """
+    Returns the CPUs of the worker in slot when the CPUs are split into even, contiguous
+    shares for workers workers. With more workers than CPUs, workers share CPUs.
+    """
+    workers = max(1, workers)
+    if workers >= len(cpus):
+        return [cpus[slot % len(cpus)]]
+    share, extra = divmod(len(cpus), workers)
+    start = slot * share + min(slot, extra)
+    stop = start + share + (slot < extra)
+    return cpus[start:stop]
+
+
+def plan_worker(
+    slot: int,
+    workers: int,
+    cpus: Optional[List[int]] = None,
+    threads: Optional[int] = torch_threads,
+    affinity: bool = cpu_affinity,
+) -> Dict:
+    """
+    Returns the settings of the worker in slot out of workers: the CPUs it is pinned to
+    with affinity, and the size of its torch thread pool, which defaults to the share of
+    the CPUs of one worker so that the workers together do not oversubscribe them.
+    """
+    cpus = cpus if cpus is not None else available_cpus()
+    share = worker_cpus(slot, workers, cpus)
+    return {
+        "cpus": share if affinity else None,
+        "threads": threads or len(share),
+    }
+
+
+def configure_worker(
+    slot: int = 0,
+    workers: int = 1,
+    cpus: Optional[List[int]] = None,
+    threads: Optional[int] = torch_threads,
+    affinity: bool = cpu_affinity,
+    interop_threads: int = torch_interop_threads,
+):
+    """
+    Applies plan_worker to this process: pins it to its CPUs and sizes the torch thread
+    pools. Runs once per process, in gunicorn's post_fork hook or at app startup.
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    # Imported here so that importing this module does not load torch.
+    import torch
+
+    plan = plan_worker(slot, workers, cpus, threads, affinity)
+    if plan["cpus"] is not None:
+        # Threads started from now on, such as the torch pools, inherit the affinity.
+        os.sched_setaffinity(0, plan["cpus"])
+    torch.set_num_threads(plan["threads"])
+    try:
+        torch.set_num_interop_threads(interop_threads)
+    except RuntimeError:
+        # Can only be set before the first inter-op parallel work of the process.
+        logger.warning("The torch inter-op thread pool was already started.")
+    logger.info(
+        f"Worker {slot} runs torch with {plan['threads']} threads on "
+        f"{'CPUs ' + ','.join(map(str, plan['cpus'])) if plan['cpus'] else 'all CPUs'}."
+    )
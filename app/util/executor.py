@@ -0,0 +1,247 @@
+import asyncio
+import contextvars
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, List, Optional
+
+from fastapi import Request
+
+from app.util.config import (
+    inference_threads,
+    inference_timeout_seconds,
+    parse_executor_type,
+    parse_timeout_seconds,
+    parse_workers,
+)
+from app.util.log import get_request_id, logger
+
+# How often a running stage checks whether the client is still connected.
+DISCONNECT_POLL_SECONDS = 0.5
+
+_executors_lock = threading.Lock()
+_parse_executor: Optional[Executor] = None
+_parse_driver_executor: Optional[Executor] = None
+_inference_executor: Optional[Executor] = None
+
+
+class StageTimeoutError(Exception):
+    """Raised when a processing stage takes longer than its configured timeout."""
+
+
+class ClientDisconnectedError(Exception):
+    """Raised when the client goes away while a processing stage is running."""
+
+
+class StageCancellation:
+    """
+    Callbacks to run when run_stage gives up on a stage, so that work the stage handed
+    on, such as texts queued for a shared model batch, is dropped with it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.cancelled = False
+
+    def add(self, callback: Callable[[], None]):
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+_stage_cancellation: contextvars.ContextVar[Optional[StageCancellation]] = (
+    contextvars.ContextVar("stage_cancellation", default=None)
+)
+
+
+def on_stage_cancelled(callback: Callable[[], None]):
+    """
+    Runs callback if the stage running in this thread is given up, see run_stage.
+    Does nothing outside of a stage.
+    """
+    cancellation = _stage_cancellation.get()
+    if cancellation is not None:
+        cancellation.add(callback)
+
+
+def get_parse_executor() -> Optional[Executor]:
+    """
+    Returns the executor for PDF parsing, or None when parsing runs inline.
+    Pools are created on first use so every forked worker gets its own.
+    """
+    global _parse_executor
+    if parse_executor_type == "inline":
+        return None
+    with _executors_lock:
+        if _parse_executor is None:
+            if parse_executor_type == "process":
+                # Spawned processes do not inherit the model or the threads of this worker.
+                _parse_executor = ProcessPoolExecutor(
+                    max_workers=parse_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                _parse_executor = ThreadPoolExecutor(
+                    max_workers=parse_workers, thread_name_prefix="parse"
+                )
+        return _parse_executor
+
+
+def get_parse_driver_executor() -> Executor:
+    """
+    Returns the thread pool that hands page ranges of a document to the parse executor
+    and joins their results, so that waiting on them does not block the event loop.
+    """
+    global _parse_driver_executor
+    with _executors_lock:
+        if _parse_driver_executor is None:
+            _parse_driver_executor = ThreadPoolExecutor(
+                thread_name_prefix="parse-driver"
+            )
+        return _parse_driver_executor
+
+
+def get_inference_executor() -> Executor:
+    """
+    Returns the bounded thread pool for model inference. torch releases the GIL
+    during the forward pass, so threads are enough to keep the event loop free.
+    """
+    global _inference_executor
+    with _executors_lock:
+        if _inference_executor is None:
+            _inference_executor = ThreadPoolExecutor(
+                max_workers=inference_threads, thread_name_prefix="inference"
+            )
+        return _inference_executor
+
+
+def shutdown_executors():
+    global _parse_executor, _parse_driver_executor, _inference_executor
+    with _executors_lock:
+        for executor in (
+            _parse_executor,
+            _parse_driver_executor,
+            _inference_executor,
+        ):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        _parse_executor = None
+        _parse_driver_executor = None
+        _inference_executor = None
+
+
+async def _wait_for_disconnect(request: Request):
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+async def run_stage(
+    request: Request,
+    stage: str,
+    executor: Optional[Executor],
+    timeout: Optional[float],
+    func: Callable,
+    *args,
+):
+    """
+    Runs func on the executor without blocking the event loop.
+    Raises StageTimeoutError when the stage exceeds its timeout and ClientDisconnectedError
+    when the client disconnects first. Work that has not started yet is cancelled, work
+    that is already running finishes in the background and its result is discarded.
+    On a thread pool, callbacks that func registered with on_stage_cancelled run then.
+    """
+    if executor is None:
+        return func(*args)
+
+    loop = asyncio.get_running_loop()
+    cancellation = StageCancellation()
+    if isinstance(executor, ThreadPoolExecutor):
+        # Keep the request id visible to logs written from the pool threads.
+        context = contextvars.copy_context()
+        context.run(_stage_cancellation.set, cancellation)
+        work = loop.run_in_executor(executor, context.run, func, *args)
+    else:
+        work = loop.run_in_executor(executor, func, *args)
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait(
+            {work, disconnect}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        disconnect.cancel()
+
+    if work in done:
+        return work.result()
+
+    work.cancel()
+    cancellation.cancel()
+    if disconnect in done:
+        logger.warning(
+            "Client disconnected, cancelling stage",
+            extra={"request_id": get_request_id(), "stage": stage},
+        )
+        raise ClientDisconnectedError(stage)
+    logger.error(
+        "Stage timed out",
+        extra={"request_id": get_request_id(), "stage": stage, "timeout": timeout},
+    )
+    raise StageTimeoutError(stage)
+
+
+async def run_parse_stage(request: Request, func: Callable, *args):
+    """
+    Runs func(*args, parse_executor) so that func can spread the pages of a document
+    across the parse executor. Parsing stays on the event loop when it runs inline.
+    """
+    parse_executor = get_parse_executor()
+    return await run_stage(
+        request,
+        "parse",
+        get_parse_driver_executor() if parse_executor else None,
+        parse_timeout_seconds,
+        func,
+        *args,
+        parse_executor,
+    )
+
+
+async def run_inference_stage(request: Request, func: Callable, *args):
+    return await run_stage(
+        request,
+        "inference",
+        get_inference_executor(),
+        inference_timeout_seconds,
+        func,
+        *args,
+    )
+
+
+async def iterate_in_executor(executor: Executor, iterator: Iterator) -> AsyncIterator:
+    """
+    Advances a blocking iterator on the executor and yields its items without blocking
+    the event loop. When the consumer stops early the iterator is closed as soon as the
+    step that is running has finished.
+    """
+    context = contextvars.copy_context()
+    done = object()
+    future = None
+    try:
+        while True:
+            future = executor.submit(context.run, next, iterator, done)
+            item = await asyncio.wrap_future(future)
+            if item is done:
+                return
+            yield item
+    finally:
+        if future is not None:
+            future.add_done_callback(lambda _: iterator.close())
@@ -0,0 +1,152 @@
+import os
+import platform
+import shutil
+import tempfile
+from typing import Callable
+
+import torch
+from transformers import AutoModelForTokenClassification
+
+from app.util.log import logger
+
+TORCH = "torch"
+TORCH_INT8 = "torch-int8"
+ONNX = "onnx"
+ONNX_INT8 = "onnx-int8"
+
+BACKENDS = {TORCH, TORCH_INT8, ONNX, ONNX_INT8}
+
+ONNX_FILE_NAME = "model.onnx"
+ONNX_INT8_FILE_NAME = "model_quantized.onnx"
+
+
+def _import_onnxruntime():
+    try:
+        from optimum.onnxruntime import ORTModelForTokenClassification, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    except ImportError as e:
+        raise ImportError(
+            "The onnx inference backends need optimum[onnxruntime], "
+            "install them with `poetry install --with onnx`."
+        ) from e
+    return ORTModelForTokenClassification, ORTQuantizer, AutoQuantizationConfig
+
+
+def _publish(target_dir: str, file_name: str, build: Callable[[str], None]):
+    """
+    Runs build on an empty directory next to target_dir and moves it into place in one
+    rename, so that workers exporting at the same time never load a partial export.
+    Does nothing when target_dir already holds file_name.
+    """
+    if os.path.exists(os.path.join(target_dir, file_name)):
+        return
+    build_dir = tempfile.mkdtemp(
+        prefix=f".{os.path.basename(target_dir)}-", dir=os.path.dirname(target_dir)
+    )
+    try:
+        build(build_dir)
+        try:
+            os.replace(build_dir, target_dir)
+        except OSError:
+            if os.path.exists(os.path.join(target_dir, file_name)):
+                # Another worker finished first, its export is used.
+                return
+            # Left behind by an export written in place before exports were renamed.
+            shutil.rmtree(target_dir, ignore_errors=True)
+            os.replace(build_dir, target_dir)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+
+def export_onnx_model(model_path: str, quantize: bool = False) -> str:
+    """
+    Exports the model to ONNX next to its weights, and optionally quantizes the graph
+    to int8 with dynamic quantization. Returns the directory holding the exported model.
+    Exports that already exist are reused.
+    """
+    ORTModelForTokenClassification, ORTQuantizer, AutoQuantizationConfig = (
+        _import_onnxruntime()
+    )
+
+    def export(build_dir: str):
+        logger.info(f"Exporting {model_path} to ONNX.")
+        model = ORTModelForTokenClassification.from_pretrained(model_path, export=True)
+        model.save_pretrained(build_dir)
+
+    onnx_dir = os.path.join(model_path, ONNX)
+    _publish(onnx_dir, ONNX_FILE_NAME, export)
+    if not quantize:
+        return onnx_dir
+
+    def quantize_export(build_dir: str):
+        logger.info(f"Quantizing the ONNX export of {model_path} to int8.")
+        if platform.machine().lower() in ("arm64", "aarch64"):
+            quantization_config = AutoQuantizationConfig.arm64(
+                is_static=False, per_channel=False
+            )
+        else:
+            quantization_config = AutoQuantizationConfig.avx2(
+                is_static=False, per_channel=False
+            )
+        quantizer = ORTQuantizer.from_pretrained(onnx_dir, file_name=ONNX_FILE_NAME)
+        quantizer.quantize(save_dir=build_dir, quantization_config=quantization_config)
+
+    int8_dir = os.path.join(model_path, ONNX_INT8)
+    _publish(int8_dir, ONNX_INT8_FILE_NAME, quantize_export)
+    return int8_dir
+
+
+def _file_bytes(paths) -> int:
+    return sum(os.path.getsize(path) for path in paths if os.path.isfile(path))
+
+
+def weight_bytes(model_path: str, backend: str = TORCH) -> int:
+    """
+    Estimates the memory the weights of a model take once loaded for the given backend,
+    from the size of the weight files it loads. The PyTorch weights stand in for exports
+    that do not exist yet.
+    """
+    if backend == ONNX_INT8:
+        size = _file_bytes([os.path.join(model_path, ONNX_INT8, ONNX_INT8_FILE_NAME)])
+    elif backend == ONNX:
+        size = _file_bytes([os.path.join(model_path, ONNX, ONNX_FILE_NAME)])
+    else:
+        size = 0
+    if size:
+        return size
+    names = os.listdir(model_path) if os.path.isdir(model_path) else []
+    # Checkpoints are usually saved in both formats, only one of them is loaded.
+    for suffix in (".safetensors", ".bin"):
+        size = _file_bytes(
+            os.path.join(model_path, name) for name in names if name.endswith(suffix)
+        )
+        if size:
+            return size
+    return 0
+
+
+def load_token_classification_model(model_path: str, backend: str = TORCH):
+    """
+    Loads the token classification model for the given inference backend. Every backend
+    returns a model the Hugging Face pipeline accepts, so aggregation behaves the same.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown inference backend '{backend}'. "
+            f"Must be one of: {', '.join(sorted(BACKENDS))}"
+        )
+    if backend == TORCH:
+        return AutoModelForTokenClassification.from_pretrained(model_path)
+    if backend == TORCH_INT8:
+        model = AutoModelForTokenClassification.from_pretrained(model_path)
+        # Weights of the linear layers are stored as int8, activations are quantized on the fly.
+        return torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+    ORTModelForTokenClassification, _, _ = _import_onnxruntime()
+    quantize = backend == ONNX_INT8
+    return ORTModelForTokenClassification.from_pretrained(
+        export_onnx_model(model_path, quantize=quantize),
+        file_name=ONNX_INT8_FILE_NAME if quantize else ONNX_FILE_NAME,
+    )
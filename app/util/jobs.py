@@ -0,0 +1,342 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from app.util.cache import extraction_cache
+from app.util.config import (
+    jobs_concurrency,
+    jobs_dir,
+    jobs_lease_seconds,
+    jobs_max_attempts,
+    jobs_result_ttl_seconds,
+)
+from app.util.executor import get_parse_executor
+from app.util.log import logger
+from app.util.text_context import (
+    extract_entities,
+    extraction_config_key,
+    parse_document,
+)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobStore:
+    """
+    Durable job queue backed by a SQLite file and a directory of uploaded payloads.
+    Every worker on the host can submit and claim jobs from the same store. A claimed
+    job holds a lease that its worker keeps extending; when a worker crashes the lease
+    runs out and the job is handed to another worker, up to max_attempts times.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_attempts: int = 3,
+        lease_seconds: float = 60.0,
+        result_ttl_seconds: float = 24 * 60 * 60,
+    ):
+        self.directory = directory
+        self.payload_dir = os.path.join(directory, "payloads")
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    def _get_connection(self):
+        # SQLite connections must not be shared with forked workers.
+        if self._connection is None or self._connection_pid != os.getpid():
+            os.makedirs(self.payload_dir, exist_ok=True)
+            self._connection = sqlite3.connect(
+                os.path.join(self.directory, "jobs.sqlite3"),
+                timeout=30,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            self._connection.row_factory = sqlite3.Row
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, filename TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "lease_expires_at REAL, expires_at REAL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)"
+            )
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so two workers never claim the same job.
+        with self._lock:
+            connection = self._get_connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def payload_path(self, job_id: str) -> str:
+        return os.path.join(self.payload_dir, f"{job_id}.pdf")
+
+    def _remove_payload(self, job_id: str):
+        try:
+            os.remove(self.payload_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def submit(self, filename: str, path: str) -> str:
+        """
+        Queues the PDF at path, which is moved into the payload directory and so has to
+        be on the same file system, such as a file spooled into payload_dir.
+        """
+        job_id = str(uuid.uuid4())
+        os.makedirs(self.payload_dir, exist_ok=True)
+        os.replace(path, self.payload_path(job_id))
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, status, filename, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, filename, now, now),
+            )
+        return job_id
+
+    def claim(self) -> Optional[str]:
+        """
+        Takes the oldest queued job and returns its id, or None when the queue is empty.
+        Jobs whose worker stopped renewing the lease are queued again first.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? "
+                "WHERE status = ? AND lease_expires_at < ? AND attempts < ?",
+                (QUEUED, now, RUNNING, now, self.max_attempts),
+            )
+            for (job_id,) in connection.execute(
+                "SELECT id FROM jobs WHERE status = ? AND lease_expires_at < ?",
+                (RUNNING, now),
+            ).fetchall():
+                self._finish(
+                    connection, job_id, FAILED, error="Worker stopped processing job."
+                )
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (QUEUED,),
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, "
+                "updated_at = ?, lease_expires_at = ? WHERE id = ?",
+                (RUNNING, now, now + self.lease_seconds, row["id"]),
+            )
+            return row["id"]
+
+    def renew_leases(self, job_ids: List[str]):
+        if not job_ids:
+            return
+        now = time.time()
+        with self._transaction() as connection:
+            connection.executemany(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = ?",
+                [(now + self.lease_seconds, job_id, RUNNING) for job_id in job_ids],
+            )
+
+    def _finish(self, connection, job_id: str, status: str, result=None, error=None):
+        now = time.time()
+        connection.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ?, "
+            "lease_expires_at = NULL, expires_at = ? WHERE id = ?",
+            (
+                status,
+                json.dumps(result) if result is not None else None,
+                error,
+                now,
+                now + self.result_ttl_seconds,
+                job_id,
+            ),
+        )
+        self._remove_payload(job_id)
+
+    def complete(self, job_id: str, result: List[Dict]):
+        with self._transaction() as connection:
+            self._finish(connection, job_id, SUCCEEDED, result=result)
+
+    def fail(self, job_id: str, error: str):
+        with self._transaction() as connection:
+            self._finish(connection, job_id, FAILED, error=error)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = (
+                self._get_connection()
+                .execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+                .fetchone()
+            )
+        if row is None or (row["expires_at"] and row["expires_at"] < time.time()):
+            return None
+        job = {
+            "job_id": row["id"],
+            "status": row["status"],
+            "filename": row["filename"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+        if row["result"] is not None:
+            job["entities"] = json.loads(row["result"])
+        if row["error"] is not None:
+            job["error"] = row["error"]
+        return job
+
+    def purge_expired(self) -> int:
+        with self._transaction() as connection:
+            expired = [
+                job_id
+                for (job_id,) in connection.execute(
+                    "SELECT id FROM jobs WHERE expires_at < ?", (time.time(),)
+                ).fetchall()
+            ]
+            connection.executemany(
+                "DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired]
+            )
+        return len(expired)
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            (depth,) = (
+                self._get_connection()
+                .execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,))
+                .fetchone()
+            )
+        return depth
+
+
+class JobRunner:
+    """
+    Pool of background threads that claim jobs from the store and process them.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        process: Callable[[str], List[Dict]],
+        concurrency: int = 1,
+        poll_seconds: float = 1.0,
+    ):
+        self.store = store
+        self.process = process
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self._active: set = set()
+        self._active_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            for index in range(self.concurrency)
+        ]
+        self._threads.append(
+            threading.Thread(target=self._maintain, name="job-maintenance", daemon=True)
+        )
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_once(self) -> bool:
+        """
+        Processes a single job, returns False when the queue was empty.
+        """
+        job_id = self.store.claim()
+        if job_id is None:
+            return False
+        with self._active_lock:
+            self._active.add(job_id)
+        try:
+            entities = self.process(self.store.payload_path(job_id))
+        except ValueError as e:
+            logger.error("Job failed.", extra={"job_id": job_id, "error": str(e)})
+            self.store.fail(job_id, str(e))
+        except Exception:
+            logger.exception("Unexpected error in job.", extra={"job_id": job_id})
+            self.store.fail(job_id, "Server error")
+        else:
+            self.store.complete(job_id, entities)
+        finally:
+            with self._active_lock:
+                self._active.discard(job_id)
+        return True
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                if not self.run_once():
+                    self._stop.wait(self.poll_seconds)
+            except Exception:
+                logger.exception("Error in job worker.")
+                self._stop.wait(self.poll_seconds)
+
+    def _maintain(self):
+        # Renews the leases of running jobs well before they run out.
+        interval = max(self.store.lease_seconds / 3, 0.1)
+        while not self._stop.wait(interval):
+            try:
+                with self._active_lock:
+                    active = list(self._active)
+                self.store.renew_leases(active)
+                self.store.purge_expired()
+            except Exception:
+                logger.exception("Error in job maintenance.")
+
+
+def extract_document(path: str) -> List[Dict]:
+    """
+    Runs the same pipeline as the extract endpoint on the PDF at path, sharing its cache.
+    """
+    with open(path, "rb") as payload:
+        digest = hashlib.file_digest(payload, "sha256").hexdigest()
+    cache_key = extraction_cache.key(digest, extraction_config_key())
+    entities = extraction_cache.get(cache_key)
+    if entities is not None:
+        return entities
+    text, page_starts, fingerprints = parse_document(path, get_parse_executor())
+    if not text.strip():
+        raise ValueError("No extractable text found in the PDF.")
+    entities = extract_entities(text, page_starts, fingerprints=fingerprints)
+    extraction_cache.put(cache_key, entities)
+    return entities
+
+
+job_store = JobStore(
+    jobs_dir,
+    max_attempts=jobs_max_attempts,
+    lease_seconds=jobs_lease_seconds,
+    result_ttl_seconds=jobs_result_ttl_seconds,
+)
+job_runner = JobRunner(job_store, extract_document, concurrency=jobs_concurrency)
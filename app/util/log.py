@@ -1,12 +1,132 @@
+import copy
 import logging
+import os
+import queue
+import random
+import weakref
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
 
 from pythonjsonlogger.json import JsonFormatter
 
+from app.util.metrics import LOG_RECORDS_DROPPED
+
+# Create a context variable to store the request_id per request
+request_id_ctx = ContextVar("request_id", default="N/A")
+
 # Configure Logger
 logger = logging.getLogger("app-logger")
 
-# Prevent adding multiple handlers
-if not logger.handlers:
+
+def get_request_id():
+    return request_id_ctx.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Adds the id of the current request to records logged without one. Runs in the
+    thread that logs, where the context of the request is set.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_ctx.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only the given share of the records of a level, such as {"INFO": 0.1} for one
+    INFO record in ten. Levels without a rate are always kept.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = {
+            logging.getLevelName(level): rate for level, rate in rates.items()
+        }
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno, 1.0)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        LOG_RECORDS_DROPPED.labels("sampled").inc()
+        return False
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Waits for room instead of failing when the queue is full at shutdown.
+        self.queue.put(self._sentinel)
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Hands records to a thread that formats and writes them with handler, so that a slow
+    log sink does not block the event loop. When the bounded queue is full the record
+    is dropped and counted. Every process drains its own queue, so a worker forked from
+    a process that already logged starts a thread of its own.
+    """
+
+    def __init__(self, handler: logging.Handler, queue_size: int):
+        super().__init__(queue.Queue(queue_size))
+        self.handler = handler
+        self._listener: Optional[QueueListener] = None
+        self._pid = None
+        _background_handlers.add(self)
+
+    def _reset(self):
+        # The queue of the parent, and the lock inside it, may be in use by its thread.
+        self.queue = queue.Queue(self.queue.maxsize)
+        self._listener = None
+        self._pid = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the message is merged with its arguments here, as they may still change.
+        # Formatting is left to the listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        # Runs under the lock of the handler, so the thread is started only once.
+        if self._pid != os.getpid():
+            self._listener = _Listener(
+                self.queue, self.handler, respect_handler_level=True
+            )
+            self._listener.start()
+            self._pid = os.getpid()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels("queue_full").inc()
+
+    def close(self):
+        # Writes the records still queued before the thread stops.
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+        _background_handlers.discard(self)
+        self.handler.close()
+        super().close()
+
+
+# Handlers that are not closed yet. A single fork hook resets them all, so replaced
+# handlers do not leave hooks behind.
+_background_handlers: "weakref.WeakSet[BackgroundHandler]" = weakref.WeakSet()
+
+
+def _reset_background_handlers():
+    for handler in list(_background_handlers):
+        handler._reset()
+
+
+os.register_at_fork(after_in_child=_reset_background_handlers)
+
+
+def _stream_handler() -> logging.Handler:
     log_handler = logging.StreamHandler()
 
     # Define JSON Formatter
@@ -15,7 +135,37 @@ if not logger.handlers:
     )
 
     log_handler.setFormatter(formatter)
-    logger.addHandler(log_handler)
+    return log_handler
+
+
+def configure_logging(
+    mode: str = "sync",
+    queue_size: int = 10000,
+    sample_rates: Optional[Dict[str, float]] = None,
+):
+    """
+    Replaces the handlers of the app logger. "sync" writes every record to stderr in the
+    thread that logs it, "queue" leaves that to a background thread. sample_rates keeps
+    only a share of the records of the given levels.
+    """
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    handler = _stream_handler()
+    if mode == "queue":
+        handler = BackgroundHandler(handler, queue_size)
+    for log_filter in list(logger.filters):
+        if isinstance(log_filter, SamplingFilter):
+            logger.removeFilter(log_filter)
+    if sample_rates:
+        logger.addFilter(SamplingFilter(sample_rates))
+    logger.addHandler(handler)
+
+
+# Prevent adding multiple handlers
+if not logger.handlers:
+    logger.addHandler(_stream_handler())
+    logger.addFilter(RequestIdFilter())
 
 
 def set_log_level(level):
@@ -0,0 +1,117 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Stages run from well under a millisecond (one page) to minutes (a whole document).
+STAGE_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle an HTTP request.",
+    ["method", "path", "status"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "extraction_stage_duration_seconds",
+    "Time spent in each stage of the extraction pipeline.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+BATCH_SIZE = Histogram(
+    "inference_batch_size",
+    "Number of windows in a model forward pass, by model.",
+    ["model"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+PADDING_RATIO = Histogram(
+    "inference_padding_ratio",
+    "Share of the tokens of a model forward pass that are padding, by model.",
+    ["model"],
+    buckets=(0.0, 0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9),
+)
+PAGES = Counter("extraction_pages_total", "PDF pages parsed.")
+TOKENS = Counter(
+    "extraction_tokens_total", "Tokens of parsed text sent to a model.", ["model"]
+)
+ENTITIES_KEPT = Counter(
+    "extraction_entities_kept_total", "Entities returned to clients."
+)
+ENTITIES_DROPPED = Counter(
+    "extraction_entities_dropped_total",
+    "Entities found by the model but filtered out.",
+    ["reason"],
+)
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total",
+    "Documents turned away by admission control, by reason.",
+    ["reason"],
+)
+CACHE_LOOKUPS = Counter(
+    "extraction_cache_lookups_total",
+    "Extraction cache lookups by cache (document, page) and result.",
+    ["cache", "result"],
+)
+PAGES_REUSED = Counter(
+    "extraction_pages_reused_total",
+    "Pages whose entities were taken from an earlier upload instead of the model.",
+)
+MODEL_LOADS = Counter("model_loads_total", "Models loaded into memory.", ["model"])
+MODEL_EVICTIONS = Counter(
+    "model_evictions_total", "Models unloaded to make room for others.", ["model"]
+)
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "Log records not written, by reason (queue_full, sampled).",
+    ["reason"],
+)
+
+
+@contextmanager
+def observe_stage(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+def render_metrics():
+    """
+    Returns the body and content type of the metrics page. Under gunicorn every process
+    writes its metrics to files in PROMETHEUS_MULTIPROC_DIR and they are added up here,
+    so one scrape covers all workers whichever of them answers it.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
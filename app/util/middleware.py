@@ -1,13 +1,13 @@
 import time
 import uuid
-from contextvars import ContextVar
 
-from fastapi import Request
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
 
-from app.util.log import logger
-
-# Create a context variable to store the request_id per request
-request_id_ctx = ContextVar("request_id", default="N/A")
+from app.util.config import max_batch_files, max_upload_bytes
+from app.util.log import logger, request_id_ctx
+from app.util.metrics import REQUEST_SECONDS
 
 
 async def add_request_id(request: Request, call_next):
@@ -19,6 +19,13 @@ async def add_request_id(request: Request, call_next):
     response = await call_next(request)
     end_time = time.time()
     total_time_in_seconds = end_time - start_time
+    # The route template keeps ids in paths from creating a series per request.
+    route = request.scope.get("route")
+    REQUEST_SECONDS.labels(
+        request.method,
+        route.path if route is not None else "unmatched",
+        response.status_code,
+    ).observe(total_time_in_seconds)
     logger.info(
         "Request finished",
         extra={
@@ -28,8 +35,45 @@ async def add_request_id(request: Request, call_next):
     )
     response.headers["X-Request-ID"] = request_id
     response.headers["X-Total-Time-In-Seconds"] = str(total_time_in_seconds)
+    queue_wait_seconds = getattr(request.state, "queue_wait_seconds", None)
+    if queue_wait_seconds is not None:
+        response.headers["X-Queue-Wait-Time-In-Seconds"] = str(queue_wait_seconds)
     return response
 
 
-def get_request_id():
-    return request_id_ctx.get()
+class UploadSizeLimit:
+    """
+    Rejects request bodies larger than the uploads of the route, with the slack for the
+    multipart framing around files of exactly MAX_UPLOAD_BYTES. A body that announces
+    its length is rejected from its headers, before it is read. A chunked body has no
+    length, so its bytes are counted as they arrive and it is cut off at the limit.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        files = max_batch_files if scope["path"].endswith("/batch") else 1
+        limit = files * (max_upload_bytes + 64 * 1024)
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse(
+                status_code=413, content={"detail": "File too large."}
+            )
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised while the route reads the form, and answered as its errors are.
+                    raise HTTPException(status_code=413, detail="File too large.")
+            return message
+
+        await self.app(scope, receive_limited, send)
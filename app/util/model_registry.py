@@ -0,0 +1,160 @@
+import gc
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from app.util.log import logger
+from app.util.metrics import MODEL_EVICTIONS, MODEL_LOADS
+
+
+class UnknownModelError(ValueError):
+    pass
+
+
+class ModelRegistry:
+    """
+    Loads the models named in names on demand and keeps at most max_resident of them,
+    together at most max_bytes when that is set, in memory. Every user of a model holds
+    a reference to it with acquire and release, or lease, and only models nobody holds
+    are unloaded, least recently used first. Pinned models are never unloaded. When all
+    resident models are in use, a new one is loaded anyway and the limits are restored
+    as soon as models are released.
+    """
+
+    def __init__(
+        self,
+        names: List[str],
+        load: Callable[[str], Any],
+        max_resident: int = 1,
+        max_bytes: int = 0,
+        estimate_bytes: Optional[Callable[[str], int]] = None,
+        pinned: Iterable[str] = (),
+    ):
+        self.names = list(dict.fromkeys(names))
+        self.default = self.names[0]
+        self.max_resident = max(1, max_resident)
+        self.max_bytes = max_bytes
+        self.pinned = set(pinned)
+        self._load = load
+        self._estimate_bytes = estimate_bytes or (lambda name: 0)
+        self._condition = threading.Condition()
+        # Resident models, least recently used first.
+        self._models: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._references: Dict[str, int] = {}
+        self._loading: set = set()
+        self._loads = 0
+        self._evictions = 0
+
+    def install(self, name: str, model):
+        """
+        Makes an already built model resident, such as a stub in benchmarks.
+        """
+        with self._condition:
+            self._models[name] = model
+            self._models.move_to_end(name)
+            self._sizes[name] = 0
+            self._condition.notify_all()
+
+    def acquire(self, name: Optional[str] = None):
+        """
+        Returns the model, loading it first if it is not resident, and holds it until
+        release is called. Concurrent callers wait for a single load.
+        """
+        name = name or self.default
+        if name not in self.names:
+            raise UnknownModelError(f"Unknown model '{name}'.")
+        with self._condition:
+            while name in self._loading:
+                self._condition.wait()
+            self._references[name] = self._references.get(name, 0) + 1
+            if name in self._models:
+                self._models.move_to_end(name)
+                return self._models[name]
+            self._loading.add(name)
+            size = self._estimate_bytes(name)
+            evicted = self._evict(extra_models=1, extra_bytes=size)
+        self._collect(evicted)
+        try:
+            model = self._load(name)
+        except BaseException:
+            with self._condition:
+                self._references[name] -= 1
+                self._loading.discard(name)
+                self._condition.notify_all()
+            raise
+        with self._condition:
+            self._models[name] = model
+            self._sizes[name] = size
+            self._loads += 1
+            self._loading.discard(name)
+            self._condition.notify_all()
+        MODEL_LOADS.labels(name).inc()
+        return model
+
+    def release(self, name: Optional[str] = None):
+        name = name or self.default
+        with self._condition:
+            self._references[name] -= 1
+            evicted = self._evict()
+        self._collect(evicted)
+
+    @contextmanager
+    def lease(self, name: Optional[str] = None) -> Iterator[Any]:
+        model = self.acquire(name)
+        try:
+            yield model
+        finally:
+            self.release(name)
+
+    def get(self, name: Optional[str] = None):
+        """
+        Returns the model, loading it if needed, without holding it. Only safe for pinned
+        models, which are never unloaded.
+        """
+        model = self.acquire(name)
+        self.release(name)
+        return model
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {
+                "resident": list(self._models),
+                "in_use": {
+                    name: count for name, count in self._references.items() if count
+                },
+                "bytes": sum(self._sizes.values()),
+                "max_resident": self.max_resident,
+                "max_bytes": self.max_bytes,
+                "loads": self._loads,
+                "evictions": self._evictions,
+            }
+
+    def _evict(self, extra_models: int = 0, extra_bytes: int = 0) -> List[Any]:
+        # Runs under the condition. Returns the unloaded models so that they are
+        # dropped outside of it.
+        evicted = []
+        for name in list(self._models):
+            over_count = len(self._models) + extra_models > self.max_resident
+            over_bytes = (
+                self.max_bytes
+                and sum(self._sizes.values()) + extra_bytes > self.max_bytes
+            )
+            if not over_count and not over_bytes:
+                break
+            if name in self.pinned or self._references.get(name, 0):
+                continue
+            evicted.append(self._models.pop(name))
+            self._sizes.pop(name, None)
+            self._evictions += 1
+            MODEL_EVICTIONS.labels(name).inc()
+            logger.info(f"Unloaded the {name} model.")
+        return evicted
+
+    @staticmethod
+    def _collect(evicted: List[Any]):
+        if evicted:
+            evicted.clear()
+            # Pipelines hold reference cycles, collect them so the weights are freed now.
+            gc.collect()
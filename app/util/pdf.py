@@ -1,23 +1,127 @@
+import hashlib
 import io
+import mmap
+import time
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple, Union
 
 import pypdf
 
-from app.util.log import logger
-from app.util.middleware import get_request_id
+from app.util.log import get_request_id, logger
+from app.util.metrics import PAGES, STAGE_SECONDS
 
+# Number of pages extracted by a single task when pages are spread across workers.
+PAGES_PER_TASK = 8
 
-def parse_pdf(file_bytes: bytes) -> str:
+# The bytes of a PDF, or the path of a PDF file.
+PdfSource = Union[bytes, str]
+
+
+@contextmanager
+def open_pdf(source: PdfSource) -> Iterator[pypdf.PdfReader]:
+    """
+    Opens a PDF for reading. A file is memory-mapped instead of read, so pypdf only
+    pages in the parts it parses, and a path rather than the whole document is what
+    gets sent to parsing workers.
+    """
+    if isinstance(source, bytes):
+        yield pypdf.PdfReader(io.BytesIO(source))
+        return
+    with open(source, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            yield pypdf.PdfReader(view)
+
+
+def page_fingerprint(page, text: str) -> str:
+    """
+    Hashes the decoded content stream of the page together with the text extracted from
+    it, so that an unchanged page of a revised document can be recognised.
+    """
+    digest = hashlib.sha256()
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+def _extract_text(page, fingerprint: bool) -> Tuple[str, float, Optional[str]]:
+    start = time.perf_counter()
+    text = page.extract_text()
+    digest = page_fingerprint(page, text) if fingerprint else None
+    return text, time.perf_counter() - start, digest
+
+
+def extract_page_range(
+    source: PdfSource, start: int, stop: int, fingerprints: bool = False
+) -> List[Tuple[str, float, Optional[str]]]:
+    """
+    Extracts the text of pages [start, stop) along with the time each page took, and
+    its fingerprint when asked for. Runs in a parsing worker process.
+    """
+    with open_pdf(source) as reader:
+        return [
+            _extract_text(reader.pages[index], fingerprints)
+            for index in range(start, stop)
+        ]
+
+
+def _iter_page_texts(
+    source: PdfSource,
+    executor: Optional[Executor],
+    pages_per_task: int,
+    fingerprints: bool,
+) -> Iterator[Tuple[str, float, Optional[str]]]:
+    with open_pdf(source) as reader:
+        if executor is None:
+            for index, page in enumerate(reader.pages):
+                if index % pages_per_task == 0:
+                    # Drops the objects pypdf cached for the pages before, such as
+                    # scanned images, so memory does not grow with the document.
+                    reader.resolved_objects.clear()
+                yield _extract_text(page, fingerprints)
+            return
+        page_count = len(reader.pages)
+
+    futures = [
+        executor.submit(
+            extract_page_range,
+            source,
+            start,
+            min(start + pages_per_task, page_count),
+            fingerprints,
+        )
+        for start in range(0, page_count, pages_per_task)
+    ]
+    try:
+        # Ranges finish in any order but are handed out in page order.
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _iter_page_records(
+    source: PdfSource,
+    executor: Optional[Executor] = None,
+    pages_per_task: int = PAGES_PER_TASK,
+    fingerprints: bool = False,
+) -> Iterator[Tuple[int, str, int, Optional[str]]]:
     try:
-        reader = pypdf.PdfReader(io.BytesIO(file_bytes))
-        text = ""
-        # Iterate through each page of the PDF
-        for page in reader.pages:
-            # Extract text from the current page
-            page_text = page.extract_text()
+        char_offset = 0
+        for page_number, (page_text, seconds, fingerprint) in enumerate(
+            _iter_page_texts(source, executor, pages_per_task, fingerprints), start=1
+        ):
+            # Timed where the page was parsed, which may be another process.
+            STAGE_SECONDS.labels("parse_page").observe(seconds)
+            PAGES.inc()
             # If text is found, append it to the result with a newline
-            if page_text:
-                text += page_text + "\n"
-        return text
+            text = page_text + "\n" if page_text else ""
+            yield page_number, text, char_offset, fingerprint
+            char_offset += len(text)
     except Exception as e:
         logger.error(
             "No content found",
@@ -26,3 +130,66 @@ def parse_pdf(file_bytes: bytes) -> str:
             },
         )
         raise ValueError("Failed to parse PDF file.") from e
+
+
+def iter_pages(
+    source: PdfSource,
+    executor: Optional[Executor] = None,
+    pages_per_task: int = PAGES_PER_TASK,
+) -> Iterator[Tuple[int, str, int]]:
+    """
+    Yields (page_number, text, char_offset) for every page as soon as it is extracted.
+    Page numbers start at 1 and char_offset is the position of the page in the text
+    returned by parse_pdf, so joining the texts gives exactly that string. When an
+    executor is given, page ranges are extracted on it in parallel.
+    """
+    for page_number, text, char_offset, _ in _iter_page_records(
+        source, executor, pages_per_task
+    ):
+        yield page_number, text, char_offset
+
+
+def count_pages(source: PdfSource) -> int:
+    """
+    Reads the page count from the page tree without extracting any text.
+    """
+    try:
+        with open_pdf(source) as reader:
+            return len(reader.pages)
+    except Exception as e:
+        raise ValueError("Failed to parse PDF file.") from e
+
+
+def parse_pdf_pages(
+    source: PdfSource, executor: Optional[Executor] = None
+) -> Tuple[str, List[int]]:
+    """
+    Returns the text of the PDF, as parse_pdf does, and the offset in that text at
+    which each page starts.
+    """
+    texts, page_starts = [], []
+    for _, text, char_offset in iter_pages(source, executor):
+        texts.append(text)
+        page_starts.append(char_offset)
+    return "".join(texts), page_starts
+
+
+def parse_pdf_fingerprinted(
+    source: PdfSource, executor: Optional[Executor] = None
+) -> Tuple[str, List[int], List[str]]:
+    """
+    Returns the text of the PDF and the offsets at which its pages start, as
+    parse_pdf_pages does, and the fingerprint of every page, see page_fingerprint.
+    """
+    texts, page_starts, fingerprints = [], [], []
+    for _, text, char_offset, fingerprint in _iter_page_records(
+        source, executor, fingerprints=True
+    ):
+        texts.append(text)
+        page_starts.append(char_offset)
+        fingerprints.append(fingerprint)
+    return "".join(texts), page_starts, fingerprints
+
+
+def parse_pdf(source: PdfSource, executor: Optional[Executor] = None) -> str:
+    return "".join(text for _, text, _ in iter_pages(source, executor))
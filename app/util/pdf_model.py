@@ -1,29 +1,174 @@
 import os
+from itertools import islice
 
-from transformers import AutoModelForTokenClassification, AutoTokenizer, pipeline
+from transformers import AutoTokenizer, pipeline
 
+from app.util.batching import plan_length_batches
+from app.util.chunking import merge_window_entities, plan_windows
+from app.util.inference_backend import TORCH, load_token_classification_model
 from app.util.log import logger
+from app.util.metrics import BATCH_SIZE, PADDING_RATIO, TOKENS, observe_stage
+from app.util.token_classification import EntityPipeline
+
+
+def model_path(model_dir: str) -> str:
+    """
+    Resolves the directory of a model under models/, or an absolute path as is.
+    """
+    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+    return os.path.join(base_dir, "models", model_dir)
+
+
+def instrument_forward(model, name: str):
+    """
+    Times every forward pass of the model, which the pipeline runs once per batch, and
+    records its size and how much of it is padding.
+    """
+    forward = model.forward
+
+    def timed_forward(*args, **kwargs):
+        input_ids = kwargs.get("input_ids")
+        if input_ids is not None:
+            BATCH_SIZE.labels(name).observe(len(input_ids))
+        attention_mask = kwargs.get("attention_mask")
+        if attention_mask is not None and len(attention_mask):
+            slots = attention_mask.shape[0] * attention_mask.shape[1]
+            PADDING_RATIO.labels(name).observe(1 - int(attention_mask.sum()) / slots)
+        with observe_stage("forward"):
+            return forward(*args, **kwargs)
+
+    model.forward = timed_forward
+    return model
 
 
 class PDFModel:
-    def __init__(self, model_dir: str, task: str, aggregation_strategy, device):
-        # Resolve absolute path for models/
-        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
-        model_path = os.path.join(base_dir, "models", model_dir)
+    def __init__(
+        self,
+        model_dir: str,
+        task: str,
+        aggregation_strategy,
+        device,
+        max_tokens: int = None,
+        overlap_tokens: int = 64,
+        batch_size: int = 8,
+        backend: str = TORCH,
+        keep_labels=None,
+        min_score: float = 0.0,
+        batch_tokens: int = 0,
+    ):
+        path = model_path(model_dir)
         try:
-            tokenizer = AutoTokenizer.from_pretrained(model_path)
-            model = AutoModelForTokenClassification.from_pretrained(model_path)
+            tokenizer = AutoTokenizer.from_pretrained(path)
+            model = instrument_forward(
+                load_token_classification_model(path, backend), model_dir
+            )
             self.pipe = pipeline(
                 task,
                 model=model,
                 tokenizer=tokenizer,
                 aggregation_strategy=aggregation_strategy,
                 device=device,
+                # Drops unwanted entities before they are turned into dicts.
+                pipeline_class=EntityPipeline,
+                keep_labels=keep_labels,
+                min_score=min_score,
+            )
+            logger.info(
+                f"Successfully loaded the {path} model with the {backend} backend."
             )
-            logger.info(f"Successfully loaded the {model_path} model.")
         except Exception as e:
-            logger.error(f"Error loading {model_path} model: {e}")
+            logger.error(f"Error loading {path} model: {e}")
             raise e
+        self.name = model_dir
+        self.tokenizer = tokenizer
+        self.backend = backend
+        # Leave room for the special tokens ([CLS], [SEP]) the pipeline adds to every window.
+        model_max_tokens = (
+            min(tokenizer.model_max_length, model.config.max_position_embeddings)
+            - tokenizer.num_special_tokens_to_add()
+        )
+        self.max_tokens = min(max_tokens or model_max_tokens, model_max_tokens)
+        self.overlap_tokens = overlap_tokens
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+
+    def split_text(self, text):
+        """
+        Splits the text into overlapping token windows that fit into the model.
+        """
+        with observe_stage("tokenize"):
+            encoding = self.tokenizer(
+                text, add_special_tokens=False, return_offsets_mapping=True
+            )
+        TOKENS.labels(self.name).inc(len(encoding["offset_mapping"]))
+        return plan_windows(
+            text,
+            encoding["offset_mapping"],
+            encoding.word_ids(),
+            self.max_tokens,
+            self.overlap_tokens,
+        )
+
+    def infer(self, texts, batch_size=None, lengths=None):
+        """
+        Runs the texts through the pipeline in padded batches, one result list per text
+        in the order of texts. With batch_tokens, texts are grouped by token length into
+        batches of at most batch_tokens tokens once padded, see plan_length_batches, and
+        batch_size is ignored. lengths are the token counts of the texts without special
+        tokens, the texts are tokenized to count them when they are not given.
+        """
+        if not self.batch_tokens or len(texts) < 2:
+            return self.pipe(texts, batch_size=batch_size or self.batch_size)
+        if lengths is None:
+            lengths = [
+                len(input_ids)
+                for input_ids in self.tokenizer(texts, add_special_tokens=False)[
+                    "input_ids"
+                ]
+            ]
+        special_tokens = self.tokenizer.num_special_tokens_to_add()
+        results = [None] * len(texts)
+        for batch in plan_length_batches(
+            [length + special_tokens for length in lengths], self.batch_tokens
+        ):
+            batch_results = self.pipe(
+                [texts[index] for index in batch], batch_size=len(batch)
+            )
+            for index, result in zip(batch, batch_results):
+                results[index] = result
+        return results
+
+    def extract_entities_batch(self, texts, infer=None):
+        """
+        Extracts entities from several texts at once. The windows of all texts go through
+        the model in shared batches. Returns one entity list per text.
+        """
+        text_windows = [self.split_text(text) for text in texts]
+        window_texts = [
+            window.slice(text)
+            for text, windows in zip(texts, text_windows)
+            for window in windows
+        ]
+        if not window_texts:
+            results = iter([])
+        elif infer is not None:
+            # Lets a caller, such as the batch scheduler, decide how windows are batched.
+            results = iter(infer(window_texts))
+        else:
+            results = iter(
+                self.infer(
+                    window_texts,
+                    lengths=[
+                        window.token_end - window.token_start
+                        for windows in text_windows
+                        for window in windows
+                    ],
+                )
+            )
+        return [
+            merge_window_entities(windows, list(islice(results, len(windows))))
+            for windows in text_windows
+        ]
 
-    def extract_entities(self, text):
-        return self.pipe(text)
+    def extract_entities(self, text, infer=None):
+        return self.extract_entities_batch([text], infer)[0]
@@ -1,71 +1,614 @@
-from functools import lru_cache
+import json
+import re
+import threading
+from concurrent.futures import Executor
+from functools import partial
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
+import numpy as np
+
+from app.util.batching import BatchScheduler
+from app.util.cache import page_cache
 from app.util.config import (
     KEEP_LABELS,
     MIN_MODEL_ACCURACY,
+    aggregate_max_contexts,
+    available_models,
+    batch_max_size,
+    batch_max_wait_ms,
+    batch_scheduler_enabled,
+    chunk_max_tokens,
+    chunk_overlap_tokens,
+    context_chars,
+    context_mode,
     huggingface_aggregation_strategy,
     huggingface_device,
     huggingface_model,
     huggingface_task,
+    incremental_extraction,
+    inference_backend,
+    inference_batch_size,
+    inference_batch_tokens,
+    model_max_resident,
+    model_memory_budget_bytes,
 )
 from app.util.log import logger
-from app.util.pdf_model import PDFModel
+from app.util.metrics import (
+    ENTITIES_DROPPED,
+    ENTITIES_KEPT,
+    PAGES_REUSED,
+    observe_stage,
+)
+from app.util.model_registry import ModelRegistry
+from app.util.pdf import PdfSource, parse_pdf_fingerprinted, parse_pdf_pages
+from app.util.text_index import TextIndex
 
-pdf_model = PDFModel(
-    huggingface_model,
-    huggingface_task,
-    huggingface_aggregation_strategy,
-    huggingface_device,
+# Lifecycle of the model in this process.
+NOT_LOADED = "not_loaded"
+LOADING = "loading"
+LOADED = "loaded"
+WARMING_UP = "warming_up"
+READY = "ready"
+FAILED = "failed"
+
+_model_state = NOT_LOADED
+
+
+def _extraction_config(model: str) -> Dict:
+    # Identifies the model and the settings behind a cached extraction result.
+    return {
+        "model": model,
+        "task": huggingface_task,
+        "aggregation_strategy": huggingface_aggregation_strategy,
+        "backend": inference_backend,
+        "max_tokens": chunk_max_tokens,
+        "overlap_tokens": chunk_overlap_tokens,
+        "keep_labels": sorted(KEEP_LABELS),
+        "min_model_accuracy": MIN_MODEL_ACCURACY,
+        "context_mode": context_mode,
+        "context_chars": context_chars,
+        "page_numbers": True,
+    }
+
+
+def extraction_config_key(model: Optional[str] = None, aggregate: bool = False) -> str:
+    """
+    Returns the key of the settings behind a result of the model, the default model when
+    none is given, to cache results under.
+    """
+    config = _extraction_config(model or huggingface_model)
+    if aggregate:
+        config["aggregate_max_contexts"] = aggregate_max_contexts
+    return json.dumps(config, sort_keys=True)
+
+
+def page_config_key(model: Optional[str] = None) -> str:
+    """
+    Returns the key of the settings behind the entities stored for single pages.
+    """
+    return json.dumps(
+        {**_extraction_config(model or huggingface_model), "unit": "page"},
+        sort_keys=True,
+    )
+
+
+def get_model_state() -> str:
+    """
+    Returns the state of the default model, the only one loaded at startup.
+    """
+    return _model_state
+
+
+def _load_model(name: str):
+    global _model_state
+    default = name == huggingface_model
+    if default:
+        _model_state = LOADING
+    try:
+        # Imported here so that importing this module does not load torch.
+        from app.util.pdf_model import PDFModel
+
+        model = PDFModel(
+            name,
+            huggingface_task,
+            huggingface_aggregation_strategy,
+            huggingface_device,
+            max_tokens=chunk_max_tokens,
+            overlap_tokens=chunk_overlap_tokens,
+            batch_size=inference_batch_size,
+            backend=inference_backend,
+            keep_labels=KEEP_LABELS,
+            min_score=MIN_MODEL_ACCURACY,
+            batch_tokens=inference_batch_tokens,
+        )
+    except Exception:
+        if default:
+            _model_state = FAILED
+        raise
+    if default:
+        _model_state = LOADED
+    return model
+
+
+def _estimate_model_bytes(name: str) -> int:
+    from app.util.inference_backend import weight_bytes
+    from app.util.pdf_model import model_path
+
+    return weight_bytes(model_path(name), inference_backend)
+
+
+# Models requests may select, loaded on first use. The default model is never unloaded.
+model_registry = ModelRegistry(
+    available_models,
+    _load_model,
+    max_resident=model_max_resident,
+    max_bytes=model_memory_budget_bytes,
+    estimate_bytes=_estimate_model_bytes,
+    pinned=[huggingface_model],
 )
 
 
-def get_context(text: str, start: int, end: int, window: int = 32) -> str:
+def set_pdf_model(model):
     """
-    Extracts a snippet of text around the entity.
+    Installs an already built default model, such as a stub in benchmarks.
     """
-    # Calculate the starting index ensuring it doesn't go below 0.
-    snippet_start = max(0, start - window)
-    # Calculate the ending index ensuring it doesn't exceed the length of the text.
-    snippet_end = min(len(text), end + window)
-    return text[snippet_start:snippet_end]
+    global _model_state
+    model_registry.install(huggingface_model, model)
+    _model_state = LOADED
 
 
-@lru_cache(maxsize=128)
-def extract_entities_cached(text: str):
+def get_pdf_model():
     """
-    Caches the entity extraction result for repeated text inputs.
+    Returns the default model, loading it on first use. Concurrent callers wait for one
+    load.
     """
-    return pdf_model.extract_entities(text)
+    return model_registry.get(huggingface_model)
 
 
-def extract_entities(text: str):
+def warm_up_model(sequence_lengths: List[int]):
     """
-    Extracts entities using the Hugging Face pipeline and provides context.
-    Returns a list of dictionaries with keys: entity, context, start, and end.
+    Runs full batches of windows of every length through the model, so that kernels,
+    thread pools and allocator arenas are set up before the first request.
     """
+    global _model_state
+    model = get_pdf_model()
+    _model_state = WARMING_UP
+    for length in sequence_lengths:
+        with observe_stage("warm_up"):
+            model.extract_entities_batch(
+                [" ".join(["patient"] * min(length, model.max_tokens))]
+                * model.batch_size
+            )
+        logger.info(f"Warmed up the model with {length} token windows.")
+    _model_state = READY
+
+
+def prepare_model(sequence_lengths: List[int]):
+    """
+    Loads and warms up the model, recording a failure in the model state.
+    """
+    global _model_state
     try:
-        # Extract entities from the text using the cached extraction function.
-        ner_results = extract_entities_cached(text)
+        warm_up_model(sequence_lengths)
+    except Exception:
+        logger.exception("Error while preparing the model.")
+        _model_state = FAILED
+
+
+def _infer(name: str, texts: List[str], batch_size=None):
+    with model_registry.lease(name) as model:
+        return model.infer(texts, batch_size=batch_size)
+
+
+# Share model forward passes between concurrent requests when enabled, one per model.
+_batch_schedulers: Dict[str, BatchScheduler] = {}
+_batch_schedulers_lock = threading.Lock()
+
+
+def get_batch_scheduler(model: Optional[str] = None) -> Optional[BatchScheduler]:
+    """
+    Returns the batch scheduler of the model, the default model when none is given, or
+    None when batch scheduling is disabled.
+    """
+    if not batch_scheduler_enabled:
+        return None
+    name = model or huggingface_model
+    with _batch_schedulers_lock:
+        if name not in _batch_schedulers:
+            _batch_schedulers[name] = BatchScheduler(
+                partial(_infer, name), batch_max_size, batch_max_wait_ms
+            )
+        return _batch_schedulers[name]
+
+
+def batch_scheduler_stats() -> Optional[Dict]:
+    if not batch_scheduler_enabled:
+        return None
+    with _batch_schedulers_lock:
+        schedulers = dict(_batch_schedulers)
+    return {name: scheduler.stats() for name, scheduler in schedulers.items()}
+
+
+def predict_entities_batch(texts: List[str], model: Optional[str] = None):
+    """
+    Runs the model, the default model when none is given, over several texts in shared
+    batches, through the batch scheduler when it is enabled. The model is held until
+    all texts are done, so it is not unloaded in the meantime.
+    """
+    batch_scheduler = get_batch_scheduler(model)
+    with model_registry.lease(model) as pdf_model:
+        if batch_scheduler is not None:
+            return pdf_model.extract_entities_batch(texts, infer=batch_scheduler.run)
+        return pdf_model.extract_entities_batch(texts)
+
+
+def predict_entities(text: str, model: Optional[str] = None):
+    """
+    Runs the model over the text, through the batch scheduler when it is enabled.
+    """
+    return predict_entities_batch([text], model)[0]
+
+
+# Words are counted instead of tokens where a changed page reaches into its neighbours.
+# Every word is at least one token, so this covers at least the chunk overlap.
+_WORD = re.compile(r"\S+")
+
+
+def _reach_before(text: str, position: int, floor: int) -> int:
+    # Start of the chunk_overlap_tokens words before position, not before floor.
+    if not chunk_overlap_tokens:
+        return position
+    starts = [match.start() for match in _WORD.finditer(text, floor, position)]
+    return (
+        starts[-chunk_overlap_tokens] if len(starts) > chunk_overlap_tokens else floor
+    )
+
+
+def _reach_after(text: str, position: int, ceiling: int) -> int:
+    # End of the chunk_overlap_tokens words after position, not after ceiling.
+    if not chunk_overlap_tokens:
+        return position
+    for count, match in enumerate(_WORD.finditer(text, position, ceiling), start=1):
+        if count == chunk_overlap_tokens:
+            return match.end()
+    return ceiling
+
+
+def _page_entities(results: Iterable[Dict], start: int, end: int) -> List[Dict]:
+    # Model results starting on the page [start, end), with offsets on the page.
+    return [
+        {
+            "word": result["word"],
+            "entity_group": result["entity_group"],
+            "score": float(result["score"]),
+            "start": int(result["start"]) - start,
+            "end": int(result["end"]) - start,
+        }
+        for result in results
+        if start <= result["start"] < end
+    ]
+
+
+def predict_revised_entities(
+    texts: List[str],
+    page_starts: List[Sequence[int]],
+    fingerprints: List[Sequence[str]],
+    model: Optional[str] = None,
+) -> List[List[Dict]]:
+    """
+    Runs the model, as predict_entities_batch does, over the pages of each text whose
+    fingerprint is not in the page cache, and takes the results of the other pages from
+    it, moved to where the page is in the text. Every run of changed pages goes through
+    the model together with the chunk overlap of its neighbours, and entities reaching
+    from an unchanged page into a changed one are taken from the new run. The results
+    of the changed pages are stored for the next revision of the document.
+    """
+    config_key = page_config_key(model)
+    plans, spans = [], []
+    for index, (text, starts, text_fingerprints) in enumerate(
+        zip(texts, page_starts, fingerprints)
+    ):
+        ends = list(starts[1:]) + [len(text)]
+        keys = [
+            page_cache.key(fingerprint, config_key) for fingerprint in text_fingerprints
+        ]
+        # Pages without text need neither the model nor the cache.
+        has_text = [bool(text[start:end].strip()) for start, end in zip(starts, ends)]
+        stored = [
+            page_cache.get(key) if page_has_text else []
+            for key, page_has_text in zip(keys, has_text)
+        ]
+        PAGES_REUSED.inc(
+            sum(
+                page_has_text and page_entities is not None
+                for page_has_text, page_entities in zip(has_text, stored)
+            )
+        )
+        page = 0
+        while page < len(stored):
+            if stored[page] is not None:
+                page += 1
+                continue
+            first = page
+            while page < len(stored) and stored[page] is None:
+                page += 1
+            last = page - 1
+            floor = starts[first - 1] if first else starts[first]
+            ceiling = ends[last + 1] if last + 1 < len(ends) else ends[last]
+            spans.append(
+                (
+                    index,
+                    first,
+                    last,
+                    _reach_before(text, starts[first], floor),
+                    _reach_after(text, ends[last], ceiling),
+                )
+            )
+        plans.append((starts, ends, keys, stored))
+
+    span_results = (
+        predict_entities_batch(
+            [texts[index][start:end] for index, _, _, start, end in spans], model
+        )
+        if spans
+        else []
+    )
+
+    predictions: List[List[Dict]] = []
+    for starts, ends, _, stored in plans:
         entities = []
-        # Iterate through each entity result.
-        for entity in ner_results:
-            score = entity.get("score", 0.0)
-            label = entity.get("entity_group", None)
-            start = entity["start"]
-            end = entity["end"]
-            if label in KEEP_LABELS and score >= MIN_MODEL_ACCURACY:
-                # Retrieve a snippet of context around the entity.
-                context_snippet = get_context(text, start, end)
-                # Append the entity data to the list.
+        for page, page_entities in enumerate(stored):
+            if not page_entities:
+                continue
+            # The next page changed, so entities reaching into it are found again.
+            next_changed = page + 1 < len(stored) and stored[page + 1] is None
+            for entity in page_entities:
+                if next_changed and entity["end"] + starts[page] > ends[page]:
+                    continue
                 entities.append(
-                    {
-                        "entity": entity["word"],
-                        "context": context_snippet,
-                        "start": start,
-                        "end": end,
-                    }
+                    dict(
+                        entity,
+                        start=entity["start"] + starts[page],
+                        end=entity["end"] + starts[page],
+                    )
                 )
-        return entities
+        predictions.append(entities)
+    for (index, first, last, span_start, _), results in zip(spans, span_results):
+        starts, ends, keys, _ = plans[index]
+        run_start, run_end = starts[first], ends[last]
+        shifted = [
+            dict(
+                result,
+                start=result["start"] + span_start,
+                end=result["end"] + span_start,
+            )
+            for result in results
+        ]
+        predictions[index].extend(
+            result
+            for result in shifted
+            if run_start <= result["start"] < run_end
+            or result["start"] < run_start < result["end"]
+        )
+        for page in range(first, last + 1):
+            page_cache.put(
+                keys[page], _page_entities(shifted, starts[page], ends[page])
+            )
+    for entities in predictions:
+        entities.sort(key=lambda entity: entity["start"])
+    return predictions
+
+
+def aggregate_entities(
+    text: str,
+    kept: List[Dict],
+    starts: np.ndarray,
+    ends: np.ndarray,
+    index: TextIndex,
+) -> List[Dict]:
+    """
+    Groups the occurrences of each entity by its lower-cased text and label, in order of
+    first occurrence. Contexts are only cut for the first aggregate_max_contexts
+    occurrences of every group.
+    """
+    groups: Dict[Tuple[str, str], List[int]] = {}
+    for position, entity in enumerate(kept):
+        key = (" ".join(entity["word"].lower().split()), entity["entity_group"])
+        groups.setdefault(key, []).append(position)
+    with_context = [
+        position
+        for positions in groups.values()
+        for position in positions[:aggregate_max_contexts]
+    ]
+    snippet_starts, snippet_ends = index.context_bounds(
+        starts[with_context], ends[with_context], context_mode, context_chars
+    )
+    contexts = {
+        position: text[snippet_start:snippet_end]
+        for position, snippet_start, snippet_end in zip(
+            with_context, snippet_starts.tolist(), snippet_ends.tolist()
+        )
+    }
+    starts, ends = starts.tolist(), ends.tolist()
+    pages = index.pages(starts).tolist() if index.page_starts is not None else None
+    aggregated = []
+    for (_, label), positions in groups.items():
+        group = {
+            "entity": kept[positions[0]]["word"],
+            "label": label,
+            "count": len(positions),
+            "offsets": [[starts[position], ends[position]] for position in positions],
+            "contexts": [
+                contexts[position] for position in positions[:aggregate_max_contexts]
+            ],
+        }
+        if pages is not None:
+            group["pages"] = sorted({pages[position] for position in positions})
+        aggregated.append(group)
+    return aggregated
+
+
+def build_entities(
+    text: str,
+    ner_results,
+    page_starts: Optional[Sequence[int]] = None,
+    aggregate: bool = False,
+) -> List[Dict]:
+    """
+    Keeps the relevant entities found by the model and adds their context, and their
+    page when the offsets at which the pages of the text start are given. With aggregate
+    the occurrences of each entity are grouped, see aggregate_entities.
+    """
+    with observe_stage("postprocess"):
+        # PDFModel already dropped these on the model output, other models such as
+        # the benchmark stub may not have.
+        kept = []
+        for entity in ner_results:
+            if entity.get("entity_group") not in KEEP_LABELS:
+                ENTITIES_DROPPED.labels("label").inc()
+            elif entity.get("score", 0.0) < MIN_MODEL_ACCURACY:
+                ENTITIES_DROPPED.labels("score").inc()
+            else:
+                kept.append(entity)
+        ENTITIES_KEPT.inc(len(kept))
+        starts = np.fromiter((entity["start"] for entity in kept), int, len(kept))
+        ends = np.fromiter((entity["end"] for entity in kept), int, len(kept))
+        # The boundaries are found once, then looked up for all entities at once.
+        index = TextIndex(text, page_starts)
+        if aggregate:
+            return aggregate_entities(text, kept, starts, ends, index)
+        snippet_starts, snippet_ends = index.context_bounds(
+            starts, ends, context_mode, context_chars
+        )
+        entities = [
+            {
+                "entity": entity["word"],
+                "context": text[snippet_start:snippet_end],
+                "start": entity["start"],
+                "end": entity["end"],
+            }
+            for entity, snippet_start, snippet_end in zip(
+                kept, snippet_starts.tolist(), snippet_ends.tolist()
+            )
+        ]
+        if page_starts is not None:
+            for entity, page in zip(entities, index.pages(starts).tolist()):
+                entity["page"] = page
+    return entities
+
+
+def parse_document(
+    source: PdfSource, executor: Optional[Executor] = None
+) -> Tuple[str, List[int], Optional[List[str]]]:
+    """
+    Returns the text of the PDF, the offsets at which its pages start and, only when
+    incremental extraction is enabled and will use them, the fingerprints of its pages.
+    """
+    if incremental_extraction:
+        return parse_pdf_fingerprinted(source, executor)
+    text, page_starts = parse_pdf_pages(source, executor)
+    return text, page_starts, None
+
+
+def extract_entities(
+    text: str,
+    page_starts: Optional[Sequence[int]] = None,
+    aggregate: bool = False,
+    model: Optional[str] = None,
+    fingerprints: Optional[Sequence[str]] = None,
+):
+    """
+    Extracts entities using the Hugging Face pipeline and provides context.
+    Returns a list of dictionaries with keys: entity, context, start, and end, and page
+    when page_starts is given, or one dictionary per entity with aggregate. model names
+    one of the available models, the default model when it is not given. With the
+    fingerprints of the pages and incremental extraction enabled, only changed pages go
+    through the model, see predict_revised_entities.
+    """
+    try:
+        # Extract entities from the text using the model.
+        if incremental_extraction and page_starts is not None and fingerprints:
+            ner_results = predict_revised_entities(
+                [text], [page_starts], [fingerprints], model
+            )[0]
+        else:
+            ner_results = predict_entities(text, model)
+        return build_entities(text, ner_results, page_starts, aggregate)
     except Exception as e:
         logger.exception("Error during entity extraction.")
         raise ValueError("Entity extraction failed.") from e
+
+
+def extract_entities_batch(
+    texts: List[str],
+    page_starts: Optional[List[Sequence[int]]] = None,
+    aggregate: bool = False,
+    model: Optional[str] = None,
+    fingerprints: Optional[List[Sequence[str]]] = None,
+):
+    """
+    Extracts entities from several texts, sharing model batches between them.
+    Returns one list of entities per text, as extract_entities does for a single text.
+    """
+    try:
+        if incremental_extraction and page_starts is not None and fingerprints:
+            ner_results = predict_revised_entities(
+                texts, page_starts, fingerprints, model
+            )
+        else:
+            ner_results = predict_entities_batch(texts, model)
+        return [
+            build_entities(text, text_results, text_page_starts, aggregate)
+            for text, text_results, text_page_starts in zip(
+                texts, ner_results, page_starts or [None] * len(texts)
+            )
+        ]
+    except Exception as e:
+        logger.exception("Error during entity extraction.")
+        raise ValueError("Entity extraction failed.") from e
+
+
+def iter_page_entities(
+    pages: Iterable[Tuple[int, str, int]], model: Optional[str] = None
+) -> Iterator[List[Dict]]:
+    """
+    Extracts entities page by page from the output of iter_pages and yields the entities
+    of each page as soon as it has been through the model, with its page number added.
+    Offsets are positions in the whole document. Every page runs through the model on
+    its own, so an entity broken across a page break is not found. Each page waits for
+    the next one so that contexts reach across page breaks as in extract_entities.
+    """
+    previous = ""
+    current = None
+    for page in chain(pages, [None]):
+        if current is not None:
+            page_number, text, char_offset = current
+            following = page[1] if page is not None else ""
+            entities = []
+            if text.strip():
+                try:
+                    ner_results = predict_entities(text, model)
+                except Exception as e:
+                    logger.exception("Error during entity extraction.")
+                    raise ValueError("Entity extraction failed.") from e
+                # Contexts are taken from the page and its neighbours.
+                shift = len(previous)
+                entities = build_entities(
+                    previous + text + following,
+                    [
+                        dict(
+                            result,
+                            start=result["start"] + shift,
+                            end=result["end"] + shift,
+                        )
+                        for result in ner_results
+                    ],
+                )
+                for entity in entities:
+                    entity["start"] += char_offset - shift
+                    entity["end"] += char_offset - shift
+                    entity["page"] = page_number
+            yield entities
+            previous = text
+        current = page
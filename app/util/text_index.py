@@ -0,0 +1,85 @@
+import re
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+# How the context of an entity is cut out of the text.
+FIXED = "fixed"
+WORD = "word"
+SENTENCE = "sentence"
+
+# A word, with the sentence terminator it may end with, such as "disease." or "(2019)."
+_WORDS = re.compile(r"\S+?(?P<stop>[.!?]['\")\]]*)?(?=\s|$)")
+# Abbreviations common in papers, whose period does not end a sentence.
+_ABBREVIATIONS = {"al.", "cf.", "e.g.", "eq.", "fig.", "figs.", "i.e.", "ref.", "vs."}
+
+
+class TextIndex:
+    """
+    The word, sentence and page boundaries of a text, found in a single pass over it.
+    Snippets and page numbers of any number of entities are then looked up by binary
+    search, O(log n) per entity.
+    """
+
+    def __init__(self, text: str, page_starts: Optional[Sequence[int]] = None):
+        self.length = len(text)
+        word_starts, word_ends = [], []
+        sentence_starts, sentence_ends = [0], []
+        stop = None
+        for match in _WORDS.finditer(text):
+            # A terminator only ends a sentence when a new one seems to start after it.
+            if stop is not None and not match.group()[0].islower():
+                sentence_ends.append(stop)
+                sentence_starts.append(match.start())
+            word_starts.append(match.start())
+            word_ends.append(match.end())
+            stop = None
+            if match.group("stop") and match.group().lower() not in _ABBREVIATIONS:
+                stop = match.end()
+        if stop is not None:
+            sentence_ends.append(stop)
+        # Sentinels keep every lookup inside the arrays.
+        self.word_starts = np.array(word_starts + [self.length])
+        self.word_ends = np.array([0] + word_ends)
+        self.sentence_starts = np.array(sentence_starts)
+        self.sentence_ends = np.array(sentence_ends + [self.length])
+        self.page_starts = np.array(page_starts) if page_starts is not None else None
+
+    def context_bounds(
+        self, starts: np.ndarray, ends: np.ndarray, mode: str, chars: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns where the snippets around the entities start and end. Every snippet
+        reaches at most chars characters beyond its entity. FIXED cuts exactly there,
+        WORD moves the cuts inwards to the nearest word boundary and SENTENCE also
+        stops them at the ends of the sentence holding the entity.
+        """
+        lower = np.maximum(starts - chars, 0)
+        upper = np.minimum(ends + chars, self.length)
+        if mode == FIXED:
+            return lower, upper
+        # First word starting inside the snippet and last word ending inside it.
+        lower = np.minimum(
+            self.word_starts[np.searchsorted(self.word_starts, lower)], starts
+        )
+        upper = np.maximum(
+            self.word_ends[np.searchsorted(self.word_ends, upper, side="right") - 1],
+            ends,
+        )
+        if mode == SENTENCE:
+            lower = np.maximum(
+                lower,
+                self.sentence_starts[
+                    np.searchsorted(self.sentence_starts, starts, side="right") - 1
+                ],
+            )
+            upper = np.minimum(
+                upper, self.sentence_ends[np.searchsorted(self.sentence_ends, ends)]
+            )
+        return lower, upper
+
+    def pages(self, starts: np.ndarray) -> np.ndarray:
+        """
+        Returns the page number, starting at 1, of every offset.
+        """
+        return np.searchsorted(self.page_starts, starts, side="right")
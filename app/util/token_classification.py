@@ -0,0 +1,230 @@
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+from transformers import TokenClassificationPipeline
+from transformers.pipelines import AggregationStrategy
+
+from app.util.metrics import ENTITIES_DROPPED
+
+
+class LabelTable:
+    """
+    Properties of every label id of the model as arrays, so that tokens can be grouped
+    and filtered by indexing with the predicted label ids.
+    """
+
+    def __init__(
+        self,
+        id2label: Dict[int, str],
+        keep_labels: Optional[Set[str]] = None,
+        min_score: float = 0.0,
+    ):
+        labels = [id2label[index] for index in range(len(id2label))]
+        # Same rules as TokenClassificationPipeline.get_tag and group_sub_entities.
+        tags = [label[2:] if label[:2] in ("B-", "I-") else label for label in labels]
+        tag_ids = {tag: index for index, tag in enumerate(dict.fromkeys(tags))}
+        self.groups = [label.split("-", 1)[-1] for label in labels]
+        self.tag_ids = np.array([tag_ids[tag] for tag in tags])
+        self.begins = np.array([label.startswith("B-") for label in labels])
+        self.ignored = np.array([group == "O" for group in self.groups])
+        self.kept = np.array(
+            [
+                group != "O" and (keep_labels is None or group in keep_labels)
+                for group in self.groups
+            ]
+        )
+        self.min_score = min_score
+
+
+class EntityPipeline(TokenClassificationPipeline):
+    """
+    Token classification pipeline that groups tokens into entities the way the simple
+    and average aggregation strategies do, and drops entities whose label is not in
+    keep_labels or whose score is below min_score, all on the arrays of the model output.
+    Only the kept entities are turned into dicts. The first and max strategies go
+    through the stock grouping and are filtered afterwards.
+    """
+
+    def __init__(self, *args, keep_labels=None, min_score=0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.label_table = LabelTable(
+            self.model.config.id2label, keep_labels, min_score
+        )
+        # The length of every token of the vocabulary, to find subwords as the stock
+        # pipeline does for tokenizers that mark them with a prefix.
+        self.token_lengths = None
+        backend = getattr(self.tokenizer, "_tokenizer", None)
+        if backend is not None and getattr(
+            backend.model, "continuing_subword_prefix", None
+        ):
+            self.token_lengths = np.array(
+                [
+                    len(token)
+                    for token in self.tokenizer.convert_ids_to_tokens(
+                        range(len(self.tokenizer))
+                    )
+                ]
+            )
+
+    def postprocess(
+        self,
+        all_outputs,
+        aggregation_strategy=AggregationStrategy.NONE,
+        ignore_labels=None,
+    ):
+        if aggregation_strategy not in (
+            AggregationStrategy.SIMPLE,
+            AggregationStrategy.AVERAGE,
+        ):
+            # Other strategies pick the label of a word by its tokens, which needs the
+            # stock code.
+            return self.filter_entities(
+                super().postprocess(all_outputs, aggregation_strategy, ignore_labels)
+            )
+        kept = self.label_table.kept
+        if ignore_labels:
+            # The stock pipeline matches ignore_labels against the entity group.
+            kept = kept & ~np.isin(self.label_table.groups, list(ignore_labels))
+        entities = []
+        sentence = None
+        for model_outputs in all_outputs:
+            # Every output is grouped against its own sentence. The pipeline only sets
+            # it on the first output of a text split into several, which the others
+            # belong to.
+            if model_outputs["sentence"] is not None:
+                sentence = model_outputs["sentence"]
+            entities.extend(
+                self.group_entities_arrays(
+                    sentence, model_outputs, aggregation_strategy, kept
+                )
+            )
+        if len(all_outputs) > 1:
+            entities = self.aggregate_overlapping_entities(entities)
+        return entities
+
+    def subwords(self, sentence: str, input_ids, offsets):
+        """
+        Marks the tokens that continue the word of the token before them, with the same
+        rules as TokenClassificationPipeline.gather_pre_entities.
+        """
+        if self.token_lengths is not None:
+            is_subword = self.token_lengths[input_ids] != offsets[:, 1] - offsets[:, 0]
+        else:
+            is_subword = np.array(
+                [
+                    start > 0 and sentence[start - 1] != " " and sentence[start] != " "
+                    for start in offsets[:, 0].tolist()
+                ],
+                dtype=bool,
+            )
+        if self.tokenizer.unk_token_id is not None:
+            is_subword &= input_ids != self.tokenizer.unk_token_id
+        return is_subword
+
+    def group_entities_arrays(
+        self,
+        sentence: str,
+        model_outputs,
+        aggregation_strategy=AggregationStrategy.SIMPLE,
+        kept: Optional[np.ndarray] = None,
+    ) -> List[Dict]:
+        table = self.label_table
+        kept = table.kept if kept is None else kept
+        tokens = np.flatnonzero(model_outputs["special_tokens_mask"][0].numpy() == 0)
+        if not len(tokens):
+            return []
+        input_ids = model_outputs["input_ids"][0].numpy()[tokens]
+        offsets = model_outputs["offset_mapping"][0].numpy()[tokens]
+        logits = model_outputs["logits"][0].float().numpy()[tokens]
+
+        if aggregation_strategy == AggregationStrategy.AVERAGE:
+            # Subwords join the word before them, and a word takes the label of the
+            # probabilities averaged over its tokens.
+            is_subword = self.subwords(sentence, input_ids, offsets)
+            is_subword[0] = False
+            unit_starts = np.flatnonzero(~is_subword)
+            probabilities = np.exp(logits - logits.max(axis=-1, keepdims=True))
+            probabilities /= probabilities.sum(axis=-1, keepdims=True)
+            unit_ends = np.append(unit_starts[1:], len(tokens))
+            probabilities = (
+                np.add.reduceat(probabilities, unit_starts)
+                / (unit_ends - unit_starts)[:, None]
+            )
+            label_ids = probabilities.argmax(axis=-1)
+            scores = probabilities[np.arange(len(label_ids)), label_ids]
+        else:
+            # Every token is a unit of its own.
+            unit_starts = np.arange(len(tokens))
+            unit_ends = unit_starts + 1
+            label_ids = logits.argmax(axis=-1)
+            # The softmax probability of the winning label, without the full softmax.
+            scores = 1.0 / np.exp(logits - logits.max(axis=-1, keepdims=True)).sum(
+                axis=-1
+            )
+
+        # A group starts where the tag changes or a B- label begins a new entity.
+        tag_ids = table.tag_ids[label_ids]
+        starts = np.flatnonzero(
+            np.concatenate(
+                ([True], (tag_ids[1:] != tag_ids[:-1]) | table.begins[label_ids[1:]])
+            )
+        )
+        ends = np.append(starts[1:], len(label_ids))
+        group_labels = label_ids[starts]
+        group_scores = np.add.reduceat(scores, starts) / (ends - starts)
+
+        labelled = kept[group_labels]
+        keep = labelled & (group_scores >= table.min_score)
+        ENTITIES_DROPPED.labels("label").inc(
+            int((~labelled & ~table.ignored[group_labels]).sum())
+        )
+        ENTITIES_DROPPED.labels("score").inc(int((labelled & ~keep).sum()))
+
+        # Groups of units as ranges of tokens.
+        starts = unit_starts[starts]
+        ends = unit_ends[ends - 1]
+        entities = []
+        for start, end, label, score in zip(
+            starts[keep].tolist(),
+            ends[keep].tolist(),
+            group_labels[keep].tolist(),
+            group_scores[keep].tolist(),
+        ):
+            entities.append(
+                {
+                    "entity_group": table.groups[label],
+                    "score": score,
+                    "word": self.group_word(
+                        sentence, input_ids[start:end], offsets[start:end]
+                    ),
+                    "start": int(offsets[start][0]),
+                    "end": int(offsets[end - 1][1]),
+                }
+            )
+        return entities
+
+    def group_word(self, sentence: str, input_ids, offsets) -> str:
+        unk_token_id = self.tokenizer.unk_token_id
+        return self.tokenizer.convert_tokens_to_string(
+            [
+                (
+                    sentence[start:end]
+                    if token_id == unk_token_id
+                    else self.tokenizer.convert_ids_to_tokens(token_id)
+                )
+                for token_id, (start, end) in zip(input_ids.tolist(), offsets.tolist())
+            ]
+        )
+
+    def filter_entities(self, entities: List[Dict]) -> List[Dict]:
+        table = self.label_table
+        kept = {group for group, keep in zip(table.groups, table.kept.tolist()) if keep}
+        filtered = []
+        for entity in entities:
+            if entity.get("entity_group") not in kept:
+                ENTITIES_DROPPED.labels("label").inc()
+            elif entity["score"] < table.min_score:
+                ENTITIES_DROPPED.labels("score").inc()
+            else:
+                filtered.append(entity)
+        return filtered
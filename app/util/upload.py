@@ -0,0 +1,57 @@
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Optional
+
+# Size of the chunks an upload is copied and hashed in.
+CHUNK_BYTES = 1024 * 1024
+
+
+class UploadTooLargeError(ValueError):
+    pass
+
+
+class SpooledUpload:
+    """
+    An uploaded file copied to a temporary file, with the SHA-256 hex digest and the
+    size of its content. Removing the file is up to whoever holds it.
+    """
+
+    def __init__(self, path: str, size: int, digest: str):
+        self.path = path
+        self.size = size
+        self.digest = digest
+
+    def close(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def spool_upload(
+    file: BinaryIO, max_bytes: int, directory: Optional[str] = None
+) -> SpooledUpload:
+    """
+    Copies an uploaded file to a temporary file in directory, the system temp directory
+    by default, one chunk at a time and hashing each chunk on the way. At most one chunk
+    is held in memory, and the copy stops as soon as it grows beyond max_bytes.
+    """
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    descriptor, path = tempfile.mkstemp(prefix="upload-", suffix=".pdf", dir=directory)
+    try:
+        with os.fdopen(descriptor, "wb") as spooled:
+            file.seek(0)
+            while chunk := file.read(CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError("File too large.")
+                digest.update(chunk)
+                spooled.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return SpooledUpload(path, size, digest.hexdigest())
@@ -0,0 +1,70 @@
+"""
+Compares two benchmark result files and exits with status 1 when the candidate regressed.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.1
+
+Results are matched on stage, page count, density and concurrency, and compared on their
+median time. A result regresses when its median grows by more than the threshold.
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict
+
+
+def result_key(result: Dict) -> str:
+    return "/".join(
+        str(result.get(field)) for field in ("stage", "pages", "density", "concurrency")
+    )
+
+
+def compare_results(baseline: Dict, candidate: Dict, threshold: float) -> Dict:
+    baseline_results = {result_key(result): result for result in baseline["results"]}
+    comparisons = []
+    for result in candidate["results"]:
+        reference = baseline_results.get(result_key(result))
+        if reference is None:
+            continue
+        ratio = result["seconds"]["median"] / reference["seconds"]["median"]
+        comparisons.append(
+            {
+                "benchmark": result_key(result),
+                "baseline_median_seconds": reference["seconds"]["median"],
+                "candidate_median_seconds": result["seconds"]["median"],
+                "ratio": ratio,
+                "regressed": ratio > 1 + threshold,
+            }
+        )
+    return {
+        "baseline_commit": baseline["metadata"].get("commit"),
+        "candidate_commit": candidate["metadata"].get("commit"),
+        "threshold": threshold,
+        "regressions": sum(comparison["regressed"] for comparison in comparisons),
+        "comparisons": comparisons,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Allowed growth of the median time, 0.1 is 10%%",
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.candidate) as file:
+        candidate = json.load(file)
+    report = compare_results(baseline, candidate, args.threshold)
+    print(json.dumps(report, indent=2))
+    return 1 if report["regressions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Generates synthetic PDF documents for benchmarks. The same seed always gives the same
+document, so results of different commits are measured on identical input.
+"""
+
+import io
+import random
+import textwrap
+from typing import Dict, List
+
+import pypdf
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+# Medical terms scattered through the filler text, with the label a NER model gives them.
+VOCABULARY: Dict[str, str] = {
+    "fever": "Sign_symptom",
+    "fatigue": "Sign_symptom",
+    "dyspnea": "Sign_symptom",
+    "chest pain": "Sign_symptom",
+    "hypertension": "Disease_disorder",
+    "diabetes mellitus": "Disease_disorder",
+    "endothelial dysfunction": "Disease_disorder",
+    "pneumonia": "Disease_disorder",
+    "metformin": "Medication",
+    "atorvastatin": "Medication",
+    "lisinopril": "Medication",
+    "echocardiography": "Diagnostic_procedure",
+    "biopsy": "Diagnostic_procedure",
+    "angiography": "Diagnostic_procedure",
+}
+
+FILLER = (
+    "the patient study results were observed during follow up with a significant "
+    "increase in baseline measurements compared to the control group and no adverse "
+    "events reported after treatment over the period of analysis in this cohort"
+).split()
+
+# Words per page for each text density.
+DENSITIES = {"sparse": 60, "normal": 300, "dense": 700}
+
+CHARACTERS_PER_LINE = 100
+FONT_SIZE = 8
+LINE_HEIGHT = 10
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+MARGIN = 36
+# Share of words that are medical terms.
+TERM_RATIO = 0.05
+
+
+def generate_page_texts(pages: int, density: str, seed: int = 0) -> List[str]:
+    rng = random.Random(f"{pages}-{density}-{seed}")
+    terms = list(VOCABULARY)
+    page_texts = []
+    for _ in range(pages):
+        words = [
+            rng.choice(terms) if rng.random() < TERM_RATIO else rng.choice(FILLER)
+            for _ in range(DENSITIES[density])
+        ]
+        page_texts.append(" ".join(words))
+    return page_texts
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_pdf(page_texts: List[str]) -> bytes:
+    """
+    Writes every text on its own page in Helvetica, wrapped at a fixed line width.
+    """
+    pdf_writer = pypdf.PdfWriter()
+    font = pdf_writer._add_object(
+        DictionaryObject(
+            {
+                NameObject("/Type"): NameObject("/Font"),
+                NameObject("/Subtype"): NameObject("/Type1"),
+                NameObject("/BaseFont"): NameObject("/Helvetica"),
+            }
+        )
+    )
+    for page_text in page_texts:
+        page = pdf_writer.add_blank_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        page[NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})}
+        )
+        lines = textwrap.wrap(page_text, width=CHARACTERS_PER_LINE)
+        operations = [
+            f"BT /F1 {FONT_SIZE} Tf {LINE_HEIGHT} TL "
+            f"{MARGIN} {PAGE_HEIGHT - MARGIN} Td"
+        ]
+        operations.extend(f"({_escape(line)}) Tj T*" for line in lines)
+        operations.append("ET")
+        content = DecodedStreamObject()
+        content.set_data("\n".join(operations).encode("latin-1"))
+        page[NameObject("/Contents")] = pdf_writer._add_object(content)
+
+    with io.BytesIO() as pdf_buffer:
+        pdf_writer.write(pdf_buffer)
+        return pdf_buffer.getvalue()
+
+
+def generate_pdf(pages: int, density: str, seed: int = 0) -> bytes:
+    return build_pdf(generate_page_texts(pages, density, seed))
@@ -0,0 +1,240 @@
+"""
+Benchmarks the extraction pipeline on a synthetic PDF corpus and writes the results as JSON.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --stub-model --output results.json
+
+Every stage (parsing, parsing on the parse executor, entity extraction, serialization of
+the entities by the extract routes and, for reference, by the stdlib encoder) is timed on
+documents of each page count and text density, and the extract endpoint is load tested
+through the ASGI app in process. --stub-model replaces the model with StubPDFModel so
+that the benchmarks run without weights. Compare two result files with benchmarks.compare.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+from benchmarks.corpus import DENSITIES, generate_pdf
+from benchmarks.stub_model import StubPDFModel
+
+
+def install_stub_model(seconds_per_token: float):
+    from app.util.config import chunk_max_tokens, chunk_overlap_tokens
+    from app.util.text_context import set_pdf_model
+
+    StubPDFModel.seconds_per_token = seconds_per_token
+    set_pdf_model(
+        StubPDFModel(
+            "stub",
+            "ner",
+            "simple",
+            "cpu",
+            max_tokens=chunk_max_tokens,
+            overlap_tokens=chunk_overlap_tokens,
+        )
+    )
+
+
+def percentile(ordered: List[float], percent: float) -> float:
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def summarize(seconds: List[float]) -> Dict:
+    ordered = sorted(seconds)
+    return {
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "p95": percentile(ordered, 95),
+        "max": ordered[-1],
+        "mean": statistics.fmean(ordered),
+    }
+
+
+def time_calls(func: Callable, repeats: int) -> List[float]:
+    # The first call warms up caches and pools and is not timed.
+    func()
+    seconds = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start_time)
+    return seconds
+
+
+def benchmark_stages(pages: List[int], densities: List[str], repeats: int) -> List:
+    from fastapi.responses import JSONResponse, ORJSONResponse
+
+    from app.util.executor import get_parse_executor
+    from app.util.pdf import parse_pdf
+    from app.util.text_context import extract_entities
+
+    parse_executor = get_parse_executor()
+    results = []
+    for page_count in pages:
+        for density in densities:
+            pdf_bytes = generate_pdf(page_count, density)
+            text = parse_pdf(pdf_bytes)
+            entities = extract_entities(text)
+            stages = {
+                "parse": lambda: parse_pdf(pdf_bytes),
+                "extract": lambda: extract_entities(text),
+                # The response class of the extract routes against the stdlib encoder.
+                "serialize": lambda: ORJSONResponse(content=entities),
+                "serialize_json": lambda: JSONResponse(content=entities),
+            }
+            if parse_executor is not None:
+                stages["parse_parallel"] = lambda: parse_pdf(pdf_bytes, parse_executor)
+            for stage, func in stages.items():
+                seconds = time_calls(func, repeats)
+                results.append(
+                    {
+                        "stage": stage,
+                        "pages": page_count,
+                        "density": density,
+                        "characters": len(text),
+                        "seconds": summarize(seconds),
+                        "pages_per_second": page_count / statistics.median(seconds),
+                    }
+                )
+    return results
+
+
+async def benchmark_endpoint(
+    page_count: int, density: str, requests: int, concurrency: int
+) -> Dict:
+    import httpx
+
+    from app.main import app
+    from app.util.config import correct_password_bytes, correct_username_bytes
+
+    # Every request sends a different document so that none is answered from the cache.
+    documents = [
+        generate_pdf(page_count, density, seed) for seed in range(requests + 1)
+    ]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://benchmark",
+        auth=(correct_username_bytes.decode(), correct_password_bytes.decode()),
+        timeout=None,
+    ) as client:
+
+        async def send(document: bytes, timed: bool = True):
+            nonlocal errors
+            async with semaphore:
+                start_time = time.perf_counter()
+                response = await client.post(
+                    "/api/v1/extract",
+                    files={"content": ("document.pdf", document, "application/pdf")},
+                )
+                if timed:
+                    latencies.append(time.perf_counter() - start_time)
+                    errors += response.status_code != 200
+
+        await send(documents[0], timed=False)
+        start_time = time.perf_counter()
+        await asyncio.gather(*(send(document) for document in documents[1:]))
+        wall_seconds = time.perf_counter() - start_time
+
+    return {
+        "stage": "endpoint",
+        "pages": page_count,
+        "density": density,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": summarize(latencies),
+        "requests_per_second": requests / wall_seconds,
+        "pages_per_second": requests * page_count / wall_seconds,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument(
+        "--densities", nargs="+", choices=sorted(DENSITIES), default=list(DENSITIES)
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--endpoint-pages", type=int, default=10)
+    parser.add_argument(
+        "--endpoint-density", choices=sorted(DENSITIES), default="normal"
+    )
+    parser.add_argument(
+        "--stub-model",
+        action="store_true",
+        help="Replace the model with a stub that needs no weights",
+    )
+    parser.add_argument(
+        "--stub-seconds-per-token",
+        type=float,
+        default=0.0,
+        help="Time the stub model spends per token",
+    )
+    parser.add_argument(
+        "--output", help="File to write the results to, stdout if unset"
+    )
+    args = parser.parse_args(argv)
+
+    if args.stub_model:
+        install_stub_model(args.stub_seconds_per_token)
+    from app.util.config import huggingface_model, inference_backend
+
+    results = benchmark_stages(args.pages, args.densities, args.repeats)
+    results.append(
+        asyncio.run(
+            benchmark_endpoint(
+                args.endpoint_pages,
+                args.endpoint_density,
+                args.requests,
+                args.concurrency,
+            )
+        )
+    )
+    report = {
+        "metadata": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "model": "stub" if args.stub_model else huggingface_model,
+            "backend": "stub" if args.stub_model else inference_backend,
+            "arguments": vars(args),
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+A stand-in for PDFModel that needs no model weights, so the pipeline around the model
+can be benchmarked anywhere.
+"""
+
+import re
+import time
+from typing import Dict, List
+
+from benchmarks.corpus import VOCABULARY
+
+_TERMS = re.compile("|".join(re.escape(term) for term in VOCABULARY))
+_TOKENS = re.compile(r"\S+")
+
+
+class StubPDFModel:
+    """
+    Takes the same arguments as PDFModel. Entities are the terms of the synthetic
+    corpus vocabulary, and inference sleeps seconds_per_token for every whitespace
+    token to stand in for the cost of the forward pass.
+    """
+
+    seconds_per_token = 0.0
+
+    def __init__(
+        self,
+        model_dir: str,
+        task: str,
+        aggregation_strategy,
+        device,
+        max_tokens: int = None,
+        overlap_tokens: int = 64,
+        batch_size: int = 8,
+        backend: str = "stub",
+        keep_labels=None,
+        min_score: float = 0.0,
+        batch_tokens: int = 0,
+    ):
+        self.max_tokens = max_tokens or 510
+        self.overlap_tokens = overlap_tokens
+        self.batch_size = batch_size
+        self.backend = backend
+
+    def _predict(self, text: str) -> List[Dict]:
+        return [
+            {
+                "entity_group": VOCABULARY[match.group()],
+                "score": 0.99,
+                "word": match.group(),
+                "start": match.start(),
+                "end": match.end(),
+            }
+            for match in _TERMS.finditer(text)
+        ]
+
+    def infer(self, texts, batch_size=None, lengths=None):
+        if self.seconds_per_token:
+            time.sleep(
+                self.seconds_per_token * sum(len(_TOKENS.findall(t)) for t in texts)
+            )
+        return [self._predict(text) for text in texts]
+
+    def extract_entities_batch(self, texts, infer=None):
+        return (infer or self.infer)(texts)
+
+    def extract_entities(self, text, infer=None):
+        return self.extract_entities_batch([text], infer)[0]
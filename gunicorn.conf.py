@@ -0,0 +1,58 @@
+import gc
+import os
+import shutil
+import sys
+import tempfile
+
+# Gunicorn loads this file before the application, so make the app package importable.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Every process writes its metrics to files in this directory and /metrics adds them up.
+# It has to be set before prometheus_client is imported, and is emptied on every start.
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR",
+    os.path.join(tempfile.gettempdir(), "entity-extraction-metrics"),
+)
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir)
+
+from app.util.config import gunicorn_preload, gunicorn_workers  # noqa: E402
+
+bind = "0.0.0.0:8000"
+worker_class = "uvicorn.workers.UvicornWorker"
+# uses 2 workers per CPU as the task is CPU intensive.
+workers = gunicorn_workers or 2 * len(os.sched_getaffinity(0))
+# Loads the app, and with it the model, once in the master before the workers are forked.
+preload_app = gunicorn_preload
+
+
+def when_ready(server):
+    if preload_app:
+        # The app does not load the model on import, so load it here for the workers
+        # to share. Warm-up runs in each worker, as it sets up per-process state.
+        from app.util.text_context import get_pdf_model
+
+        get_pdf_model()
+        # Move everything loaded so far out of reach of the garbage collector, so that
+        # collections in the workers do not write to (and copy) the shared pages.
+        gc.collect()
+        gc.freeze()
+
+
+def pre_fork(server, worker):
+    # Gives the new worker the lowest slot no live worker holds, so that a restarted
+    # worker takes over the CPUs of the one it replaces.
+    taken = {getattr(other, "cpu_slot", None) for other in server.WORKERS.values()}
+    worker.cpu_slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    from app.util.cpu import configure_worker
+
+    configure_worker(worker.cpu_slot, server.num_workers)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,42 @@
+"""
+Regenerates the expected responses in data/ from the PDFs in data/pdf/.
+
+    python -m tests.end_to_end_test.regenerate_fixtures
+
+Runs every PDF through /api/v1/extract with the model in HUGGING_FACE_MODEL_PATH and
+the default pipeline settings, and writes the response body unchanged next to the
+other fixtures. Run it with the real model whenever a change alters the entities or
+their contexts, and review the diff before committing it.
+"""
+
+import os
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+data_dir = Path(__file__).resolve().parent / "data"
+
+
+def main():
+    auth = (
+        os.environ["HTTP_BASIC_AUTH_USERNAME"],
+        os.environ["HTTP_BASIC_AUTH_PASSWORD"],
+    )
+    with TestClient(app=app) as client:
+        for pdf_path in sorted((data_dir / "pdf").glob("*.pdf")):
+            with open(pdf_path, "rb") as pdf_file:
+                response = client.post(
+                    "/api/v1/extract",
+                    auth=auth,
+                    files={"content": (pdf_path.name, pdf_file, "application/pdf")},
+                )
+            response.raise_for_status()
+            json_path = data_dir / f"{pdf_path.stem}.json"
+            json_path.write_bytes(response.content)
+            print(f"{json_path}: {len(response.json())} entities")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+from benchmarks.compare import compare_results
+
+
+def report(commit, median):
+    return {
+        "metadata": {"commit": commit},
+        "results": [
+            {
+                "stage": "parse",
+                "pages": 10,
+                "density": "normal",
+                "seconds": {"median": median},
+            },
+            {
+                "stage": "extract",
+                "pages": 10,
+                "density": "dense",
+                "seconds": {"median": 1.0},
+            },
+        ],
+    }
+
+
+def test_compare_results_flags_regressions():
+    comparison = compare_results(report("a", 1.0), report("b", 1.2), threshold=0.1)
+
+    assert comparison["regressions"] == 1
+    assert comparison["comparisons"][0]["benchmark"] == "parse/10/normal/None"
+    assert comparison["comparisons"][0]["regressed"]
+    assert not comparison["comparisons"][1]["regressed"]
+
+
+def test_compare_results_within_threshold():
+    comparison = compare_results(report("a", 1.0), report("b", 1.05), threshold=0.1)
+
+    assert comparison["regressions"] == 0
@@ -0,0 +1,41 @@
+from app.util.pdf import iter_pages
+from benchmarks.corpus import DENSITIES, VOCABULARY, generate_page_texts, generate_pdf
+from benchmarks.stub_model import StubPDFModel
+
+
+def test_generate_pdf_is_reproducible():
+    assert generate_pdf(2, "sparse") == generate_pdf(2, "sparse")
+    assert generate_pdf(2, "sparse", seed=1) != generate_pdf(2, "sparse")
+
+
+def test_generate_pdf_pages_and_density():
+    page_texts = generate_page_texts(3, "normal")
+    pages = list(iter_pages(generate_pdf(3, "normal")))
+
+    assert len(pages) == 3
+    for page_text, (_, text, _) in zip(page_texts, pages):
+        assert len(page_text.split()) >= DENSITIES["normal"]
+        assert text.split() == page_text.split()
+
+
+def test_stub_model_finds_vocabulary():
+    model = StubPDFModel("model", "ner", "simple", "cpu")
+
+    entities = model.extract_entities("persistent fever treated with metformin")
+
+    assert entities == [
+        {
+            "entity_group": VOCABULARY["fever"],
+            "score": 0.99,
+            "word": "fever",
+            "start": 11,
+            "end": 16,
+        },
+        {
+            "entity_group": VOCABULARY["metformin"],
+            "score": 0.99,
+            "word": "metformin",
+            "start": 30,
+            "end": 39,
+        },
+    ]
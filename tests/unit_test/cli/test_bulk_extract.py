@@ -0,0 +1,88 @@
+import json
+
+from app.cli.bulk_extract import (
+    bulk_extract,
+    drop_superseded,
+    find_documents,
+    read_completed,
+)
+from benchmarks.corpus import generate_pdf
+
+
+def test_find_documents(tmp_path):
+    (tmp_path / "b").mkdir()
+    for name in ("b/two.pdf", "one.PDF", "notes.txt"):
+        (tmp_path / name).write_bytes(b"")
+
+    documents = list(find_documents(str(tmp_path)))
+
+    assert documents == [str(tmp_path / "one.PDF"), str(tmp_path / "b/two.pdf")]
+
+
+def test_read_completed_drops_cut_off_line(tmp_path):
+    output = tmp_path / "entities.jsonl"
+    output.write_text(
+        '{"path": "a.pdf", "pages": 1, "entities": []}\n'
+        '{"path": "b.pdf", "error": "Failed to parse PDF file."}\n'
+        '{"path": "c.pdf", "pa'
+    )
+
+    assert read_completed(str(output), retry_failed=False) == {"a.pdf", "b.pdf"}
+    assert read_completed(str(output), retry_failed=True) == {"a.pdf"}
+    assert output.read_text().endswith("}\n")
+
+
+def test_bulk_extract_resumes(tmp_path):
+    for seed in range(3):
+        (tmp_path / f"{seed}.pdf").write_bytes(generate_pdf(2, "normal", seed))
+    (tmp_path / "broken.pdf").write_bytes(b"not a pdf")
+    output = str(tmp_path / "entities.jsonl")
+    paths = list(find_documents(str(tmp_path)))
+
+    first = bulk_extract(paths[:2], output, workers=1, batch_documents=2)
+    second = bulk_extract(paths, output, workers=1, batch_documents=2)
+
+    with open(output) as file:
+        records = {record["path"]: record for record in map(json.loads, file)}
+    assert first["documents"] == 2
+    assert second["documents"] == 2
+    assert second["failed"] == 1
+    assert set(records) == set(paths)
+    assert records[str(tmp_path / "broken.pdf")] == {
+        "path": str(tmp_path / "broken.pdf"),
+        "error": "Failed to parse PDF file.",
+    }
+    assert records[str(tmp_path / "0.pdf")]["pages"] == 2
+
+
+def test_read_completed_counts_the_last_record(tmp_path):
+    output = tmp_path / "entities.jsonl"
+    output.write_text(
+        '{"path": "a.pdf", "error": "Failed to parse PDF file."}\n'
+        '{"path": "a.pdf", "pages": 1, "entities": []}\n'
+    )
+
+    assert read_completed(str(output), retry_failed=True) == {"a.pdf"}
+
+    drop_superseded(str(output))
+    assert output.read_text() == '{"path": "a.pdf", "pages": 1, "entities": []}\n'
+
+
+def test_bulk_extract_retry_failed_replaces_errors(tmp_path):
+    path = tmp_path / "0.pdf"
+    path.write_bytes(b"not a pdf yet")
+    output = str(tmp_path / "entities.jsonl")
+
+    bulk_extract([str(path)], output, workers=1, batch_documents=1)
+    path.write_bytes(generate_pdf(2, "normal", 0))
+    summary = bulk_extract(
+        [str(path)], output, workers=1, batch_documents=1, retry_failed=True
+    )
+
+    with open(output) as file:
+        records = [json.loads(line) for line in file]
+    assert summary["documents"] == 1
+    assert len(records) == 1
+    assert records[0]["path"] == str(path)
+    assert records[0]["pages"] == 2
+    assert "error" not in records[0]
@@ -0,0 +1,33 @@
+from app.cli.compare_backends import compare_entities
+
+
+def entity(label, start, end, score):
+    return {"entity_group": label, "start": start, "end": end, "score": score}
+
+
+def test_compare_entities():
+    reference = [
+        entity("Sign_symptom", 0, 7, 0.9),
+        entity("Disease_disorder", 10, 18, 0.8),
+    ]
+    candidate = [
+        entity("Sign_symptom", 0, 7, 0.85),
+        entity("Medication", 10, 18, 0.7),
+    ]
+
+    report = compare_entities(reference, candidate)
+
+    assert report["matched_entities"] == 1
+    assert report["precision"] == 0.5
+    assert report["recall"] == 0.5
+    assert report["f1"] == 0.5
+    assert round(report["max_score_difference"], 6) == 0.05
+
+
+def test_compare_entities_identical():
+    entities = [entity("Sign_symptom", 0, 7, 0.9)]
+
+    report = compare_entities(entities, entities)
+
+    assert report["f1"] == 1.0
+    assert report["max_score_difference"] == 0.0
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+from app.cli.memory_report import memory_report, read_memory
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="Reads /proc")
+def test_read_memory():
+    memory = read_memory(os.getpid())
+
+    assert memory["rss_mb"] > 0
+    assert memory["pss_mb"] <= memory["rss_mb"]
+    assert memory["private_mb"] == round(
+        memory["private_clean_mb"] + memory["private_dirty_mb"], 1
+    )
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="Reads /proc")
+def test_memory_report_totals_include_master():
+    report = memory_report(os.getpid())
+
+    assert report["master"]["pid"] == os.getpid()
+    assert report["total_pss_mb"] >= report["master"]["pss_mb"]
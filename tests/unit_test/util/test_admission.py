@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+from app.util.admission import AdmissionController, AdmissionRejectedError
+
+
+def test_admission_admits_within_limits():
+    async def scenario():
+        controller = AdmissionController(2, 10, 4, 1)
+        first = await controller.acquire(4)
+        second = await controller.acquire(6)
+        stats = controller.stats()
+        first.release()
+        first.release()
+        second.release()
+        return stats, controller.stats()
+
+    during, after = asyncio.run(scenario())
+
+    assert during["in_flight_documents"] == 2
+    assert during["in_flight_pages"] == 10
+    assert after["in_flight_documents"] == 0
+    assert after["in_flight_pages"] == 0
+    assert after["admitted"] == 2
+
+
+def test_admission_queues_in_order():
+    async def scenario():
+        controller = AdmissionController(1, 10, 4, 5)
+        ticket = await controller.acquire(1)
+        order = []
+
+        async def wait(name, pages):
+            waiting = await controller.acquire(pages)
+            order.append(name)
+            waiting.release()
+
+        tasks = [
+            asyncio.create_task(wait("large", 10)),
+            asyncio.create_task(wait("small", 1)),
+        ]
+        await asyncio.sleep(0)
+        queued = controller.stats()["queued"]
+        ticket.release()
+        await asyncio.gather(*tasks)
+        return queued, order
+
+    queued, order = asyncio.run(scenario())
+
+    assert queued == 2
+    assert order == ["large", "small"]
+
+
+def test_admission_rejects_when_queue_is_full():
+    async def scenario():
+        controller = AdmissionController(1, 10, 1, 5)
+        ticket = await controller.acquire(1)
+        waiting = asyncio.create_task(controller.acquire(1))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejectedError) as e:
+            await controller.acquire(1)
+        ticket.release()
+        (await waiting).release()
+        return e.value
+
+    error = asyncio.run(scenario())
+
+    assert error.status_code == 429
+    assert error.retry_after >= 1
+
+
+def test_admission_rejects_after_queue_timeout():
+    async def scenario():
+        controller = AdmissionController(1, 10, 4, 0.05)
+        ticket = await controller.acquire(1)
+        with pytest.raises(AdmissionRejectedError) as e:
+            await controller.acquire(1)
+        stats = controller.stats()
+        ticket.release()
+        return e.value, stats
+
+    error, stats = asyncio.run(scenario())
+
+    assert error.status_code == 503
+    assert stats["queued"] == 0
+    assert stats["rejected"] == 1
+
+
+def test_admission_admits_oversized_document_alone():
+    async def scenario():
+        controller = AdmissionController(4, 10, 4, 1)
+        ticket = await controller.acquire(1000)
+        stats = controller.stats()
+        ticket.release()
+        return stats, controller.stats()
+
+    during, after = asyncio.run(scenario())
+
+    assert during["in_flight_pages"] == 1000
+    assert after["in_flight_pages"] == 0
+
+
+def test_admission_counts_every_document_of_a_batch():
+    async def scenario():
+        controller = AdmissionController(4, 10, 4, 5)
+        batch = await controller.acquire(3, documents=3)
+        stats = controller.stats()
+        # Only one more document fits next to the batch.
+        single = await controller.acquire(1)
+        waiting = asyncio.create_task(controller.acquire(1))
+        await asyncio.sleep(0)
+        queued = controller.stats()["queued"]
+        batch.release()
+        (await waiting).release()
+        single.release()
+        return stats, queued, controller.stats()
+
+    during, queued, after = asyncio.run(scenario())
+
+    assert during["in_flight_documents"] == 3
+    assert during["in_flight_pages"] == 3
+    assert queued == 1
+    assert after["in_flight_documents"] == 0
+    assert after["in_flight_pages"] == 0
+
+
+def test_admission_admits_batch_over_the_limits_alone():
+    async def scenario():
+        controller = AdmissionController(2, 10, 4, 5)
+        ticket = await controller.acquire(1)
+        order = []
+
+        async def wait(name, pages, documents):
+            waiting = await controller.acquire(pages, documents)
+            order.append((name, controller.stats()["in_flight_documents"]))
+            await asyncio.sleep(0)
+            waiting.release()
+
+        tasks = [
+            asyncio.create_task(wait("batch", 30, 5)),
+            asyncio.create_task(wait("single", 1, 1)),
+        ]
+        await asyncio.sleep(0)
+        queued = controller.stats()["queued"]
+        ticket.release()
+        await asyncio.gather(*tasks)
+        return queued, order
+
+    queued, order = asyncio.run(scenario())
+
+    # The batch waits for the document in flight, and the next one waits for the batch.
+    assert queued == 2
+    assert order == [("batch", 5), ("single", 1)]
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.util.batching import BatchScheduler, plan_length_batches
+from app.util.executor import StageTimeoutError, run_stage
+
+
+def fake_infer(texts, batch_size=None):
+    return [[{"word": text, "batch_size": len(texts)}] for text in texts]
+
+
+def test_batch_scheduler_returns_results_in_order():
+    scheduler = BatchScheduler(fake_infer, max_batch_size=8, max_wait_ms=50)
+
+    results = scheduler.run(["a", "b", "c"])
+
+    assert [result[0]["word"] for result in results] == ["a", "b", "c"]
+    assert scheduler.stats()["items"] == 3
+
+
+def test_batch_scheduler_batches_concurrent_requests():
+    scheduler = BatchScheduler(fake_infer, max_batch_size=4, max_wait_ms=200)
+    results = {}
+
+    def request(name):
+        results[name] = scheduler.run([name])
+
+    threads = [threading.Thread(target=request, args=(str(i),)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert {name: result[0][0]["word"] for name, result in results.items()} == {
+        str(i): str(i) for i in range(4)
+    }
+    stats = scheduler.stats()
+    assert stats["batches"] < 4
+    assert stats["max_batch_size"] <= 4
+    assert stats["queue_depth"] == 0
+
+
+def test_batch_scheduler_propagates_errors():
+    def failing_infer(texts, batch_size=None):
+        raise RuntimeError("Mock Error")
+
+    scheduler = BatchScheduler(failing_infer, max_wait_ms=0)
+
+    with pytest.raises(RuntimeError, match="Mock Error"):
+        scheduler.run(["a"])
+
+
+def test_batch_scheduler_drops_texts_of_abandoned_stages():
+    class ConnectedRequest:
+        async def is_disconnected(self):
+            return False
+
+    release = threading.Event()
+    seen = []
+
+    def slow_infer(texts, batch_size=None):
+        seen.extend(texts)
+        release.wait(5)
+        return fake_infer(texts)
+
+    scheduler = BatchScheduler(slow_infer, max_batch_size=1, max_wait_ms=0)
+    # Keeps the scheduler busy while the stage below times out.
+    running = scheduler.submit(["running"])
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with pytest.raises(StageTimeoutError):
+            asyncio.run(
+                run_stage(
+                    ConnectedRequest(), "inference", executor, 0.1, scheduler.run, ["a"]
+                )
+            )
+    release.set()
+
+    assert running[0].result(timeout=5)[0]["word"] == "running"
+    assert scheduler.run(["b"])[0][0]["word"] == "b"
+    # The text of the abandoned stage never reached the model.
+    assert seen == ["running", "b"]
+
+
+def test_plan_length_batches_groups_similar_lengths_under_budget():
+    lengths = [500, 12, 40, 510, 16, 44, 600]
+
+    batches = plan_length_batches(lengths, max_tokens=1024)
+
+    assert batches == [[1, 4, 2, 5], [0, 3], [6]]
+    for batch in batches:
+        assert (
+            len(batch) * max(lengths[index] for index in batch) <= 1024
+            or len(batch) == 1
+        )
+    assert sorted(index for batch in batches for index in batch) == list(
+        range(len(lengths))
+    )
@@ -0,0 +1,57 @@
+import json
+
+from app.util.cache import ExtractionCache
+
+ENTITIES = [
+    {"entity": "fatigue", "context": "persistent fatigue", "start": 0, "end": 7}
+]
+
+
+def test_cache_key_depends_on_file_and_config():
+    key = ExtractionCache.key("digest", "model-a")
+
+    assert key == ExtractionCache.key("digest", "model-a")
+    assert key != ExtractionCache.key("digest", "model-b")
+    assert key != ExtractionCache.key("other", "model-a")
+
+
+def test_cache_hit_and_miss():
+    cache = ExtractionCache(max_bytes=1024)
+
+    assert cache.get("key") is None
+    cache.put("key", ENTITIES)
+
+    assert cache.get("key") == ENTITIES
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_evicts_by_size():
+    entry_size = len(json.dumps(ENTITIES).encode("utf-8"))
+    cache = ExtractionCache(max_bytes=entry_size * 2)
+
+    cache.put("first", ENTITIES)
+    cache.put("second", ENTITIES)
+    # Using the first entry makes the second one the least recently used.
+    cache.get("first")
+    cache.put("third", ENTITIES)
+
+    assert cache.get("second") is None
+    assert cache.get("first") == ENTITIES
+    assert cache.stats()["bytes"] == entry_size * 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_disk_tier_is_shared(tmp_path):
+    disk_path = str(tmp_path / "cache.sqlite3")
+    writer = ExtractionCache(max_bytes=1024, disk_path=disk_path, disk_max_bytes=1024)
+    reader = ExtractionCache(max_bytes=1024, disk_path=disk_path, disk_max_bytes=1024)
+
+    writer.put("key", ENTITIES)
+
+    assert reader.get("key") == ENTITIES
+    assert reader.stats()["disk_hits"] == 1
+
+    writer.clear()
+
+    assert ExtractionCache(1024, disk_path, 1024).get("key") is None
@@ -0,0 +1,71 @@
+from app.util.chunking import TextWindow, merge_window_entities, plan_windows
+
+
+def tokenize_words(text):
+    # One token per whitespace separated word.
+    offsets = []
+    position = 0
+    for word in text.split(" "):
+        offsets.append((position, position + len(word)))
+        position += len(word) + 1
+    return offsets, list(range(len(offsets)))
+
+
+def test_plan_windows_short_text_is_single_window():
+    text = "a short text"
+    offsets, word_ids = tokenize_words(text)
+
+    windows = plan_windows(text, offsets, word_ids, max_tokens=10, overlap_tokens=2)
+
+    assert windows == [TextWindow(0, len(text), 0, 3)]
+
+
+def test_plan_windows_overlap():
+    text = "w0 w1 w2 w3 w4 w5 w6 w7 w8 w9"
+    offsets, word_ids = tokenize_words(text)
+
+    windows = plan_windows(text, offsets, word_ids, max_tokens=4, overlap_tokens=1)
+
+    assert [(w.token_start, w.token_end) for w in windows] == [
+        (0, 4),
+        (3, 7),
+        (6, 10),
+    ]
+    assert windows[1].slice(text) == "w3 w4 w5 w6"
+    assert windows[-1].end == len(text)
+
+
+def test_plan_windows_does_not_split_words():
+    text = "abcdef"
+    offsets = [(0, 2), (2, 4), (4, 6)]
+    # First two tokens belong to the same word.
+    word_ids = [0, 0, 1]
+
+    windows = plan_windows(text, offsets, word_ids, max_tokens=2, overlap_tokens=0)
+
+    assert [(w.token_start, w.token_end) for w in windows] == [(0, 2), (2, 3)]
+
+
+def test_merge_window_entities_deduplicates_overlap():
+    windows = [TextWindow(0, 20, 0, 4), TextWindow(10, 30, 2, 6)]
+    window_entities = [
+        [
+            {"word": "a", "start": 2, "end": 3},
+            # Seen by both windows, owned by the first one.
+            {"word": "b", "start": 12, "end": 14},
+            # Cut at the edge of the first window.
+            {"word": "c", "start": 18, "end": 20},
+        ],
+        [
+            {"word": "b", "start": 2, "end": 4},
+            {"word": "c", "start": 8, "end": 12},
+        ],
+    ]
+
+    merged = merge_window_entities(windows, window_entities)
+
+    assert merged == [
+        {"word": "a", "start": 2, "end": 3},
+        {"word": "b", "start": 12, "end": 14},
+        {"word": "c", "start": 18, "end": 22},
+    ]
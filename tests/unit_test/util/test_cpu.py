@@ -0,0 +1,49 @@
+from unittest.mock import mock_open, patch
+
+from app.util.cpu import _parse_cpu_list, available_cpus, plan_worker, worker_cpus
+
+
+def test_parse_cpu_list():
+    assert _parse_cpu_list("0-3,8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+    assert _parse_cpu_list("") == []
+
+
+def test_available_cpus_are_ordered_by_node():
+    # Node 0 holds the even CPUs and node 1 the odd ones, CPU 5 is not allowed.
+    cpulists = {
+        "/sys/devices/system/node/node0/cpulist": "0,2,4,6",
+        "/sys/devices/system/node/node1/cpulist": "1,3,5,7",
+    }
+    with patch("app.util.cpu.os.sched_getaffinity", return_value={0, 1, 2, 3, 4, 6, 7}):
+        with patch("app.util.cpu.glob.glob", return_value=list(cpulists)[::-1]):
+            with patch(
+                "builtins.open",
+                side_effect=lambda path: mock_open(read_data=cpulists[path])(),
+            ):
+                assert available_cpus() == [0, 2, 4, 6, 1, 3, 7]
+
+
+def test_worker_cpus_split_evenly():
+    cpus = list(range(10))
+
+    shares = [worker_cpus(slot, 4, cpus) for slot in range(4)]
+
+    assert shares == [[0, 1, 2], [3, 4, 5], [6, 7], [8, 9]]
+    # With more workers than CPUs, every worker gets one CPU and they take turns.
+    assert [worker_cpus(slot, 4, [0, 1])[0] for slot in range(4)] == [0, 1, 0, 1]
+
+
+def test_plan_worker_divides_threads_among_workers():
+    cpus = list(range(8))
+
+    assert plan_worker(1, 2, cpus, threads=None, affinity=False) == {
+        "cpus": None,
+        "threads": 4,
+    }
+    assert plan_worker(1, 2, cpus, threads=None, affinity=True) == {
+        "cpus": [4, 5, 6, 7],
+        "threads": 4,
+    }
+    # Oversubscribed workers still get one thread each, unless told otherwise.
+    assert plan_worker(3, 16, cpus, threads=None, affinity=False)["threads"] == 1
+    assert plan_worker(0, 2, cpus, threads=2, affinity=False)["threads"] == 2
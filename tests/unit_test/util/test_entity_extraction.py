@@ -2,34 +2,13 @@ from unittest.mock import patch
 
 import pytest
 
-from app.util.text_context import extract_entities, get_context
-
-
-def test_get_context():
-    text = "This is a sample text with an entity in the middle."
-    start, end = 27, 33  # "entity"
-
-    context = get_context(text, start, end, window=10)
-
-    assert context == "text with an entity in the"
-
-
-def test_get_context_at_start():
-    text = "Entity at the start."
-    start, end = 0, 6  # "Entity"
-
-    context = get_context(text, start, end, window=10)
-
-    assert context == "Entity at the st"
-
-
-def test_get_context_at_end():
-    text = "Text ends with entity"
-    start, end = 15, 21  # "entity"
-
-    context = get_context(text, start, end, window=10)
-
-    assert context == "ends with entity"  # Corrected assertion
+from app.util.cache import ExtractionCache
+from app.util.text_context import (
+    extract_entities,
+    extract_entities_batch,
+    iter_page_entities,
+    predict_revised_entities,
+)
 
 
 def test_extract_entities_non_medical():
@@ -40,10 +19,10 @@ def test_extract_entities_non_medical():
     assert entities == []
 
 
-@patch("app.util.text_context.extract_entities_cached")
-def test_extract_entities_medical(mock_extract_entities_cached):
+@patch("app.util.text_context.predict_entities")
+def test_extract_entities_medical(mock_predict_entities):
     text = "John Doe has Covid-19 and is coughing."
-    mock_extract_entities_cached.return_value = [
+    mock_predict_entities.return_value = [
         {"word": "Covid-19", "start": 0, "end": 8, "entity_group": "Disease_disorder", "score": 100},
         {"word": "Google", "start": 34, "end": 40, "entity_group": "other", "score": 100},
     ]
@@ -62,8 +41,113 @@ def test_extract_entities_medical(mock_extract_entities_cached):
 
 def test_extract_entities_fails():
     with patch(
-        "app.util.text_context.extract_entities_cached",
+        "app.util.text_context.predict_entities",
         side_effect=Exception("Mock Error"),
     ):
         with pytest.raises(ValueError, match="Entity extraction failed."):
             extract_entities("Some text here.")
+
+
+@patch("app.util.text_context.predict_entities_batch")
+def test_extract_entities_batch(mock_predict_entities_batch):
+    texts = ["Covid-19 is here.", "Nothing relevant."]
+    mock_predict_entities_batch.return_value = [
+        [{"word": "Covid-19", "start": 0, "end": 8, "entity_group": "Disease_disorder", "score": 0.9}],
+        [{"word": "Nothing", "start": 0, "end": 7, "entity_group": "Disease_disorder", "score": 0.1}],
+    ]
+
+    entities = extract_entities_batch(texts)
+
+    mock_predict_entities_batch.assert_called_once_with(texts, None)
+    assert entities == [
+        [{"context": "Covid-19 is here.", "end": 8, "entity": "Covid-19", "start": 0}],
+        [],
+    ]
+
+
+@patch("app.util.text_context.predict_entities")
+def test_extract_entities_aggregated(mock_predict_entities):
+    text = "Fever at night. Then fever and Covid-19. More FEVER.\nCovid-19 later."
+    mock_predict_entities.return_value = [
+        {"word": "Fever", "start": 0, "end": 5, "entity_group": "Sign_symptom", "score": 0.9},
+        {"word": "fever", "start": 21, "end": 26, "entity_group": "Sign_symptom", "score": 0.9},
+        {"word": "Covid-19", "start": 31, "end": 39, "entity_group": "Disease_disorder", "score": 0.9},
+        {"word": "FEVER", "start": 46, "end": 51, "entity_group": "Sign_symptom", "score": 0.9},
+        {"word": "Covid-19", "start": 53, "end": 61, "entity_group": "Disease_disorder", "score": 0.9},
+    ]
+
+    with patch("app.util.text_context.aggregate_max_contexts", 2):
+        entities = extract_entities(text, page_starts=[0, 53], aggregate=True)
+
+    assert entities == [
+        {
+            "entity": "Fever",
+            "label": "Sign_symptom",
+            "count": 3,
+            "offsets": [[0, 5], [21, 26], [46, 51]],
+            "contexts": ["Fever at night.", "Then fever and Covid-19."],
+            "pages": [1],
+        },
+        {
+            "entity": "Covid-19",
+            "label": "Disease_disorder",
+            "count": 2,
+            "offsets": [[31, 39], [53, 61]],
+            "contexts": ["Then fever and Covid-19.", "Covid-19 later."],
+            "pages": [1, 2],
+        },
+    ]
+
+
+@patch("app.util.text_context.predict_entities")
+def test_iter_page_entities(mock_predict_entities):
+    pages = [(1, "Patient has fever.\n", 0), (2, "", 19), (3, "Covid-19 found.\n", 19)]
+    mock_predict_entities.side_effect = [
+        [{"word": "fever", "start": 12, "end": 17, "entity_group": "Sign_symptom", "score": 0.9}],
+        [{"word": "Covid-19", "start": 0, "end": 8, "entity_group": "Disease_disorder", "score": 0.9}],
+    ]
+
+    entities = list(iter_page_entities(pages))
+
+    # Empty pages are skipped by the model but still yield.
+    assert mock_predict_entities.call_count == 2
+    assert entities == [
+        [{"context": "Patient has fever.", "end": 17, "entity": "fever", "start": 12, "page": 1}],
+        [],
+        [{"context": "Covid-19 found.", "end": 27, "entity": "Covid-19", "start": 19, "page": 3}],
+    ]
+
+
+def disease(word, start):
+    return {"word": word, "start": start, "end": start + len(word), "entity_group": "Disease_disorder", "score": 0.9}
+
+
+@patch("app.util.text_context.chunk_overlap_tokens", 1)
+@patch("app.util.text_context.page_cache", ExtractionCache(max_bytes=1024 * 1024))
+@patch("app.util.text_context.predict_entities_batch")
+def test_predict_revised_entities(mock_predict_entities_batch):
+    first = "Fever today.\nCovid-19 here.\nCough now.\n"
+    mock_predict_entities_batch.return_value = [[disease("Fever", 0), disease("Covid-19", 13), disease("Cough", 28)]]
+
+    assert predict_revised_entities([first], [[0, 13, 28]], [["a", "b", "c"]]) == [
+        [disease("Fever", 0), disease("Covid-19", 13), disease("Cough", 28)]
+    ]
+    mock_predict_entities_batch.assert_called_once_with([first], None)
+
+    # Only the second page changed, it runs with one word of each neighbour.
+    revised = "Fever today.\nCovid-19 and flu.\nCough now.\n"
+    mock_predict_entities_batch.reset_mock()
+    mock_predict_entities_batch.return_value = [[disease("Covid-19", 7), disease("flu", 20), disease("Cough", 25)]]
+
+    assert predict_revised_entities([revised], [[0, 13, 31]], [["a", "d", "c"]]) == [
+        [disease("Fever", 0), disease("Covid-19", 13), disease("flu", 26), disease("Cough", 31)]
+    ]
+    mock_predict_entities_batch.assert_called_once_with(["today.\nCovid-19 and flu.\nCough"], None)
+
+    # Nothing changed, so the model is not needed.
+    mock_predict_entities_batch.reset_mock()
+
+    assert predict_revised_entities([revised], [[0, 13, 31]], [["a", "d", "c"]]) == [
+        [disease("Fever", 0), disease("Covid-19", 13), disease("flu", 26), disease("Cough", 31)]
+    ]
+    mock_predict_entities_batch.assert_not_called()
@@ -0,0 +1,78 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.util.executor import (
+    ClientDisconnectedError,
+    StageTimeoutError,
+    iterate_in_executor,
+    run_stage,
+)
+
+
+class FakeRequest:
+    def __init__(self, disconnected=False):
+        self.disconnected = disconnected
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+def test_run_stage_returns_result():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        result = asyncio.run(
+            run_stage(FakeRequest(), "test", executor, 5, lambda x: x * 2, 21)
+        )
+
+    assert result == 42
+
+
+def test_run_stage_inline():
+    result = asyncio.run(run_stage(FakeRequest(), "test", None, 5, len, "text"))
+
+    assert result == 4
+
+
+def test_run_stage_timeout():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with pytest.raises(StageTimeoutError):
+            asyncio.run(
+                run_stage(FakeRequest(), "test", executor, 0.05, time.sleep, 0.5)
+            )
+
+
+def test_run_stage_client_disconnected():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with pytest.raises(ClientDisconnectedError):
+            asyncio.run(
+                run_stage(FakeRequest(True), "test", executor, 5, time.sleep, 0.5)
+            )
+
+
+def test_iterate_in_executor():
+    async def collect(iterator):
+        return [item async for item in iterate_in_executor(executor, iterator)]
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert asyncio.run(collect(iter([1, 2, 3]))) == [1, 2, 3]
+
+
+def test_iterate_in_executor_closes_iterator():
+    closed = []
+
+    def numbers():
+        try:
+            yield from range(10)
+        finally:
+            closed.append(True)
+
+    async def take_first(iterator):
+        async for item in iterate_in_executor(executor, iterator):
+            return item
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert asyncio.run(take_first(numbers())) == 0
+
+    assert closed == [True]
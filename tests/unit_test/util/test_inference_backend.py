@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from app.util.inference_backend import (
+    ONNX_FILE_NAME,
+    _publish,
+    export_onnx_model,
+    load_token_classification_model,
+)
+
+
+def test_load_unknown_backend():
+    with pytest.raises(ValueError, match="Unknown inference backend 'tensorrt'"):
+        load_token_classification_model("models/any", "tensorrt")
+
+
+class FakeExport:
+    exports = 0
+
+    @classmethod
+    def from_pretrained(cls, model_path, export=False):
+        cls.exports += 1
+        return cls()
+
+    def save_pretrained(self, directory):
+        with open(os.path.join(directory, ONNX_FILE_NAME), "w") as file:
+            file.write("graph")
+
+
+def test_export_onnx_model_publishes_complete_exports(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        "app.util.inference_backend._import_onnxruntime",
+        lambda: (FakeExport, None, None),
+    )
+    # A partial export left in place by an interrupted run.
+    (tmp_path / "onnx").mkdir()
+    (tmp_path / "onnx" / "config.json").write_text("{}")
+
+    onnx_dir = export_onnx_model(str(tmp_path))
+    export_onnx_model(str(tmp_path))
+
+    assert FakeExport.exports == 1
+    assert sorted(os.listdir(onnx_dir)) == [ONNX_FILE_NAME]
+    # No build directories are left next to the export.
+    assert sorted(os.listdir(tmp_path)) == ["onnx"]
+
+
+def test_publish_keeps_the_export_of_a_faster_worker(tmp_path):
+    target_dir = tmp_path / "onnx"
+
+    def build(build_dir):
+        # Another worker publishes its export while this one is still building.
+        target_dir.mkdir()
+        (target_dir / ONNX_FILE_NAME).write_text("first")
+        (tmp_path / os.path.basename(build_dir) / ONNX_FILE_NAME).write_text("second")
+
+    _publish(str(target_dir), ONNX_FILE_NAME, build)
+
+    assert (target_dir / ONNX_FILE_NAME).read_text() == "first"
+    assert sorted(os.listdir(tmp_path)) == ["onnx"]
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from app.util.jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobRunner, JobStore
+
+ENTITIES = [
+    {"entity": "fatigue", "context": "persistent fatigue", "start": 0, "end": 7}
+]
+
+
+def spooled(tmp_path, content=b"%PDF"):
+    path = tmp_path / "upload.pdf"
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_job_runs_to_completion(tmp_path):
+    store = JobStore(str(tmp_path))
+    runner = JobRunner(store, lambda path: ENTITIES)
+
+    job_id = store.submit("paper.pdf", spooled(tmp_path))
+    # The spooled upload is moved into the store.
+    assert not os.path.exists(tmp_path / "upload.pdf")
+    assert store.get(job_id)["status"] == QUEUED
+    assert store.queue_depth() == 1
+
+    assert runner.run_once()
+    job = store.get(job_id)
+    assert job["status"] == SUCCEEDED
+    assert job["entities"] == ENTITIES
+    assert job["attempts"] == 1
+    # The payload is removed once the job is finished.
+    assert not os.path.exists(store.payload_path(job_id))
+    assert not runner.run_once()
+
+
+def test_job_failure_is_reported(tmp_path):
+    def process(path):
+        raise ValueError("Failed to parse PDF file.")
+
+    store = JobStore(str(tmp_path))
+    job_id = store.submit("paper.pdf", spooled(tmp_path, b"not a pdf"))
+
+    JobRunner(store, process).run_once()
+
+    job = store.get(job_id)
+    assert job["status"] == FAILED
+    assert job["error"] == "Failed to parse PDF file."
+    assert "entities" not in job
+
+
+def test_job_of_crashed_worker_is_retried(tmp_path):
+    store = JobStore(str(tmp_path), max_attempts=2, lease_seconds=0)
+    job_id = store.submit("paper.pdf", spooled(tmp_path))
+
+    # A worker claims the job and dies without renewing its lease.
+    assert store.claim() == job_id
+    assert store.get(job_id)["status"] == RUNNING
+    assert store.claim() == job_id
+    assert store.get(job_id)["attempts"] == 2
+
+    # The job is given up after the last attempt.
+    assert store.claim() is None
+    job = store.get(job_id)
+    assert job["status"] == FAILED
+    assert job["error"] == "Worker stopped processing job."
+
+
+def test_jobs_are_shared_between_stores(tmp_path):
+    submitter = JobStore(str(tmp_path))
+    worker = JobStore(str(tmp_path))
+
+    job_id = submitter.submit("paper.pdf", spooled(tmp_path))
+    worker.complete(worker.claim(), ENTITIES)
+
+    assert submitter.get(job_id)["entities"] == ENTITIES
+
+
+@pytest.mark.parametrize("ttl, expected", [(0, 1), (60, 0)])
+def test_finished_jobs_expire(tmp_path, ttl, expected):
+    store = JobStore(str(tmp_path), result_ttl_seconds=ttl)
+    job_id = store.submit("paper.pdf", spooled(tmp_path))
+    store.complete(store.claim(), ENTITIES)
+
+    assert store.purge_expired() == expected
+    assert (store.get(job_id) is None) == bool(expected)
@@ -0,0 +1,102 @@
+import logging
+import threading
+
+from app.util.log import (
+    BackgroundHandler,
+    RequestIdFilter,
+    SamplingFilter,
+    _background_handlers,
+    _reset_background_handlers,
+    request_id_ctx,
+)
+from app.util.metrics import LOG_RECORDS_DROPPED
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self, unblock=None):
+        super().__init__()
+        self.records = []
+        self.threads = []
+        self.unblock = unblock
+
+    def emit(self, record):
+        if self.unblock is not None:
+            self.unblock.wait()
+        self.records.append(record)
+        self.threads.append(threading.current_thread().name)
+
+
+def make_logger(name, handler, *filters):
+    test_logger = logging.getLogger(name)
+    test_logger.propagate = False
+    test_logger.setLevel(logging.INFO)
+    test_logger.handlers = [handler]
+    test_logger.filters = list(filters)
+    return test_logger
+
+
+def test_background_handler_writes_in_another_thread():
+    recording = RecordingHandler()
+    handler = BackgroundHandler(recording, 100)
+    test_logger = make_logger("test-background", handler, RequestIdFilter())
+
+    token = request_id_ctx.set("request-1")
+    try:
+        test_logger.info("Processing %s", "paper.pdf")
+    finally:
+        request_id_ctx.reset(token)
+    handler.close()
+
+    (record,) = recording.records
+    assert record.getMessage() == "Processing paper.pdf"
+    # The id is taken in the thread that logged, not in the one that writes.
+    assert record.request_id == "request-1"
+    assert recording.threads != [threading.current_thread().name]
+
+
+def test_background_handler_drops_records_when_full():
+    release = threading.Event()
+    recording = RecordingHandler(release)
+    handler = BackgroundHandler(recording, 1)
+    test_logger = make_logger("test-full", handler)
+    dropped = LOG_RECORDS_DROPPED.labels("queue_full")
+    before = dropped._value.get()
+
+    # The queue holds one record, and one more if the blocked writer has taken it.
+    for index in range(5):
+        test_logger.info("record %d", index)
+    release.set()
+    handler.close()
+
+    assert 1 <= len(recording.records) <= 2
+    assert dropped._value.get() - before == 5 - len(recording.records)
+
+
+def test_background_handlers_are_reset_after_fork_until_closed():
+    handlers = [BackgroundHandler(RecordingHandler(), 10) for _ in range(3)]
+    handlers[1].close()
+    handlers[2].close()
+
+    # Replaced handlers are forgotten rather than reset on every later fork.
+    assert handlers[0] in _background_handlers
+    assert not {handlers[1], handlers[2]} & set(_background_handlers)
+    queue_before = handlers[0].queue
+    _reset_background_handlers()
+    assert handlers[0].queue is not queue_before
+
+    handlers[0].close()
+    assert handlers[0] not in _background_handlers
+
+
+def test_sampling_filter():
+    recording = RecordingHandler()
+    test_logger = make_logger(
+        "test-sampling", recording, SamplingFilter({"INFO": 0.0, "WARNING": 1.0})
+    )
+
+    for _ in range(10):
+        test_logger.info("sampled")
+    test_logger.warning("kept")
+    test_logger.error("kept")
+
+    assert [record.getMessage() for record in recording.records] == ["kept", "kept"]
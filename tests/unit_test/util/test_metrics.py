@@ -0,0 +1,61 @@
+from prometheus_client import REGISTRY
+
+from app.util.metrics import observe_stage, render_metrics
+from app.util.text_context import build_entities
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_observe_stage():
+    before = sample("extraction_stage_duration_seconds_count", stage="test")
+
+    with observe_stage("test"):
+        pass
+
+    assert sample("extraction_stage_duration_seconds_count", stage="test") == before + 1
+
+
+def test_build_entities_counts_kept_and_dropped():
+    kept = sample("extraction_entities_kept_total")
+    by_label = sample("extraction_entities_dropped_total", reason="label")
+    by_score = sample("extraction_entities_dropped_total", reason="score")
+
+    build_entities(
+        "Covid-19 at Google.",
+        [
+            {
+                "word": "Covid-19",
+                "start": 0,
+                "end": 8,
+                "entity_group": "Disease_disorder",
+                "score": 0.9,
+            },
+            {
+                "word": "Covid",
+                "start": 0,
+                "end": 5,
+                "entity_group": "Disease_disorder",
+                "score": 0.1,
+            },
+            {
+                "word": "Google",
+                "start": 12,
+                "end": 18,
+                "entity_group": "other",
+                "score": 0.9,
+            },
+        ],
+    )
+
+    assert sample("extraction_entities_kept_total") == kept + 1
+    assert sample("extraction_entities_dropped_total", reason="label") == by_label + 1
+    assert sample("extraction_entities_dropped_total", reason="score") == by_score + 1
+
+
+def test_render_metrics():
+    body, content_type = render_metrics()
+
+    assert content_type.startswith("text/plain")
+    assert b"extraction_stage_duration_seconds" in body
@@ -0,0 +1,51 @@
+import pytest
+
+from app.util import text_context
+from app.util.model_registry import ModelRegistry
+
+
+class FakeModel:
+    max_tokens = 4
+    batch_size = 2
+
+    def __init__(self):
+        self.batches = []
+
+    def extract_entities_batch(self, texts, infer=None):
+        self.batches.append(texts)
+        return [[] for _ in texts]
+
+
+@pytest.fixture(autouse=True)
+def restore_model(monkeypatch):
+    default = text_context.huggingface_model
+    monkeypatch.setattr(
+        text_context,
+        "model_registry",
+        ModelRegistry([default], text_context._load_model, pinned=[default]),
+    )
+    monkeypatch.setattr(text_context, "_model_state", text_context.NOT_LOADED)
+
+
+def test_warm_up_runs_full_batches_of_every_length():
+    model = FakeModel()
+    text_context.set_pdf_model(model)
+    assert text_context.get_model_state() == text_context.LOADED
+
+    text_context.warm_up_model([2, 16])
+
+    # Lengths are capped at the window size of the model.
+    assert model.batches == [["patient patient"] * 2, ["patient " * 3 + "patient"] * 2]
+    assert text_context.get_model_state() == text_context.READY
+    assert text_context.get_pdf_model() is model
+
+
+def test_prepare_model_records_failure(monkeypatch):
+    def fail():
+        raise OSError("No weights")
+
+    monkeypatch.setattr(text_context, "get_pdf_model", fail)
+
+    text_context.prepare_model([32])
+
+    assert text_context.get_model_state() == text_context.FAILED
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from app.util.model_registry import ModelRegistry, UnknownModelError
+
+
+class Loader:
+    def __init__(self, delay=0.0):
+        self.loads = []
+        self.delay = delay
+
+    def __call__(self, name):
+        time.sleep(self.delay)
+        self.loads.append(name)
+        return f"model {name}"
+
+
+def test_registry_loads_on_demand_and_evicts_least_recently_used():
+    loader = Loader()
+    registry = ModelRegistry(["a", "b", "c"], loader, max_resident=2, pinned=["a"])
+
+    assert registry.get("b") == "model b"
+    assert registry.get() == "model a"
+    assert registry.get("b") == "model b"
+    registry.get("c")
+
+    # a is pinned, so the least recently used model that may go is b.
+    assert loader.loads == ["b", "a", "c"]
+    stats = registry.stats()
+    assert stats["resident"] == ["a", "c"]
+    assert stats["evictions"] == 1
+
+    with pytest.raises(UnknownModelError):
+        registry.get("d")
+
+
+def test_registry_keeps_models_in_use():
+    registry = ModelRegistry(["a", "b"], Loader(), max_resident=1)
+
+    with registry.lease("a"):
+        with registry.lease("b"):
+            # Both are held, so the limit is exceeded until one is released.
+            assert registry.stats()["resident"] == ["a", "b"]
+            assert registry.stats()["in_use"] == {"a": 1, "b": 1}
+        # a is still held, so the released b goes although it was used last.
+        assert registry.stats()["resident"] == ["a"]
+
+    assert registry.stats()["resident"] == ["a"]
+    assert registry.stats()["in_use"] == {}
+
+
+def test_registry_respects_memory_budget():
+    sizes = {"a": 60, "b": 50, "c": 30}
+    registry = ModelRegistry(
+        ["a", "b", "c"],
+        Loader(),
+        max_resident=3,
+        max_bytes=100,
+        estimate_bytes=sizes.get,
+    )
+
+    registry.get("a")
+    registry.get("c")
+    registry.get("b")
+
+    assert registry.stats()["resident"] == ["c", "b"]
+    assert registry.stats()["bytes"] == 80
+
+
+def test_registry_loads_once_for_concurrent_callers():
+    loader = Loader(delay=0.1)
+    registry = ModelRegistry(["a"], loader)
+    results = []
+
+    threads = [
+        threading.Thread(target=lambda: results.append(registry.get("a")))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loader.loads == ["a"]
+    assert results == ["model a"] * 4
+
+
+def test_registry_releases_failed_loads():
+    def fail(name):
+        raise OSError("No weights")
+
+    registry = ModelRegistry(["a"], fail)
+
+    with pytest.raises(OSError):
+        registry.get("a")
+
+    assert registry.stats()["resident"] == []
+    assert registry.stats()["in_use"] == {}
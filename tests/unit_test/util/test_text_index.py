@@ -0,0 +1,66 @@
+import numpy as np
+
+from app.util.text_index import FIXED, SENTENCE, WORD, TextIndex
+
+TEXT = (
+    "Patients were enrolled in 2020. Most reported severe fatigue after exercise. "
+    "Endothelial biomarkers were measured."
+)
+START = TEXT.index("fatigue")
+END = START + len("fatigue")
+
+
+def context(mode, chars, text=TEXT, start=START, end=END):
+    lower, upper = TextIndex(text).context_bounds(
+        np.array([start]), np.array([end]), mode, chars
+    )
+    snippet_start, snippet_end = int(lower[0]), int(upper[0])
+    return text[snippet_start:snippet_end]
+
+
+def test_fixed_context_cuts_at_characters():
+    assert context(FIXED, 10) == "ed severe fatigue after exe"
+
+
+def test_fixed_context_at_text_ends():
+    assert context(FIXED, 10, "Entity at the start.", 0, 6) == "Entity at the st"
+    assert context(FIXED, 10, "Text ends with entity", 15, 21) == "ends with entity"
+
+
+def test_word_context_keeps_whole_words():
+    assert context(WORD, 10) == "severe fatigue after"
+
+
+def test_sentence_context_stops_at_sentence_ends():
+    assert context(SENTENCE, 10) == "severe fatigue after"
+    assert context(SENTENCE, 100) == "Most reported severe fatigue after exercise."
+
+
+def test_context_always_holds_the_entity():
+    assert context(WORD, 2) == "fatigue"
+    assert context(SENTENCE, 0, "fatigue", 0, 7) == "fatigue"
+
+
+def test_pages():
+    index = TextIndex("first page\nsecond page\nthird", [0, 11, 23])
+
+    assert index.pages(np.array([0, 10, 11, 24])).tolist() == [1, 1, 2, 3]
+
+
+def test_lookups_cover_many_entities():
+    text = "A b c. " * 1000
+    starts = np.arange(0, len(text), 7)
+
+    lower, upper = TextIndex(text).context_bounds(starts, starts + 1, SENTENCE, 32)
+
+    assert (lower == starts).all()
+    assert (upper == starts + 6).all()
+
+
+def test_sentences_do_not_end_at_abbreviations():
+    text = "As shown by Haffke et al. fatigue persists. Next sentence."
+    start = text.index("fatigue")
+
+    assert context(SENTENCE, 100, text, start, start + 7) == (
+        "As shown by Haffke et al. fatigue persists."
+    )
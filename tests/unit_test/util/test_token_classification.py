@@ -0,0 +1,126 @@
+import pytest
+from transformers import AutoTokenizer, TokenClassificationPipeline, pipeline
+
+from app.util.text_context import get_pdf_model
+from app.util.token_classification import EntityPipeline, LabelTable
+
+TEXT = (
+    "The patient presented with fever, fatigue and chest pain. Hypertension was "
+    "treated with lisinopril and echocardiography showed endothelial dysfunction."
+)
+
+
+def test_label_table():
+    table = LabelTable(
+        {0: "O", 1: "B-Medication", 2: "I-Medication", 3: "B-Date", 4: "Other"},
+        keep_labels={"Medication"},
+        min_score=0.5,
+    )
+
+    assert table.groups == ["O", "Medication", "Medication", "Date", "Other"]
+    assert table.tag_ids[1] == table.tag_ids[2] != table.tag_ids[3]
+    assert table.begins.tolist() == [False, True, False, True, False]
+    assert table.kept.tolist() == [False, True, True, False, False]
+    assert table.ignored.tolist() == [True, False, False, False, False]
+
+
+def build_pipeline(
+    pipeline_class, aggregation_strategy="simple", tokenizer=None, **kwargs
+):
+    loaded = get_pdf_model().pipe
+    return pipeline(
+        "ner",
+        model=loaded.model,
+        tokenizer=tokenizer or loaded.tokenizer,
+        aggregation_strategy=aggregation_strategy,
+        pipeline_class=pipeline_class,
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize("aggregation_strategy", ["simple", "average"])
+@pytest.mark.parametrize("strided", [False, True], ids=["whole", "strided"])
+def test_entity_pipeline_matches_stock_aggregation(aggregation_strategy, strided):
+    text, kwargs = TEXT, {}
+    if strided:
+        # Longer than the tokenizer takes, so the pipeline splits it into several
+        # overlapping outputs.
+        text = " ".join([TEXT] * 4)
+        kwargs = {
+            "stride": 16,
+            "tokenizer": AutoTokenizer.from_pretrained(
+                get_pdf_model().pipe.tokenizer.name_or_path, model_max_length=64
+            ),
+        }
+    expected = build_pipeline(
+        TokenClassificationPipeline, aggregation_strategy, **kwargs
+    )(text)
+
+    entities = build_pipeline(EntityPipeline, aggregation_strategy, **kwargs)(text)
+
+    assert [
+        (entity["entity_group"], entity["word"], entity["start"], entity["end"])
+        for entity in entities
+    ] == [
+        (entity["entity_group"], entity["word"], entity["start"], entity["end"])
+        for entity in expected
+    ]
+    for entity, reference in zip(entities, expected):
+        assert abs(entity["score"] - float(reference["score"])) < 1e-5
+
+
+def test_entity_pipeline_filters_labels_and_scores():
+    expected = [
+        entity
+        for entity in build_pipeline(TokenClassificationPipeline)(TEXT)
+        if entity["entity_group"] in {"Sign_symptom", "Medication"}
+        and entity["score"] >= 0.3
+    ]
+
+    entities = build_pipeline(
+        EntityPipeline, keep_labels={"Sign_symptom", "Medication"}, min_score=0.3
+    )(TEXT)
+
+    assert [(entity["start"], entity["end"]) for entity in entities] == [
+        (entity["start"], entity["end"]) for entity in expected
+    ]
+
+
+@pytest.mark.parametrize("aggregation_strategy", ["simple", "average"])
+def test_entity_pipeline_ignores_labels(aggregation_strategy):
+    ignore_labels = ["O", "Sign_symptom"]
+    expected = build_pipeline(TokenClassificationPipeline, aggregation_strategy)(
+        TEXT, ignore_labels=ignore_labels
+    )
+
+    entities = build_pipeline(EntityPipeline, aggregation_strategy)(
+        TEXT, ignore_labels=ignore_labels
+    )
+
+    assert "Sign_symptom" not in {entity["entity_group"] for entity in entities}
+    assert [(entity["start"], entity["end"]) for entity in entities] == [
+        (entity["start"], entity["end"]) for entity in expected
+    ]
+
+
+def test_infer_with_token_budget_keeps_order(monkeypatch):
+    model = get_pdf_model()
+    texts = [TEXT, "Fever.", TEXT[:60], "Chest pain and fatigue."]
+    expected = [model.pipe(text) for text in texts]
+
+    monkeypatch.setattr(model, "batch_tokens", 64)
+    results = model.infer(texts)
+
+    assert [
+        [
+            (entity["entity_group"], entity["start"], entity["end"])
+            for entity in entities
+        ]
+        for entities in results
+    ] == [
+        [
+            (entity["entity_group"], entity["start"], entity["end"])
+            for entity in entities
+        ]
+        for entities in expected
+    ]
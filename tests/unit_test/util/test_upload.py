@@ -0,0 +1,35 @@
+import hashlib
+import io
+
+import pytest
+
+from app.util.upload import UploadTooLargeError, spool_upload
+
+
+def test_spool_upload(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.util.upload.CHUNK_BYTES", 4)
+    content = b"%PDF-1.7 not much of a document"
+    file = io.BytesIO(content)
+    file.read()
+
+    upload = spool_upload(
+        file, max_bytes=len(content), directory=str(tmp_path / "spool")
+    )
+
+    with open(upload.path, "rb") as spooled:
+        assert spooled.read() == content
+    assert upload.size == len(content)
+    assert upload.digest == hashlib.sha256(content).hexdigest()
+    upload.close()
+    upload.close()
+    assert list((tmp_path / "spool").iterdir()) == []
+
+
+def test_spool_upload_too_large(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.util.upload.CHUNK_BYTES", 4)
+
+    with pytest.raises(UploadTooLargeError, match="File too large."):
+        spool_upload(io.BytesIO(b"x" * 10), max_bytes=9, directory=str(tmp_path))
+
+    # The partial copy is removed.
+    assert list(tmp_path.iterdir()) == []
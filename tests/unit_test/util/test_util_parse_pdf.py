@@ -1,10 +1,13 @@
 import io
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, patch
 
 import pypdf
 import pytest
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
 
-from app.util.pdf import parse_pdf
+from app.util.pdf import count_pages, iter_pages, parse_pdf
+from app.util.text_context import parse_document
 
 
 def test_parse_pdf_valid():
@@ -52,3 +55,86 @@ def test_parse_pdf_invalid():
 
     with pytest.raises(ValueError, match="Failed to parse PDF file."):
         parse_pdf(invalid_bytes)
+
+
+def make_text_pdf(page_texts):
+    # Builds a PDF with one line of Helvetica text per page, empty strings give blank pages.
+    pdf_writer = pypdf.PdfWriter()
+    font = pdf_writer._add_object(
+        DictionaryObject(
+            {
+                NameObject("/Type"): NameObject("/Font"),
+                NameObject("/Subtype"): NameObject("/Type1"),
+                NameObject("/BaseFont"): NameObject("/Helvetica"),
+            }
+        )
+    )
+    for page_text in page_texts:
+        page = pdf_writer.add_blank_page(width=400, height=200)
+        page[NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})}
+        )
+        if page_text:
+            content = DecodedStreamObject()
+            content.set_data(f"BT /F1 12 Tf 20 100 Td ({page_text}) Tj ET".encode())
+            page[NameObject("/Contents")] = pdf_writer._add_object(content)
+
+    with io.BytesIO() as pdf_buffer:
+        pdf_writer.write(pdf_buffer)
+        return pdf_buffer.getvalue()
+
+
+def test_iter_pages_offsets():
+    pdf_bytes = make_text_pdf(["Page one", "", "Page three"])
+
+    pages = list(iter_pages(pdf_bytes))
+
+    assert pages == [
+        (1, "Page one\n", 0),
+        (2, "", 9),
+        (3, "Page three\n", 9),
+    ]
+    assert "".join(text for _, text, _ in pages) == parse_pdf(pdf_bytes)
+
+
+def test_parse_pdf_parallel_matches_sequential():
+    pdf_bytes = make_text_pdf([f"Page {number}" for number in range(1, 12)])
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        pages = list(iter_pages(pdf_bytes, executor, pages_per_task=2))
+        text = parse_pdf(pdf_bytes, executor)
+
+    assert text == parse_pdf(pdf_bytes)
+    assert [page_number for page_number, _, _ in pages] == list(range(1, 12))
+    assert text.startswith("Page 1\nPage 2\n")
+
+
+def test_parse_pdf_from_file(tmp_path):
+    pdf_bytes = make_text_pdf([f"Page {number}" for number in range(1, 6)])
+    path = tmp_path / "paper.pdf"
+    path.write_bytes(pdf_bytes)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        text = parse_pdf(str(path), executor)
+
+    assert parse_pdf(str(path)) == text == parse_pdf(pdf_bytes)
+    assert count_pages(str(path)) == 5
+
+
+def test_iter_pages_invalid():
+    with pytest.raises(ValueError, match="Failed to parse PDF file."):
+        list(iter_pages(b"Not a real PDF file"))
+
+
+def test_parse_document_fingerprints_only_when_incremental(monkeypatch):
+    pdf_bytes = make_text_pdf(["Page one", "Page two"])
+
+    with patch("app.util.pdf.page_fingerprint") as page_fingerprint:
+        assert parse_document(pdf_bytes) == ("Page one\nPage two\n", [0, 9], None)
+        page_fingerprint.assert_not_called()
+
+    monkeypatch.setattr("app.util.text_context.incremental_extraction", True)
+    text, page_starts, fingerprints = parse_document(pdf_bytes)
+
+    assert (text, page_starts) == ("Page one\nPage two\n", [0, 9])
+    assert len(fingerprints) == 2 and fingerprints[0] != fingerprints[1]